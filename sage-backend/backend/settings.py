@@ -184,4 +184,69 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 
 CRONJOBS = [
     ('*/5 * * * *', 'homologation.cron.SendHomologationReportCronJob')
-]
\ No newline at end of file
+]
+
+# django_cron jobs, run by `python manage.py runcrons` every minute (the cron service in docker-compose.yml)
+CRON_CLASSES = [
+    'catalog.cron.RefreshProductSummariesCronJob',
+    'catalog.cron.MaintainProductPartitionsCronJob',
+    'homologation.cron.TrainProductMatcherCronJob',
+]
+
+# Dynamic product tables
+# Rows converted and inserted per round trip when loading uploaded spreadsheets
+DYNAMIC_TABLE_LOAD_CHUNK_SIZE = int(os.getenv('DYNAMIC_TABLE_LOAD_CHUNK_SIZE', 5000))
+# Rows per page of the row API (product/<id>/rows/), default and upper bound
+DYNAMIC_TABLE_PAGE_SIZE = int(os.getenv('DYNAMIC_TABLE_PAGE_SIZE', 100))
+DYNAMIC_TABLE_MAX_PAGE_SIZE = int(os.getenv('DYNAMIC_TABLE_MAX_PAGE_SIZE', 1000))
+# Rows fetched per round trip from the server-side cursor when exporting a table
+DYNAMIC_TABLE_EXPORT_BATCH_SIZE = int(os.getenv('DYNAMIC_TABLE_EXPORT_BATCH_SIZE', 5000))
+# Most groups returned by the aggregate endpoint (product/<id>/aggregate/)
+DYNAMIC_TABLE_MAX_GROUPS = int(os.getenv('DYNAMIC_TABLE_MAX_GROUPS', 1000))
+# Partitioned tables: future partitions kept ready, and how far back partitions
+# are created when converting a table (older rows go to the default partition)
+DYNAMIC_TABLE_PARTITIONS_AHEAD = int(os.getenv('DYNAMIC_TABLE_PARTITIONS_AHEAD', 2))
+DYNAMIC_TABLE_MAX_PARTITIONS = int(os.getenv('DYNAMIC_TABLE_MAX_PARTITIONS', 120))
+# How long schema changes wait for a lock on a product table before giving up,
+# rather than queueing every other query on the table behind them
+DYNAMIC_TABLE_DDL_LOCK_TIMEOUT = os.getenv('DYNAMIC_TABLE_DDL_LOCK_TIMEOUT', '5s')
+
+# Fitted product matcher (python manage.py train_product_matcher), loaded once per worker
+PRODUCT_MATCHER_PATH = os.getenv('PRODUCT_MATCHER_PATH', os.path.join(BASE_DIR, 'artifacts', 'product_matcher.joblib'))
+# Products scored per matrix product when matching; each block holds block size x catalog size scores
+PRODUCT_MATCHER_BLOCK_SIZE = int(os.getenv('PRODUCT_MATCHER_BLOCK_SIZE', 1000))
+# Approximate matching: catalogs of at least PRODUCT_MATCHER_ANN_MIN_CATALOG official
+# products (0 disables) get an LSH index over SVD-reduced vectors at training time,
+# and only its candidates are scored (python manage.py benchmark_product_matcher)
+PRODUCT_MATCHER_ANN_MIN_CATALOG = int(os.getenv('PRODUCT_MATCHER_ANN_MIN_CATALOG', 0))
+PRODUCT_MATCHER_ANN_COMPONENTS = int(os.getenv('PRODUCT_MATCHER_ANN_COMPONENTS', 128))
+PRODUCT_MATCHER_ANN_TABLES = int(os.getenv('PRODUCT_MATCHER_ANN_TABLES', 16))
+# Score each product only against the official products sharing a brand or category
+# token with it ('true'). Off by default: it can change the top-ranked match, so check
+# its top-1 agreement with `python manage.py benchmark_product_matcher` first
+PRODUCT_MATCHER_BLOCKING = os.getenv('PRODUCT_MATCHER_BLOCKING', 'false') == 'true'
+# Catalog changes are applied to the saved matcher without refitting; it is refitted once
+# the out-of-vocabulary terms added exceed this share of the catalog's terms at the fit
+PRODUCT_MATCHER_MAX_VOCABULARY_DRIFT = float(os.getenv('PRODUCT_MATCHER_MAX_VOCABULARY_DRIFT', 0.05))
+
+# Engine used to validate Excel submissions: 'columnar' (pandas) or 'rows'
+EXCEL_VALIDATION_ENGINE = os.getenv('EXCEL_VALIDATION_ENGINE', 'columnar')
+
+# Large submissions are validated in a process pool, in chunks of
+# EXCEL_VALIDATION_CHUNK_SIZE rows; smaller ones are validated inline
+EXCEL_VALIDATION_WORKERS = int(os.getenv('EXCEL_VALIDATION_WORKERS', min(4, os.cpu_count() or 1)))
+EXCEL_VALIDATION_CHUNK_SIZE = int(os.getenv('EXCEL_VALIDATION_CHUNK_SIZE', 50000))
+EXCEL_VALIDATION_PARALLEL_THRESHOLD = int(os.getenv('EXCEL_VALIDATION_PARALLEL_THRESHOLD', 100000))
+
+# Validation stops scanning once EXCEL_VALIDATION_MAX_ERRORS errors are found
+# (0 disables the cap); inline validation checks the cap every
+# EXCEL_VALIDATION_BLOCK_SIZE rows. Responses and emails summarise errors per
+# field with the first EXCEL_VALIDATION_ERROR_EXAMPLES rows of each.
+EXCEL_VALIDATION_BLOCK_SIZE = int(os.getenv('EXCEL_VALIDATION_BLOCK_SIZE', 10000))
+EXCEL_VALIDATION_MAX_ERRORS = int(os.getenv('EXCEL_VALIDATION_MAX_ERRORS', 1000))
+EXCEL_VALIDATION_ERROR_EXAMPLES = int(os.getenv('EXCEL_VALIDATION_ERROR_EXAMPLES', 5))
+
+# Background submission jobs (python manage.py process_submission_jobs)
+SUBMISSION_JOB_POLL_SECONDS = int(os.getenv('SUBMISSION_JOB_POLL_SECONDS', 5))
+# Running jobs that stopped reporting progress this long ago are requeued
+SUBMISSION_JOB_STALE_SECONDS = int(os.getenv('SUBMISSION_JOB_STALE_SECONDS', 900))
@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.db import connection
+from .bulk_load import quote_column
+from .queries import QueryError
+
+NUMERIC_TYPES = ('int', 'float', 'decimal')
+TEMPORAL_TYPES = ('date', 'datetime')
+
+# Aggregate functions allowed per field type; count without a field counts rows
+AGGREGATES = {
+    'count': ('count({})', None),
+    'count_distinct': ('count(DISTINCT {})', None),
+    'sum': ('sum({})', NUMERIC_TYPES),
+    'avg': ('avg({})', NUMERIC_TYPES),
+    'min': ('min({})', NUMERIC_TYPES + TEMPORAL_TYPES + ('varchar', 'text')),
+    'max': ('max({})', NUMERIC_TYPES + TEMPORAL_TYPES + ('varchar', 'text')),
+}
+GROUPABLE_TYPES = ('varchar', 'text', 'int', 'boolean') + TEMPORAL_TYPES
+DATE_BUCKETS = ('day', 'week', 'month', 'quarter', 'year')
+
+
+def split_list(value):
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+class Aggregation:
+    """
+    A GROUP BY query over a dynamic product table.
+
+    `group_by` lists fields to group on; date and datetime fields can be
+    bucketed with `field:month` (day, week, month, quarter or year).
+    `metrics` lists `count` (rows) and `function:field` pairs, where the
+    function must suit the field's type (sum/avg only on numbers, etc.).
+    Each group key and metric becomes one column of the result, named
+    `field`, `field__bucket`, `count` or `function__field`.
+    """
+
+    def __init__(self, schema, group_by=None, metrics=None):
+        self.schema = schema
+        self.group_by = [self._parse_group(item) for item in split_list(group_by)]
+        self.metrics = [self._parse_metric(item) for item in split_list(metrics) or ['count']]
+
+    def _field(self, name):
+        field = self.schema.by_name.get(name)
+        if field is None:
+            raise QueryError(f'Unknown field: {name}')
+        return field
+
+    def _parse_group(self, item):
+        name, _, bucket = item.partition(':')
+        field = self._field(name)
+        if field.field_type not in GROUPABLE_TYPES:
+            raise QueryError(f'Cannot group by {field.field_type} field {name}')
+        if bucket:
+            if field.field_type not in TEMPORAL_TYPES or bucket not in DATE_BUCKETS:
+                raise QueryError(f"Invalid grouping: {item}")
+            expression = f"date_trunc('{bucket}', {quote_column(name)})"
+            if field.field_type == 'date':
+                expression += '::date'
+            return {'spec': item, 'name': name, 'alias': f'{name}__{bucket}', 'expression': expression}
+        return {'spec': item, 'name': name, 'alias': name, 'expression': quote_column(name)}
+
+    def _parse_metric(self, item):
+        function, _, name = item.partition(':')
+        if function not in AGGREGATES:
+            raise QueryError(f'Unknown aggregate: {function}')
+        template, allowed_types = AGGREGATES[function]
+        if not name:
+            if function != 'count':
+                raise QueryError(f'{function} needs a field, e.g. {function}:field')
+            return {'spec': item, 'alias': 'count', 'expression': 'count(*)'}
+        field = self._field(name)
+        if allowed_types and field.field_type not in allowed_types:
+            raise QueryError(f'Cannot apply {function} to {field.field_type} field {name}')
+        return {'spec': item, 'alias': f'{function}__{name}', 'expression': template.format(quote_column(name))}
+
+    @property
+    def aliases(self):
+        return [item['alias'] for item in self.group_by + self.metrics]
+
+    def select_sql(self, table_name, filters=(), params=()):
+        """Return (sql, params) computing every group in one statement."""
+        select = [
+            f"{item['expression']} AS {quote_column(item['alias'])}"
+            for item in self.group_by + self.metrics
+        ]
+        sql = f"SELECT {', '.join(select)} FROM {table_name}"
+        if filters:
+            sql += ' WHERE ' + ' AND '.join(filters)
+        if self.group_by:
+            positions = ', '.join(str(index) for index in range(1, len(self.group_by) + 1))
+            sql += f' GROUP BY {positions} ORDER BY {positions}'
+        return sql, list(params)
+
+    def fetch(self, table_name, filters=(), params=(), limit=None):
+        """Run the aggregation; returns (rows as dicts, truncated)."""
+        limit = limit or settings.DYNAMIC_TABLE_MAX_GROUPS
+        sql, params = self.select_sql(table_name, filters, params)
+        sql += ' LIMIT %s'
+        params.append(limit + 1)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return [dict(zip(self.aliases, row)) for row in rows[:limit]], len(rows) > limit
+
+    def summary_fetch(self, summary, filters=(), params=(), limit=None):
+        """
+        Read the groups from a materialized summary instead of the table. The
+        summary must group on exactly the same keys and compute every metric
+        asked for; filters may only use plain (unbucketed) group fields.
+        """
+        limit = limit or settings.DYNAMIC_TABLE_MAX_GROUPS
+        select = ', '.join(quote_column(alias) for alias in self.aliases)
+        sql = f"SELECT {select} FROM {summary.view_name}"
+        if filters:
+            sql += ' WHERE ' + ' AND '.join(filters)
+        if self.group_by:
+            sql += ' ORDER BY ' + ', '.join(quote_column(item['alias']) for item in self.group_by)
+        sql += ' LIMIT %s'
+        params = list(params) + [limit + 1]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return [dict(zip(self.aliases, row)) for row in rows[:limit]], len(rows) > limit
+
+    def matches_summary(self, summary, filter_fields=()):
+        summary_groups = set(summary.group_by)
+        plain_groups = {item for item in summary.group_by if ':' not in item}
+        return (
+            summary_groups == {item['spec'] for item in self.group_by}
+            and {item['spec'] for item in self.metrics} <= set(summary.metrics)
+            and set(filter_fields) <= plain_groups
+        )
+
+
+def create_summary_view(summary, schema):
+    """Create (or recreate) the materialized view behind a ProductSummary."""
+    aggregation = Aggregation(schema, summary.group_by, summary.metrics)
+    sql, _ = aggregation.select_sql(summary.table_name)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP MATERIALIZED VIEW IF EXISTS {summary.view_name}')
+        cursor.execute(f'CREATE MATERIALIZED VIEW {summary.view_name} AS {sql}')
+        if aggregation.group_by:
+            # Needed for REFRESH ... CONCURRENTLY, and serves filtered reads
+            columns = ', '.join(quote_column(item['alias']) for item in aggregation.group_by)
+            cursor.execute(f'CREATE UNIQUE INDEX {summary.view_name}_key ON {summary.view_name} ({columns})')
+
+
+def refresh_summary_view(summary):
+    """
+    Recompute a summary. Grouped summaries refresh CONCURRENTLY so readers
+    keep seeing the previous contents until the new ones are ready.
+    """
+    concurrently = 'CONCURRENTLY ' if summary.group_by else ''
+    with connection.cursor() as cursor:
+        cursor.execute(f'REFRESH MATERIALIZED VIEW {concurrently}{summary.view_name}')
+
+
+def drop_summary_view(summary):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP MATERIALIZED VIEW IF EXISTS {summary.view_name}')
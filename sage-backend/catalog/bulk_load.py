@@ -0,0 +1,173 @@
+import datetime
+import io
+import logging
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def quote_column(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def format_copy_value(value):
+    """Render one value as a field of PostgreSQL's COPY CSV format."""
+    if value is None:
+        # Unquoted empty field is NULL in CSV mode
+        return ''
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    # Always quote text so that empty strings stay distinct from NULL
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class CopyStream(io.TextIOBase):
+    """
+    File-like object that renders rows as COPY CSV lines on demand, so
+    psycopg2's copy_expert can consume a generator without buffering it.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = ''
+        self.rows_read = 0
+
+    def readable(self):
+        return True
+
+    def _next_line(self):
+        row = next(self._rows, None)
+        if row is None:
+            return None
+        self.rows_read += 1
+        return ','.join(format_copy_value(value) for value in row) + '\n'
+
+    def read(self, size=-1):
+        pieces = [self._buffer]
+        length = len(self._buffer)
+        while size is None or size < 0 or length < size:
+            line = self._next_line()
+            if line is None:
+                break
+            pieces.append(line)
+            length += len(line)
+        data = ''.join(pieces)
+        if size is None or size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+    def readline(self, size=-1):
+        if self._buffer:
+            line, self._buffer = self._buffer, ''
+            return line
+        return self._next_line() or ''
+
+
+class BulkLoadResult:
+    def __init__(self, rows, seconds, method):
+        self.rows = rows
+        self.seconds = seconds
+        self.method = method
+
+    @property
+    def rows_per_second(self):
+        if not self.seconds:
+            return float(self.rows)
+        return round(self.rows / self.seconds, 1)
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'seconds': round(self.seconds, 3),
+            'method': self.method,
+            'rows_per_second': self.rows_per_second,
+        }
+
+
+class BulkLoader:
+    """
+    Load rows into a dynamic product table.
+
+    On PostgreSQL the rows are streamed through `COPY ... FROM STDIN`, which
+    needs a single round trip for the whole load. `rows` can be a list or any
+    iterable (e.g. a generator converting spreadsheet rows lazily); it is
+    consumed only once. When COPY isn't available the rows are sent as
+    multi-row INSERTs in pages of `page_size` rows.
+    """
+
+    def __init__(self, table_name, columns, page_size=None):
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.page_size = page_size or settings.DYNAMIC_TABLE_LOAD_CHUNK_SIZE
+        self.column_sql = ', '.join(quote_column(column) for column in self.columns)
+
+    def can_copy(self, cursor):
+        return connection.vendor == 'postgresql' and hasattr(cursor.cursor, 'copy_expert')
+
+    def load(self, rows):
+        started = time.monotonic()
+        with connection.cursor() as cursor:
+            if self.can_copy(cursor):
+                method = 'copy'
+                count = self._copy(cursor, rows)
+            else:
+                method = 'values'
+                count = self._insert_values(cursor, rows)
+
+        result = BulkLoadResult(count, time.monotonic() - started, method)
+        logger.info(
+            "Loaded %s rows into %s via %s in %.2fs (%s rows/s)",
+            result.rows, self.table_name, method, result.seconds, result.rows_per_second
+        )
+        return result
+
+    def _copy(self, cursor, rows):
+        stream = CopyStream(rows)
+        cursor.cursor.copy_expert(
+            f"COPY {self.table_name} ({self.column_sql}) FROM STDIN WITH (FORMAT csv)",
+            stream
+        )
+        return stream.rows_read
+
+    def _insert_values(self, cursor, rows):
+        try:
+            from psycopg2.extras import execute_values
+        except ImportError:
+            execute_values = None
+
+        count = 0
+        for page in self._pages(rows):
+            if execute_values is not None and connection.vendor == 'postgresql':
+                execute_values(
+                    cursor.cursor,
+                    f"INSERT INTO {self.table_name} ({self.column_sql}) VALUES %s",
+                    page,
+                    page_size=self.page_size
+                )
+            else:
+                placeholders = ', '.join(['%s'] * len(self.columns))
+                cursor.executemany(
+                    f"INSERT INTO {self.table_name} ({self.column_sql}) VALUES ({placeholders})",
+                    page
+                )
+            count += len(page)
+        return count
+
+    def _pages(self, rows):
+        page = []
+        for row in rows:
+            page.append(row)
+            if len(page) >= self.page_size:
+                yield page
+                page = []
+        if page:
+            yield page
@@ -0,0 +1,48 @@
+import datetime
+import logging
+from django.utils import timezone
+from django_cron import CronJobBase, Schedule
+from .aggregates import refresh_summary_view
+from .models import ProductSummary, ProductTableInfo
+from .partitions import maintain_partitions
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshProductSummariesCronJob(CronJobBase):
+    code = 'catalog.refresh_product_summaries'
+    schedule = Schedule(run_every_mins=5)
+
+    def do(self):
+        now = timezone.now()
+        refreshed = 0
+        for summary in ProductSummary.objects.select_related('product'):
+            due = summary.refreshed_at is None or \
+                summary.refreshed_at + datetime.timedelta(minutes=summary.refresh_minutes) <= now
+            if not due:
+                continue
+            try:
+                refresh_summary_view(summary)
+            except Exception:
+                logger.exception("Failed to refresh summary %s", summary.view_name)
+                continue
+            ProductSummary.objects.filter(pk=summary.pk).update(refreshed_at=timezone.now())
+            refreshed += 1
+        return f'{refreshed} summaries refreshed'
+
+
+class MaintainProductPartitionsCronJob(CronJobBase):
+    code = 'catalog.maintain_product_partitions'
+    schedule = Schedule(run_every_mins=1440)
+
+    def do(self):
+        created = expired = 0
+        for product_table in ProductTableInfo.objects.exclude(partition_key=''):
+            try:
+                new, old = maintain_partitions(product_table)
+            except Exception:
+                logger.exception("Failed to maintain partitions of %s", product_table.table_name)
+                continue
+            created += len(new)
+            expired += len(old)
+        return f'{created} partitions created, {expired} expired'
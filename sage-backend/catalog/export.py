@@ -0,0 +1,226 @@
+import csv
+import queue
+import tempfile
+import threading
+import zlib
+import xlsxwriter
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+
+XLSX_MAX_ROWS = 1048576
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def fetch_batches(query, batch_size=None, ordered=False):
+    """
+    Yield lists of row tuples (the query's projected columns) read through a
+    named server-side cursor, so only one batch is held in Python at a time.
+
+    The cursor is opened inside a transaction: outside one Django would
+    declare it WITH HOLD, which makes PostgreSQL materialise the whole
+    result before the first fetch.
+    """
+    batch_size = batch_size or settings.DYNAMIC_TABLE_EXPORT_BATCH_SIZE
+    sql, params = query.select_sql(ordered=ordered)
+    width = len(query.columns)
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [row[:width] for row in rows] if ordered else rows
+
+
+class EchoBuffer:
+    """File-like object whose write() returns the data, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(query, batches):
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow(query.columns)
+    for rows in batches:
+        yield ''.join(writer.writerow(['' if value is None else value for value in row]) for row in rows)
+
+
+def ndjson_chunks(query, batches):
+    encoder = DjangoJSONEncoder()
+    for rows in batches:
+        yield ''.join(encoder.encode(dict(zip(query.columns, row))) + '\n' for row in rows)
+
+
+def xlsx_chunks(query, batches, chunk_size=1024 * 1024):
+    """
+    Write the workbook with xlsxwriter's constant_memory mode (each row is
+    flushed to a temporary file as soon as the next one starts), then
+    stream the finished file. Sheets roll over at Excel's row limit.
+    """
+    with tempfile.TemporaryFile() as output:
+        workbook = xlsxwriter.Workbook(output, {
+            'constant_memory': True,
+            'default_date_format': 'yyyy-mm-dd',
+            'remove_timezone': True,
+        })
+        header_format = workbook.add_format({'bold': True})
+        worksheet, row_index = None, XLSX_MAX_ROWS
+        for rows in batches:
+            for row in rows:
+                if row_index >= XLSX_MAX_ROWS:
+                    worksheet = workbook.add_worksheet(f'Data{len(workbook.worksheets()) + 1}')
+                    worksheet.write_row(0, 0, query.columns, header_format)
+                    row_index = 1
+                worksheet.write_row(row_index, 0, row)
+                row_index += 1
+        if worksheet is None:
+            workbook.add_worksheet('Data1').write_row(0, 0, query.columns, header_format)
+        workbook.close()
+
+        output.seek(0)
+        yield from iter(lambda: output.read(chunk_size), b'')
+
+
+def export_response(query, export_format, file_name, ordered=False):
+    """StreamingHttpResponse with the rows selected by a TableQuery."""
+    batches = fetch_batches(query, ordered=ordered)
+    if export_format == 'csv':
+        chunks = csv_chunks(query, batches)
+    elif export_format == 'ndjson':
+        chunks = ndjson_chunks(query, batches)
+    else:
+        chunks = xlsx_chunks(query, batches)
+
+    response = StreamingHttpResponse(chunks, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{file_name}.{export_format}"'
+    return response
+
+
+class QueueWriter:
+    """
+    File-like sink for copy_expert that hands the COPY output to another
+    thread in blocks of about `block_size` bytes. The queue is bounded, so
+    the database is only read as fast as the client downloads; once the
+    consumer goes away write() raises and aborts the COPY.
+    """
+
+    def __init__(self, block_size=256 * 1024, max_blocks=8):
+        self.blocks = queue.Queue(maxsize=max_blocks)
+        self.block_size = block_size
+        self.buffer = []
+        self.buffered = 0
+        self.cancelled = threading.Event()
+
+    def _put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.blocks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+        raise IOError('Export cancelled')
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.block_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            block = b''.join(self.buffer)
+            self.buffer, self.buffered = [], 0
+            self._put(block)
+
+    def close(self, error=None):
+        """Flush what's left and tell the consumer the COPY has ended."""
+        if error is None:
+            self.flush()
+        self._put(error)
+
+
+def copy_chunks(query, header=True):
+    """
+    Yield the CSV produced by COPY (SELECT ...) TO STDOUT. PostgreSQL renders
+    the rows; Python only moves byte blocks from the COPY thread to the
+    response, without building a row object per record.
+    """
+    sql, params = query.select_sql(ordered=False)
+    writer = QueueWriter()
+    finished = False
+
+    try:
+        with connection.cursor() as cursor:
+            copy_sql = f"COPY ({cursor.mogrify(sql, params).decode()}) TO STDOUT WITH (FORMAT csv, HEADER {str(header).lower()})"
+
+            def run_copy():
+                try:
+                    cursor.copy_expert(copy_sql, writer)
+                except Exception as e:
+                    if not writer.cancelled.is_set():
+                        writer.close(e)
+                    return
+                writer.close()
+
+            thread = threading.Thread(target=run_copy, name='table-export-copy', daemon=True)
+            thread.start()
+            try:
+                while True:
+                    block = writer.blocks.get()
+                    if block is None:
+                        finished = True
+                        break
+                    if isinstance(block, Exception):
+                        raise block
+                    yield block
+            finally:
+                writer.cancelled.set()
+                if not finished:
+                    # The client went away or the COPY failed: stop the query on the server
+                    connection.connection.cancel()
+                thread.join()
+    finally:
+        if not finished:
+            # An interrupted COPY can leave the connection mid-protocol; don't let the next request reuse it
+            connection.close()
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def dump_response(query, file_name, compress=False):
+    """
+    StreamingHttpResponse with a CSV dump of the rows selected by a
+    TableQuery, made with COPY TO on PostgreSQL (streamed through the
+    server-side cursor everywhere else), optionally gzipped.
+    """
+    if connection.vendor == 'postgresql':
+        chunks = copy_chunks(query)
+    else:
+        chunks = csv_chunks(query, fetch_batches(query))
+
+    if compress:
+        response = StreamingHttpResponse(gzip_chunks(chunks), content_type='application/gzip')
+        response['Content-Disposition'] = f'attachment; filename="{file_name}.csv.gz"'
+    else:
+        response = StreamingHttpResponse(chunks, content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{file_name}.csv"'
+    return response
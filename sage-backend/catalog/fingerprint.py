@@ -0,0 +1,21 @@
+import hashlib
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Hex SHA-256 of an uploaded file's content, read in chunks so large
+    uploads are never held in memory. The file is left rewound.
+    """
+    digest = hashlib.sha256()
+    if hasattr(file, 'chunks'):
+        # Django's UploadedFile.chunks() starts from the beginning itself
+        chunks = file.chunks(chunk_size)
+    else:
+        file.seek(0)
+        chunks = iter(lambda: file.read(chunk_size), b'')
+    for chunk in chunks:
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
@@ -0,0 +1,103 @@
+import logging
+from django.db import connection
+from .bulk_load import quote_column
+from .tables import is_partitioned
+
+logger = logging.getLogger(__name__)
+
+# Long text keys only ever compared for equality are cheaper to hash
+HASH_MIN_LENGTH = 256
+
+
+def index_prefix(table_name):
+    """Indexes named with this prefix are owned by reconcile_indexes."""
+    return f'{table_name}_auto_'
+
+
+def desired_indexes(table_name, fields):
+    """
+    Secondary indexes a dynamic table should have, derived from field
+    metadata, as {index name: (method, column)}:
+
+    - date/datetime fields get a BRIN index: submissions are appended
+      roughly in date order, so block ranges filter well at a tiny size
+    - picklist fields get a B-tree for equality filters and group-bys
+    - fields flagged `is_filterable` get a B-tree (ranges and sorting), or
+      a hash index for long text keys, and a date field also gets a B-tree
+      next to its BRIN
+
+    Primary key and unique fields are skipped: their constraints already
+    come with a B-tree.
+    """
+    indexes = {}
+    prefix = index_prefix(table_name)
+    for field in fields:
+        rule = field.validation_rule if hasattr(field, 'validation_rule') else None
+        if field.is_primary_key or (rule and rule.is_unique):
+            continue
+
+        methods = []
+        if field.field_type in ('date', 'datetime'):
+            methods.append('brin')
+        if rule and rule.is_picklist:
+            methods.append('btree')
+        if field.is_filterable:
+            long_text = field.field_type == 'text' or (field.length or 0) >= HASH_MIN_LENGTH
+            methods.append('hash' if long_text and field.field_type in ('varchar', 'text') else 'btree')
+
+        for method in dict.fromkeys(methods):
+            indexes[f'{prefix}{field.id}_{method}'] = (method, field.name)
+    return indexes
+
+
+def existing_indexes(cursor, table_name):
+    """Managed indexes on the table as {name: is_valid}."""
+    cursor.execute("""
+        SELECT idx.relname, ind.indisvalid
+        FROM pg_index ind
+        JOIN pg_class idx ON idx.oid = ind.indexrelid
+        JOIN pg_class tbl ON tbl.oid = ind.indrelid
+        WHERE tbl.relname = %s
+          AND tbl.relnamespace = current_schema()::regnamespace
+          AND idx.relname LIKE %s
+    """, [table_name, index_prefix(table_name).replace('_', r'\_') + '%'])
+    return dict(cursor.fetchall())
+
+
+def reconcile_indexes(table_name, fields):
+    """
+    Create the managed indexes a table is missing and drop the ones its
+    fields no longer call for. Builds use CREATE INDEX CONCURRENTLY so
+    uploads and reads keep going on large tables; inside a transaction or
+    on a partitioned table (where CONCURRENTLY isn't allowed) plain builds
+    are used instead. An invalid index left behind by an interrupted
+    concurrent build is dropped and built again.
+
+    Returns (created, dropped) index names.
+    """
+    if connection.vendor != 'postgresql':
+        return [], []
+
+    desired = desired_indexes(table_name, fields)
+    created, dropped = [], []
+    with connection.cursor() as cursor:
+        # Partitioned tables can't be indexed concurrently either
+        blocking = connection.in_atomic_block or is_partitioned(cursor, table_name)
+        concurrently = '' if blocking else 'CONCURRENTLY '
+        existing = existing_indexes(cursor, table_name)
+        for name, valid in existing.items():
+            if name not in desired or not valid:
+                cursor.execute(f'DROP INDEX {concurrently}IF EXISTS {name}')
+                dropped.append(name)
+
+        for name, (method, column) in desired.items():
+            if existing.get(name):
+                continue
+            cursor.execute(
+                f'CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table_name} USING {method} ({quote_column(column)})'
+            )
+            created.append(name)
+
+    if created or dropped:
+        logger.info("Indexes on %s: created %s, dropped %s", table_name, created, dropped)
+    return created, dropped
@@ -0,0 +1,82 @@
+import re
+import openpyxl
+
+
+HEADER_ANNOTATION_RE = re.compile(r'\(.*?\)|\[.*?\]')
+
+
+def clean_header(header):
+    """
+    Strip the type/validation annotations added by ExcelTemplateGenerationView,
+    e.g. "price (decimal) [Min: 0]" -> "price".
+    """
+    if header is None:
+        return ''
+    return HEADER_ANNOTATION_RE.sub('', str(header)).strip()
+
+
+class ExcelRowReader:
+    """
+    Read an uploaded .xlsx file row by row without loading the sheet in memory.
+
+    The workbook is opened in openpyxl's read-only mode, so only the row being
+    iterated is materialised. The first row of the active sheet is treated as
+    the header row.
+    """
+
+    def __init__(self, file):
+        if hasattr(file, 'seek'):
+            file.seek(0)
+        self.workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        self.sheet = self.workbook.active
+        self._rows = self.sheet.iter_rows(values_only=True)
+        header_row = next(self._rows, None) or ()
+        self.headers = [clean_header(header) for header in header_row]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # Read-only workbooks keep the underlying zip file open until closed
+        self.workbook.close()
+
+    def iter_rows(self):
+        """Yield each non-empty data row as a tuple of cell values."""
+        for row in self._rows:
+            if row is None or all(value is None or value == '' for value in row):
+                continue
+            yield row
+
+    def iter_chunks(self, chunk_size):
+        """Yield lists of at most `chunk_size` data rows."""
+        chunk = []
+        for row in self.iter_rows():
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def map_columns(headers, fields):
+    """
+    Return, for each field, the index of its column in `headers` (or None
+    when the sheet doesn't contain that column).
+    """
+    positions = {}
+    for index, header in enumerate(headers):
+        positions.setdefault(header, index)
+    return [positions.get(field.name) for field in fields]
+
+
+def project_row(row, column_positions):
+    """Pick the cells of `row` in field order using `map_columns` output."""
+    row_length = len(row)
+    return [
+        row[index] if index is not None and index < row_length else None
+        for index in column_positions
+    ]
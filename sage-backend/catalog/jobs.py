@@ -0,0 +1,284 @@
+import logging
+import os
+import socket
+import datetime
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .ingestion import ExcelRowReader, map_columns, project_row
+from .models import ProductTableInfo, SubmissionInfo, SubmissionJob
+from .schema import get_product_schema
+from .services import AlertService, EmailService
+from .staging import MERGE_PARTITIONED_ERROR, StagingTable
+from .validation import ValidationReport, header_errors, validate_submission
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def enqueue_submission_job(product, user, upload, mode=SubmissionJob.MODE_INSERT, content_hash=''):
+    """Store the uploaded file and queue it for the background worker."""
+    return SubmissionJob.objects.create(
+        product=product,
+        submitted_by=user,
+        file=upload,
+        file_name=upload.name,
+        content_hash=content_hash,
+        mode=mode
+    )
+
+
+def claim_next_job(worker=None):
+    """
+    Mark the oldest queued job as running and return it, or None when the
+    queue is empty. SKIP LOCKED lets several workers poll the same table
+    without handing out a job twice.
+    """
+    with transaction.atomic():
+        job = (
+            SubmissionJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=SubmissionJob.STATUS_QUEUED)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = SubmissionJob.STATUS_RUNNING
+        job.phase = SubmissionJob.PHASE_VALIDATING
+        job.worker = worker or worker_name()
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'phase', 'worker', 'started_at', 'updated_at'])
+    return job
+
+
+def requeue_stale_jobs():
+    """
+    Put back running jobs whose worker died, with their progress reset. A
+    live worker reports progress between validation blocks, heartbeats
+    while loading and checking the staging table, and keeps its job locked
+    during the merge transaction, so its job is never picked here.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.SUBMISSION_JOB_STALE_SECONDS)
+    with transaction.atomic():
+        stale = list(
+            SubmissionJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=SubmissionJob.STATUS_RUNNING, updated_at__lt=cutoff)
+            .values_list('id', flat=True)
+        )
+        if stale:
+            SubmissionJob.objects.filter(id__in=stale).update(
+                status=SubmissionJob.STATUS_QUEUED,
+                phase=SubmissionJob.PHASE_QUEUED,
+                rows_processed=0,
+                rows_loaded=0,
+                error_count=0,
+                errors={},
+                worker='',
+                updated_at=timezone.now()
+            )
+    for job_id in stale:
+        logger.warning("Requeued stale submission job %s", job_id)
+    return len(stale)
+
+
+def update_job(job, **fields):
+    """Persist progress fields straight away so pollers see them."""
+    for name, value in fields.items():
+        setattr(job, name, value)
+    fields['updated_at'] = timezone.now()
+    SubmissionJob.objects.filter(pk=job.pk).update(**fields)
+
+
+@contextmanager
+def heartbeat(job, interval=None):
+    """
+    Touch the job's updated_at every `interval` seconds (a third of
+    SUBMISSION_JOB_STALE_SECONDS by default) while the block runs. The
+    steps it covers, the COPY into staging and the staging checks, are
+    single statements on the worker's connection, so a background thread
+    with its own connection reports for them.
+    """
+    interval = settings.SUBMISSION_JOB_STALE_SECONDS / 3 if interval is None else interval
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(interval):
+                SubmissionJob.objects.filter(pk=job.pk, status=SubmissionJob.STATUS_RUNNING).update(
+                    updated_at=timezone.now()
+                )
+        except Exception:
+            logger.exception("Heartbeat of submission job %s failed", job.id)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f'submission-job-{job.id}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_job(job):
+    """Validate, load and notify for one claimed job."""
+    try:
+        product_table = ProductTableInfo.objects.filter(product=job.product).first()
+        if not product_table:
+            return finish_job(job, SubmissionJob.STATUS_FAILED, message='No dynamic table found for this product')
+
+        schema = get_product_schema(job.product_id)
+        report = validate_job_file(job, schema)
+        if report:
+            return fail_validation(job, report)
+        if not job.rows_processed:
+            return finish_job(job, SubmissionJob.STATUS_FAILED, message='No data provided')
+
+        rejects = load_job_file(job, schema, product_table)
+        if rejects:
+            return fail_validation(job, rejects)
+    except Exception as e:
+        logger.exception("Submission job %s failed", job.id)
+        return fail_save(job, e)
+
+    update_job(job, phase=SubmissionJob.PHASE_NOTIFYING)
+    AlertService.create_alert(
+        user=job.submitted_by,
+        message=f'Excel data saved for {job.product.schema_name}. {job.rows_loaded} rows loaded.'
+    )
+    return finish_job(job, SubmissionJob.STATUS_SUCCEEDED, message='Excel data saved successfully')
+
+
+def validate_job_file(job, schema):
+    """
+    Validate the uploaded sheet block by block, recording rows processed and
+    errors found so far after each block. Blocks are as large as the
+    process-pool threshold so big files are still validated in parallel.
+    """
+    report = ValidationReport()
+    block_size = max(settings.EXCEL_VALIDATION_PARALLEL_THRESHOLD, settings.EXCEL_VALIDATION_BLOCK_SIZE)
+    with job.file.open('rb') as upload, ExcelRowReader(upload) as reader:
+        report.add(header_errors(schema, reader.headers))
+        rows_processed = 0
+        for block in reader.iter_chunks(block_size):
+            validate_submission(schema, reader.headers, block, start_row=rows_processed + 1, report=report)
+            rows_processed += len(block)
+            update_job(job, rows_processed=rows_processed, error_count=len(report))
+            if report.truncated:
+                break
+    return report
+
+
+def load_job_file(job, schema, product_table):
+    """
+    Stream the sheet into a staging table, check it there and merge it into
+    the dynamic table. Returns the rejected rows, if any, in which case
+    nothing is merged. The job heartbeats while loading and checking, and
+    its row stays locked during the merge transaction, which marks it as
+    alive for requeue_stale_jobs.
+    """
+    update_job(job, phase=SubmissionJob.PHASE_LOADING)
+    chunk_size = settings.DYNAMIC_TABLE_LOAD_CHUNK_SIZE
+    key_columns = schema.primary_key if job.mode == SubmissionJob.MODE_MERGE else None
+    if job.mode == SubmissionJob.MODE_MERGE and not key_columns:
+        raise ValueError('Merge mode needs primary key fields')
+    if job.mode == SubmissionJob.MODE_MERGE and product_table.partition_key:
+        raise ValueError(MERGE_PARTITIONED_ERROR)
+
+    with job.file.open('rb') as upload, ExcelRowReader(upload) as reader, \
+            StagingTable(product_table.table_name, schema.field_names, key_columns,
+                         unique_keys=schema.unique_keys) as staging:
+
+        def converted_rows():
+            column_positions = map_columns(reader.headers, schema.fields)
+            for chunk in reader.iter_chunks(chunk_size):
+                for row in chunk:
+                    yield schema.convert_row(project_row(row, column_positions))
+
+        with heartbeat(job):
+            staging.load(converted_rows())
+            update_job(job, rows_processed=staging.rows_staged)
+            rejects = staging.check()
+        if rejects:
+            return rejects
+
+        with transaction.atomic():
+            SubmissionJob.objects.select_for_update().filter(pk=job.pk).first()
+            # Created first so the merged rows can be stamped with its id
+            submission = SubmissionInfo.objects.create(
+                product=job.product,
+                submitted_by=job.submitted_by,
+                submitted_data={},
+                submission_time=timezone.now(),
+                catalog=job.product.catalogs.first(),
+                domain=job.product.domain,
+                submission_type='Upload',
+                content_hash=job.content_hash,
+                mode=job.mode
+            )
+            rows_inserted = staging.merge(submission_id=submission.id)
+            rows_loaded = rows_inserted + staging.rows_updated
+            submission.submitted_data = {
+                'file_name': job.file_name,
+                'rows': rows_loaded,
+                'job_id': job.id,
+                'mode': job.mode,
+                'rows_inserted': rows_inserted,
+                'rows_updated': staging.rows_updated,
+                'rows_unchanged': staging.rows_unchanged,
+            }
+            submission.save(update_fields=['submitted_data'])
+            update_job(job, rows_loaded=rows_loaded, submission=submission)
+    return None
+
+
+def fail_validation(job, report):
+    update_job(job, phase=SubmissionJob.PHASE_NOTIFYING, error_count=len(report), errors=report.as_dict())
+    EmailService.send_validation_error_email(
+        user=job.submitted_by,
+        product=job.product,
+        validation_errors=report.errors,
+        error_summary=report.summary(),
+        truncated=report.truncated
+    )
+    error_count = f'{len(report)}+' if report.truncated else len(report)
+    AlertService.create_alert(
+        user=job.submitted_by,
+        message=f'Excel validation failed for {job.product.schema_name}. {error_count} errors detected.'
+    )
+    return finish_job(job, SubmissionJob.STATUS_FAILED, message='Validation failed')
+
+
+def fail_save(job, exc):
+    error_message = str(exc)
+    update_job(job, phase=SubmissionJob.PHASE_NOTIFYING)
+    EmailService.send_save_error_email(
+        user=job.submitted_by,
+        product=job.product,
+        save_errors=error_message
+    )
+    AlertService.create_alert(
+        user=job.submitted_by,
+        message=f'Excel data save failed for {job.product.schema_name}. Error: {error_message}'[:255]
+    )
+    return finish_job(job, SubmissionJob.STATUS_FAILED, message=error_message)
+
+
+def finish_job(job, status, message=''):
+    update_job(
+        job,
+        status=status,
+        phase=SubmissionJob.PHASE_DONE,
+        message=message,
+        finished_at=timezone.now()
+    )
+    logger.info("Submission job %s %s: %s", job.id, status, message)
+    return job
@@ -0,0 +1,40 @@
+from django.db import connection
+from .stats import adjust_row_count
+
+# Every dynamic table records which submission wrote each row, and when
+SUBMISSION_COLUMN = '_submission_id'
+LOADED_AT_COLUMN = '_loaded_at'
+LINEAGE_COLUMNS = (SUBMISSION_COLUMN, LOADED_AT_COLUMN)
+
+
+def ensure_lineage_columns(table_name):
+    """
+    Add the lineage columns and their indexes to a dynamic table if they're
+    missing. The B-tree on the submission id makes deleting or replacing a
+    submission's rows an index lookup; load times only grow, so a BRIN
+    index covers them at almost no cost.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {SUBMISSION_COLUMN} BIGINT NULL')
+        cursor.execute(
+            f'ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {LOADED_AT_COLUMN} TIMESTAMPTZ NOT NULL DEFAULT now()'
+        )
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {table_name}_submission_idx ON {table_name} ({SUBMISSION_COLUMN})')
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table_name}_loaded_at_idx ON {table_name} USING brin ({LOADED_AT_COLUMN})'
+        )
+
+
+def delete_submission_rows(table_name, submission_id):
+    """Delete the rows a submission wrote; returns how many."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table_name} WHERE {SUBMISSION_COLUMN} = %s', [submission_id])
+        deleted = cursor.rowcount
+    adjust_row_count(table_name, -deleted)
+    return deleted
+
+
+def count_submission_rows(table_name, submission_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {table_name} WHERE {SUBMISSION_COLUMN} = %s', [submission_id])
+        return cursor.fetchone()[0]
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from catalog.models import ProductField, ProductTableInfo
+from catalog.schema_diff import SchemaChangeError, plan_schema_changes, sync_product_table
+
+class Command(BaseCommand):
+    help = "Show (or apply) the DDL that brings a product's dynamic table in line with its fields"
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int)
+        parser.add_argument('--apply', action='store_true', help='Run the statements instead of printing them')
+
+    def handle(self, *args, **options):
+        product_table = ProductTableInfo.objects.filter(product_id=options['product_id']).first()
+        if not product_table:
+            raise CommandError('No dynamic table found for this product')
+        fields = ProductField.objects.filter(product_id=options['product_id']).select_related('validation_rule')
+
+        try:
+            changes = plan_schema_changes(product_table.table_name, fields, product_table.partition_key)
+            if options['apply']:
+                sync_product_table(product_table.table_name, fields, product_table.partition_key,
+                                   product_table.product.summaries.all())
+        except SchemaChangeError as e:
+            raise CommandError(str(e))
+
+        if not changes:
+            self.stdout.write(self.style.SUCCESS(f'{product_table.table_name} is up to date'))
+            return
+        for change in changes:
+            self.stdout.write(f'-- {change.description}')
+            for statement in change.statements:
+                self.stdout.write(f'{statement};')
+        if options['apply']:
+            self.stdout.write(self.style.SUCCESS(f'Applied {len(changes)} changes to {product_table.table_name}'))
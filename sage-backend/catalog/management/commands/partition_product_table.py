@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from catalog.models import ProductTableInfo
+from catalog.partitions import INTERVALS, LOAD_TIMESTAMP_COLUMN, maintain_partitions, partition_table
+
+class Command(BaseCommand):
+    help = "Convert a product's dynamic table to range partitions on a load timestamp or date field"
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int)
+        parser.add_argument('--key', default=LOAD_TIMESTAMP_COLUMN,
+                            help=f'Required date/datetime field to partition on (default: {LOAD_TIMESTAMP_COLUMN})')
+        parser.add_argument('--interval', choices=INTERVALS, default='month')
+        parser.add_argument('--ahead', type=int, default=None, help='Future partitions to keep created')
+        parser.add_argument('--retention', type=int, default=None,
+                            help='Intervals to keep; older partitions are detached or dropped')
+        parser.add_argument('--retention-action', choices=[choice for choice, _ in ProductTableInfo.RETENTION_ACTION_CHOICES],
+                            default=ProductTableInfo.RETENTION_DETACH)
+
+    def handle(self, *args, **options):
+        product_table = ProductTableInfo.objects.filter(product_id=options['product_id']).first()
+        if not product_table:
+            raise CommandError('No dynamic table found for this product')
+
+        try:
+            partition_table(
+                product_table,
+                options['key'],
+                interval=options['interval'],
+                ahead=options['ahead'],
+                retention=options['retention'],
+                retention_action=options['retention_action']
+            )
+            created, expired = maintain_partitions(product_table)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Partitioned {product_table.table_name} by {options['interval']} on {options['key']}"
+            + (f'; {len(expired)} partitions past retention removed' if expired else '')
+        ))
@@ -0,0 +1,39 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from catalog.jobs import claim_next_job, requeue_stale_jobs, run_job, worker_name
+
+class Command(BaseCommand):
+    help = 'Process queued Excel submission jobs (validate, load and notify)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty instead of polling')
+        parser.add_argument('--max-jobs', type=int, default=0, help='Exit after processing this many jobs')
+        parser.add_argument('--poll-interval', type=float, default=settings.SUBMISSION_JOB_POLL_SECONDS,
+                            help='Seconds to wait between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        processed = 0
+        self.stdout.write(f'Submission job worker {worker} started')
+
+        while True:
+            close_old_connections()
+            requeue_stale_jobs()
+            job = claim_next_job(worker)
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f'Processing submission job {job.id} ({job.file_name})')
+            run_job(job)
+            self.stdout.write(f'Submission job {job.id} {job.status}: {job.message}')
+
+            processed += 1
+            if options['max_jobs'] and processed >= options['max_jobs']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} submission jobs'))
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0020_submissionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submissionjob',
+            name='mode',
+            field=models.CharField(choices=[('insert', 'Insert'), ('merge', 'Merge on primary key')], default='insert', max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0022_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('group_by', models.JSONField(blank=True, default=list)),
+                ('metrics', models.JSONField(default=list)),
+                ('refresh_minutes', models.PositiveIntegerField(default=60)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='catalog.product')),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0023_productsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productfield',
+            name='is_filterable',
+            field=models.BooleanField(default=False, help_text='Index the column for filtering and sorting'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0024_productfield_is_filterable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producttableinfo',
+            name='partition_key',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='producttableinfo',
+            name='partition_interval',
+            field=models.CharField(choices=[('day', 'Daily'), ('month', 'Monthly'), ('year', 'Yearly')], default='month', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='producttableinfo',
+            name='partitions_ahead',
+            field=models.PositiveIntegerField(default=2),
+        ),
+        migrations.AddField(
+            model_name='producttableinfo',
+            name='retention_intervals',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='producttableinfo',
+            name='retention_action',
+            field=models.CharField(choices=[('detach', 'Detach'), ('drop', 'Drop')], default='detach', max_length=10),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def add_lineage_columns(apps, schema_editor):
+    # Dynamic tables are created with raw SQL, so existing ones get the
+    # submission lineage columns here; new tables are created with them.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ProductTableInfo = apps.get_model('catalog', 'ProductTableInfo')
+    existing = set(schema_editor.connection.introspection.table_names())
+    with schema_editor.connection.cursor() as cursor:
+        for table_name in ProductTableInfo.objects.values_list('table_name', flat=True):
+            if table_name not in existing:
+                continue
+            cursor.execute(f'ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS _submission_id BIGINT NULL')
+            cursor.execute(
+                f'ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS _loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()'
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {table_name}_submission_idx ON {table_name} (_submission_id)')
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table_name}_loaded_at_idx ON {table_name} USING brin (_loaded_at)'
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0025_producttableinfo_partitioning'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_lineage_columns, migrations.RunPython.noop),
+    ]
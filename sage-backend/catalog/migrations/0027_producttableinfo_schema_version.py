@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0026_product_table_lineage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producttableinfo',
+            name='schema_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+
+def count_existing_rows(apps, schema_editor):
+    # One exact count per existing table; from here on the loaders keep it current
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ProductTableInfo = apps.get_model('catalog', 'ProductTableInfo')
+    existing = set(schema_editor.connection.introspection.table_names())
+    with schema_editor.connection.cursor() as cursor:
+        for product_table in ProductTableInfo.objects.all():
+            if product_table.table_name not in existing:
+                continue
+            cursor.execute(f'SELECT count(*), max(_loaded_at) FROM {product_table.table_name}')
+            product_table.row_count, product_table.last_loaded_at = cursor.fetchone()
+            product_table.save(update_fields=['row_count', 'last_loaded_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0027_producttableinfo_schema_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producttableinfo',
+            name='row_count',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='producttableinfo',
+            name='last_loaded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(count_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+def mark_merge_submissions(apps, schema_editor):
+    # Submissions saved by merge-mode jobs recorded their mode in submitted_data
+    SubmissionInfo = apps.get_model('catalog', 'SubmissionInfo')
+    SubmissionJob = apps.get_model('catalog', 'SubmissionJob')
+    SubmissionInfo.objects.filter(submitted_data__mode='merge').update(mode='merge')
+    SubmissionInfo.objects.filter(
+        id__in=SubmissionJob.objects.filter(mode='merge', submission__isnull=False).values('submission_id')
+    ).update(mode='merge')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0028_producttableinfo_row_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submissioninfo',
+            name='mode',
+            field=models.CharField(default='insert', max_length=10),
+        ),
+        migrations.RunPython(mark_merge_submissions, migrations.RunPython.noop),
+    ]
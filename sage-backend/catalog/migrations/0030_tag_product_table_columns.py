@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+def tag_field_columns(apps, schema_editor):
+    # Renames are detected through the product_field:<id> column comment,
+    # which tables created before it was introduced don't have. Tag their
+    # columns by name (or the lower-cased name unquoted columns were folded to).
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    ProductTableInfo = apps.get_model('catalog', 'ProductTableInfo')
+    ProductField = apps.get_model('catalog', 'ProductField')
+    existing = set(schema_editor.connection.introspection.table_names())
+    with schema_editor.connection.cursor() as cursor:
+        for product_id, table_name in ProductTableInfo.objects.values_list('product_id', 'table_name'):
+            if table_name not in existing:
+                continue
+            cursor.execute("""
+                SELECT a.attname, col_description(a.attrelid, a.attnum)
+                FROM pg_attribute a
+                WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+            """, [table_name])
+            comments = dict(cursor.fetchall())
+            for field_id, name in ProductField.objects.filter(product_id=product_id).values_list('id', 'name'):
+                folded = name if ' ' in name or any(c in name for c in [';', '"', "'"]) else name.lower()
+                column = next((c for c in (name, folded) if c in comments), None)
+                if column is None or comments[column]:
+                    continue
+                quoted = '"{}"'.format(column.replace('"', '""'))
+                cursor.execute(f"COMMENT ON COLUMN {table_name}.{quoted} IS 'product_field:{field_id}'")
+                comments[column] = f'product_field:{field_id}'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0029_submissioninfo_mode'),
+    ]
+
+    operations = [
+        migrations.RunPython(tag_field_columns, migrations.RunPython.noop),
+    ]
@@ -106,6 +106,7 @@ class ProductField(models.Model):
     length = models.PositiveIntegerField(null=True, blank=True, help_text="Length of the field if applicable")
     is_null = models.BooleanField(default=True)
     is_primary_key = models.BooleanField(default=False)
+    is_filterable = models.BooleanField(default=False, help_text="Index the column for filtering and sorting")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='product_fields')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -154,6 +155,7 @@ class UploadedFile(models.Model):
     domain = models.CharField(max_length=255, null=True)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the file
 
 
 class SubmissionInfo(models.Model):
@@ -167,6 +169,9 @@ class SubmissionInfo(models.Model):
     submission_time = models.DateTimeField(default=timezone.now)
     submitted_data = models.JSONField()
     submission_type = models.CharField(max_length=255, null=True, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the uploaded file
+    # 'insert' or 'merge'; merged rows that already existed can't be rolled back
+    mode = models.CharField(max_length=10, default='insert')
 
     class Meta:
         ordering = ['-submission_time']
@@ -195,8 +200,31 @@ class ProductTableInfo(models.Model):
         on_delete=models.CASCADE, 
         related_name='product_table_info'
     )  # Enforces one-to-one relationship
+    INTERVAL_CHOICES = [
+        ('day', 'Daily'),
+        ('month', 'Monthly'),
+        ('year', 'Yearly'),
+    ]
+    RETENTION_DETACH = 'detach'
+    RETENTION_DROP = 'drop'
+    RETENTION_ACTION_CHOICES = [
+        (RETENTION_DETACH, 'Detach'),
+        (RETENTION_DROP, 'Drop'),
+    ]
+
     table_name = models.CharField(max_length=255)
     fields = models.JSONField(default=list, blank=True)  # List of fields in the table
+    # Range partitioning (python manage.py partition_product_table); blank key = not partitioned
+    partition_key = models.CharField(max_length=255, blank=True)
+    partition_interval = models.CharField(max_length=10, choices=INTERVAL_CHOICES, default='month')
+    partitions_ahead = models.PositiveIntegerField(default=2)
+    retention_intervals = models.PositiveIntegerField(null=True, blank=True)  # None keeps everything
+    retention_action = models.CharField(max_length=10, choices=RETENTION_ACTION_CHOICES, default=RETENTION_DETACH)
+    # Bumped whenever DDL runs on the table, so cached table metadata is reloaded (catalog/tables.py)
+    schema_version = models.PositiveIntegerField(default=0)
+    # Exact row count kept up to date by the loaders (catalog/stats.py); null until counted
+    row_count = models.BigIntegerField(null=True, blank=True)
+    last_loaded_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -206,6 +234,103 @@ class ProductTableInfo(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+
+class SubmissionJob(models.Model):
+    """
+    An uploaded Excel file waiting to be validated and loaded into a product's
+    dynamic table by the `process_submission_jobs` worker.
+    The table itself is the queue: workers claim queued jobs with
+    SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    PHASE_QUEUED = 'queued'
+    PHASE_VALIDATING = 'validating'
+    PHASE_LOADING = 'loading'
+    PHASE_NOTIFYING = 'notifying'
+    PHASE_DONE = 'done'
+    PHASE_CHOICES = [
+        (PHASE_QUEUED, 'Queued'),
+        (PHASE_VALIDATING, 'Validating'),
+        (PHASE_LOADING, 'Loading'),
+        (PHASE_NOTIFYING, 'Notifying'),
+        (PHASE_DONE, 'Done'),
+    ]
+
+    MODE_INSERT = 'insert'
+    MODE_MERGE = 'merge'
+    MODE_CHOICES = [
+        (MODE_INSERT, 'Insert'),
+        (MODE_MERGE, 'Merge on primary key'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='submission_jobs')
+    submitted_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='submission_jobs')
+    file = models.FileField(upload_to='submission_jobs/')
+    file_name = models.CharField(max_length=255)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the file
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, default=MODE_INSERT)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    phase = models.CharField(max_length=20, choices=PHASE_CHOICES, default=PHASE_QUEUED)
+    rows_processed = models.PositiveIntegerField(default=0)
+    rows_loaded = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=dict, blank=True)  # ValidationReport.as_dict()
+    message = models.TextField(blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    submission = models.ForeignKey(SubmissionInfo, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Submission job {self.id} for {self.product.schema_name} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='catalog_job_queue_idx'),
+        ]
+
+class ProductSummary(models.Model):
+    """
+    A materialized GROUP BY over a product's dynamic table that the
+    aggregate endpoint reads instead of scanning the table, refreshed every
+    `refresh_minutes` by the RefreshProductSummariesCronJob.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='summaries')
+    name = models.CharField(max_length=255)
+    group_by = models.JSONField(default=list, blank=True)  # e.g. ["color", "sold_on:month"]
+    metrics = models.JSONField(default=list)  # e.g. ["count", "sum:qty"]
+    refresh_minutes = models.PositiveIntegerField(default=60)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def table_name(self):
+        return f"product_{self.product_id}"
+
+    @property
+    def view_name(self):
+        return f"product_{self.product_id}_summary_{self.id}"
+
+    def __str__(self):
+        return f"Summary {self.name} for {self.product.schema_name}"
+
+    class Meta:
+        ordering = ['name']
+
+
 # from django.db import models
 
 #
@@ -0,0 +1,250 @@
+import datetime
+import logging
+import re
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .bulk_load import quote_column
+from .aggregates import create_summary_view, drop_summary_view
+from .indexes import reconcile_indexes
+from .lineage import LOADED_AT_COLUMN, ensure_lineage_columns
+from .schema import get_product_schema
+from .stats import subtract_estimated_rows
+from .tables import is_partitioned, table_changed, table_constraints
+
+logger = logging.getLogger(__name__)
+
+LOAD_TIMESTAMP_COLUMN = LOADED_AT_COLUMN
+INTERVALS = ('day', 'month', 'year')
+BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def interval_start(value, interval):
+    """First day of the day/month/year containing `value`."""
+    value = value.date() if isinstance(value, datetime.datetime) else value
+    if interval == 'year':
+        return value.replace(month=1, day=1)
+    if interval == 'month':
+        return value.replace(day=1)
+    return value
+
+
+def next_interval(start, interval, steps=1):
+    if interval == 'day':
+        return start + datetime.timedelta(days=steps)
+    months = steps * (12 if interval == 'year' else 1)
+    month = start.month - 1 + months
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def partition_name(table_name, start, interval):
+    fmt = {'day': '%Y%m%d', 'month': '%Y%m', 'year': '%Y'}[interval]
+    return f'{table_name}_p{start.strftime(fmt)}'
+
+
+def default_partition_name(table_name):
+    return f'{table_name}_pdefault'
+
+
+def list_partitions(cursor, table_name):
+    """Return [(name, start, end)] for the range partitions, oldest first."""
+    cursor.execute("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits inh
+        JOIN pg_class parent ON parent.oid = inh.inhparent
+        JOIN pg_class child ON child.oid = inh.inhrelid
+        WHERE parent.relname = %s AND parent.relnamespace = current_schema()::regnamespace
+    """, [table_name])
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = BOUND_RE.search(bound or '')
+        if match:
+            start, end = (datetime.date.fromisoformat(value[:10]) for value in match.groups())
+            partitions.append((name, start, end))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(cursor, table_name, key, start, interval):
+    """
+    Add the partition for [start, next interval). Rows of that range that
+    ended up in the default partition are moved into it first, otherwise
+    PostgreSQL refuses to add the partition.
+    """
+    name = partition_name(table_name, start, interval)
+    end = next_interval(start, interval)
+    default = default_partition_name(table_name)
+    column = quote_column(key)
+    cursor.execute(
+        f'SELECT EXISTS (SELECT 1 FROM {default} WHERE {column} >= %s AND {column} < %s)', [start, end]
+    )
+    if not cursor.fetchone()[0]:
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF {table_name} FOR VALUES FROM ('{start}') TO ('{end}')"
+        )
+        return name
+
+    cursor.execute(f'CREATE TABLE {name} (LIKE {table_name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(f"""
+        WITH moved AS (
+            DELETE FROM {default} WHERE {column} >= %s AND {column} < %s RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, [start, end])
+    cursor.execute(f"ALTER TABLE {table_name} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+    return name
+
+
+def validate_partition_key(product_table, key):
+    """
+    The key must be the load timestamp or a required date/datetime field.
+    Products with primary key or unique fields can't use the load timestamp:
+    every load gets a new one, so a key extended with it never conflicts.
+    """
+    if key == LOAD_TIMESTAMP_COLUMN:
+        keyed = list(product_table.product.product_fields.filter(
+            Q(is_primary_key=True) | Q(validation_rule__is_unique=True)
+        ).values_list('name', flat=True))
+        if keyed:
+            raise ValueError(
+                f"Can't partition on {LOAD_TIMESTAMP_COLUMN}: primary key or unique fields "
+                f"({', '.join(keyed)}) would no longer be enforced"
+            )
+        return
+    field = product_table.product.product_fields.filter(name=key).first()
+    if field is None:
+        raise ValueError(f'Unknown field: {key}')
+    if field.field_type not in ('date', 'datetime'):
+        raise ValueError(f'Partition key {key} must be a date or datetime field')
+    if field.is_null:
+        raise ValueError(f'Partition key {key} must be a required field')
+
+
+def partition_table(product_table, key, interval='month', ahead=None, retention=None,
+                    retention_action='detach'):
+    """
+    Turn an existing dynamic table into a table range partitioned on `key`,
+    in one transaction: the table is renamed aside, a partitioned table
+    with the same columns and CHECK constraints takes its name, partitions
+    are created for the data's date range (plus `ahead` future intervals
+    and a default partition for anything else), the rows are copied over
+    and the old table dropped.
+
+    PostgreSQL only enforces uniqueness within a partition, so the primary
+    key and UNIQUE constraints are rebuilt with the partition key added;
+    uploads are still checked against the declared keys while staging.
+    Merge mode isn't available on a partitioned table, as no constraint
+    covers exactly the primary key fields any more.
+    Materialized summaries are recreated on the new table, and the lineage
+    and managed indexes rebuilt.
+    """
+    if interval not in INTERVALS:
+        raise ValueError(f"Interval must be one of: {', '.join(INTERVALS)}")
+    validate_partition_key(product_table, key)
+    ahead = settings.DYNAMIC_TABLE_PARTITIONS_AHEAD if ahead is None else ahead
+    table_name = product_table.table_name
+    old_name = f'{table_name}_unpartitioned'
+    column = quote_column(key)
+    summaries = list(product_table.product.summaries.all())
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if is_partitioned(cursor, table_name):
+            raise ValueError(f'{table_name} is already partitioned')
+
+        constraints = [
+            (name, kind, columns) for name, kind, _, columns in table_constraints(cursor, table_name)
+            if kind in ('p', 'u')
+        ]
+        for summary in summaries:
+            drop_summary_view(summary)
+
+        cursor.execute(f'ALTER TABLE {table_name} RENAME TO {old_name}')
+        if key == LOAD_TIMESTAMP_COLUMN:
+            cursor.execute(
+                f'ALTER TABLE {old_name} ADD COLUMN IF NOT EXISTS {column} TIMESTAMPTZ NOT NULL DEFAULT now()'
+            )
+        cursor.execute(
+            f'CREATE TABLE {table_name} (LIKE {old_name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING COMMENTS) '
+            f'PARTITION BY RANGE ({column})'
+        )
+        cursor.execute(f'CREATE TABLE {default_partition_name(table_name)} PARTITION OF {table_name} DEFAULT')
+
+        cursor.execute(f'SELECT min({column}) FROM {old_name}')
+        oldest = cursor.fetchone()[0]
+        current = interval_start(timezone.now(), interval)
+        earliest = next_interval(current, interval, -settings.DYNAMIC_TABLE_MAX_PARTITIONS)
+        start = max(interval_start(oldest, interval), earliest) if oldest else current
+        last = next_interval(current, interval, ahead)
+        while start <= last:
+            create_partition(cursor, table_name, key, start, interval)
+            start = next_interval(start, interval)
+
+        cursor.execute(f'INSERT INTO {table_name} SELECT * FROM {old_name}')
+        cursor.execute(f'DROP TABLE {old_name}')
+        # LIKE doesn't copy indexes; the lineage ones went with the old table
+        ensure_lineage_columns(table_name)
+
+        for name, kind, columns in constraints:
+            columns = columns if key in columns else columns + [key]
+            definition = 'PRIMARY KEY' if kind == 'p' else 'UNIQUE'
+            cursor.execute(
+                f'ALTER TABLE {table_name} ADD CONSTRAINT "{name}" {definition} '
+                f"({', '.join(quote_column(c) for c in columns)})"
+            )
+
+        product_table.partition_key = key
+        product_table.partition_interval = interval
+        product_table.partitions_ahead = ahead
+        product_table.retention_intervals = retention
+        product_table.retention_action = retention_action
+        product_table.save(update_fields=[
+            'partition_key', 'partition_interval', 'partitions_ahead', 'retention_intervals', 'retention_action'
+        ])
+        table_changed(table_name)
+
+        reconcile_indexes(table_name, product_table.product.product_fields.all())
+        schema = get_product_schema(product_table.product_id)
+        for summary in summaries:
+            create_summary_view(summary, schema)
+
+    logger.info("Partitioned %s by %s on %s", table_name, interval, key)
+
+
+def maintain_partitions(product_table, today=None):
+    """
+    Create the partitions for the next `partitions_ahead` intervals and apply
+    the retention policy: partitions entirely older than the last
+    `retention_intervals` intervals are detached (kept as standalone
+    tables) or dropped. Returns (created, expired) partition names.
+    """
+    if not product_table.partition_key:
+        return [], []
+    table_name = product_table.table_name
+    interval = product_table.partition_interval
+    current = interval_start(today or timezone.localdate(), interval)
+    created, expired = [], []
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        existing = {start for _, start, _ in list_partitions(cursor, table_name)}
+        start = current
+        last = next_interval(current, interval, product_table.partitions_ahead)
+        while start <= last:
+            if start not in existing:
+                created.append(create_partition(cursor, table_name, product_table.partition_key, start, interval))
+            start = next_interval(start, interval)
+
+        if product_table.retention_intervals:
+            cutoff = next_interval(current, interval, 1 - product_table.retention_intervals)
+            expired = [name for name, _, end in list_partitions(cursor, table_name) if end <= cutoff]
+            if expired:
+                # Their rows leave the table's maintained count; counting them would read every one
+                subtract_estimated_rows(table_name, expired)
+            for name in expired:
+                cursor.execute(f'ALTER TABLE {table_name} DETACH PARTITION {name}')
+                if product_table.retention_action == 'drop':
+                    cursor.execute(f'DROP TABLE {name}')
+
+    if created or expired:
+        logger.info("Partitions of %s: created %s, %s %s", table_name, created,
+                    'dropped' if product_table.retention_action == 'drop' else 'detached', expired)
+    return created, expired
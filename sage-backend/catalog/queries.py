@@ -0,0 +1,268 @@
+import base64
+import datetime
+import json
+from decimal import Decimal
+from django.conf import settings
+from .bulk_load import quote_column
+from .lineage import SUBMISSION_COLUMN
+
+FILTER_OPERATORS = {
+    'eq': '=',
+    'ne': '<>',
+    'lt': '<',
+    'lte': '<=',
+    'gt': '>',
+    'gte': '>=',
+}
+RANGE_OPERATORS = ('lt', 'lte', 'gt', 'gte')
+RESERVED_PARAMS = (
+    'fields', 'sort', 'limit', 'cursor', 'format', 'file_format', 'gzip', 'group_by', 'metrics', 'summary'
+)
+ROW_ID = 'ctid'
+
+
+class QueryError(ValueError):
+    """Invalid projection, filter, sort or cursor in a table query."""
+
+
+def json_value(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(sort, values):
+    payload = json.dumps({'s': sort, 'v': [json_value(value) for value in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return payload['s'], payload['v']
+    except (ValueError, KeyError, TypeError):
+        raise QueryError('Invalid cursor')
+
+
+class TableQuery:
+    """
+    Read query over a dynamic product table built from request parameters.
+
+    - `fields=a,b` projects columns (default: every product field)
+    - `<field>=v` or `<field>__<op>=v` filters, with op one of eq, ne, lt,
+      lte, gt, gte, in (comma separated) and isnull (true/false); values
+      are converted with the field's type like uploaded cells are
+    - `submission=<id>` keeps the rows written by one submission
+    - `sort=a,-b` orders by non-nullable fields; the primary key (or the
+      row's ctid when the table has none) is always appended so the order
+      is total
+
+    Pages are fetched with keyset pagination: the cursor holds the sort
+    values of the last row returned and the next page starts strictly
+    after them, so every page costs the same however deep it is.
+    """
+
+    def __init__(self, table_name, schema, params=None):
+        self.table_name = table_name
+        self.schema = schema
+        params = params or {}
+
+        self.columns = self._parse_fields(params.get('fields'))
+        self.filter_fields = set()
+        self.filters, self.filter_params = self._parse_filters(params)
+        self.sort = self._parse_sort(params.get('sort'))
+
+    def _field(self, name):
+        field = self.schema.by_name.get(name)
+        if field is None:
+            raise QueryError(f'Unknown field: {name}')
+        return field
+
+    def _parse_fields(self, value):
+        if not value:
+            return list(self.schema.field_names)
+        columns = [name.strip() for name in value.split(',') if name.strip()]
+        for name in columns:
+            self._field(name)
+        return columns
+
+    def _convert(self, field, raw):
+        value = field.convert(raw)
+        if value is None and field.field_type in ('date', 'datetime'):
+            # ISO dates are accepted whatever the field's upload format
+            try:
+                value = datetime.datetime.fromisoformat(str(raw))
+                value = value.date() if field.field_type == 'date' else value
+            except ValueError:
+                value = None
+        if value is None:
+            raise QueryError(f'Invalid value for {field.name}: {raw}')
+        return value
+
+    def _parse_filters(self, params):
+        clauses, values = [], []
+        for key in params:
+            if key in RESERVED_PARAMS:
+                continue
+            if key == 'submission':
+                try:
+                    values.append(int(params[key]))
+                except (TypeError, ValueError):
+                    raise QueryError(f'Invalid submission id: {params[key]}')
+                clauses.append(f'{SUBMISSION_COLUMN} = %s')
+                self.filter_fields.add(SUBMISSION_COLUMN)
+                continue
+            name, _, operator = key.partition('__')
+            operator = operator or 'eq'
+            field = self._field(name)
+            column = quote_column(name)
+            self.filter_fields.add(name)
+            raw_values = params.getlist(key) if hasattr(params, 'getlist') else [params[key]]
+
+            for raw in raw_values:
+                if operator == 'isnull':
+                    clauses.append(f"{column} IS {'' if str(raw).lower() in ('true', '1') else 'NOT '}NULL")
+                elif operator == 'in':
+                    items = [self._convert(field, item.strip()) for item in str(raw).split(',') if item.strip()]
+                    if not items:
+                        raise QueryError(f'Empty list for {key}')
+                    clauses.append(f"{column} IN ({', '.join(['%s'] * len(items))})")
+                    values.extend(items)
+                elif operator in FILTER_OPERATORS:
+                    if operator in RANGE_OPERATORS and field.field_type == 'boolean':
+                        raise QueryError(f'Range filters are not supported on boolean field {name}')
+                    clauses.append(f'{column} {FILTER_OPERATORS[operator]} %s')
+                    values.append(self._convert(field, raw))
+                else:
+                    raise QueryError(f'Unknown filter operator: {operator}')
+        return clauses, values
+
+    def _parse_sort(self, value):
+        sort = []
+        for item in (value or '').split(','):
+            item = item.strip()
+            if not item:
+                continue
+            descending = item.startswith('-')
+            name = item.lstrip('-')
+            field = self._field(name)
+            if field.spec.is_null and not field.spec.is_primary_key:
+                # NULLs can't be compared, so they would break the keyset
+                raise QueryError(f'Cannot sort on nullable field {name}')
+            if name not in [column for column, _ in sort]:
+                sort.append((name, descending))
+
+        tiebreak = self.schema.primary_key or [ROW_ID]
+        for name in tiebreak:
+            if name not in [column for column, _ in sort]:
+                sort.append((name, sort[-1][1] if sort else False))
+        return sort
+
+    def _sort_expression(self, name):
+        return ROW_ID if name == ROW_ID else quote_column(name)
+
+    def _decode_values(self, cursor):
+        sort, raw_values = decode_cursor(cursor)
+        if sort != [[name, descending] for name, descending in self.sort] or len(raw_values) != len(self.sort):
+            raise QueryError('Cursor does not match the requested sort')
+        values = []
+        for (name, _), raw in zip(self.sort, raw_values):
+            if name == ROW_ID:
+                values.append(raw)
+            elif raw is None:
+                raise QueryError('Invalid cursor')
+            else:
+                values.append(self._convert(self._field(name), raw))
+        return values
+
+    def _keyset_clause(self, values):
+        """Rows strictly after `values` in sort order."""
+        expressions = [self._sort_expression(name) for name, _ in self.sort]
+        casts = ['::tid' if name == ROW_ID else '' for name, _ in self.sort]
+        directions = {descending for _, descending in self.sort}
+
+        if len(directions) == 1:
+            # A single row comparison can use a matching index
+            operator = '<' if directions.pop() else '>'
+            placeholders = ', '.join(f'%s{cast}' for cast in casts)
+            return f"({', '.join(expressions)}) {operator} ({placeholders})", list(values)
+
+        # Mixed directions: (a > x) OR (a = x AND b < y) OR ...
+        clauses, params = [], []
+        for index, (_, descending) in enumerate(self.sort):
+            parts = []
+            for previous in range(index):
+                parts.append(f'{expressions[previous]} = %s{casts[previous]}')
+                params.append(values[previous])
+            parts.append(f"{expressions[index]} {'<' if descending else '>'} %s{casts[index]}")
+            params.append(values[index])
+            clauses.append('(' + ' AND '.join(parts) + ')')
+        return '(' + ' OR '.join(clauses) + ')', params
+
+    @property
+    def extra_sort_columns(self):
+        """Sort keys selected after the projection to build the next cursor."""
+        return [name for name, _ in self.sort if name == ROW_ID or name not in self.columns]
+
+    def select_sql(self, cursor=None, limit=None, ordered=True):
+        """
+        Return (sql, params) selecting the projected columns, then any extra
+        sort keys. With `ordered=False` only the projection is selected and
+        rows come back in whatever order the scan produces them.
+        """
+        select = [quote_column(column) for column in self.columns]
+        if ordered:
+            # The alias keeps ORDER BY ctid on the tid rather than this text copy
+            select += [
+                f'{ROW_ID}::text AS _row_id' if name == ROW_ID else quote_column(name)
+                for name in self.extra_sort_columns
+            ]
+
+        where = list(self.filters)
+        params = list(self.filter_params)
+        if cursor:
+            clause, cursor_params = self._keyset_clause(self._decode_values(cursor))
+            where.append(clause)
+            params.extend(cursor_params)
+
+        sql = f"SELECT {', '.join(select)} FROM {self.table_name}"
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        if ordered:
+            sql += ' ORDER BY ' + ', '.join(
+                f"{self._sort_expression(name)}{' DESC' if descending else ''}" for name, descending in self.sort
+            )
+        if limit:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        return sql, params
+
+    def page(self, connection, cursor=None, limit=None):
+        """
+        Fetch one page. Returns (rows as dicts of the projected columns,
+        cursor for the next page or None on the last page).
+        """
+        limit = min(limit or settings.DYNAMIC_TABLE_PAGE_SIZE, settings.DYNAMIC_TABLE_MAX_PAGE_SIZE)
+        sql, params = self.select_sql(cursor=cursor, limit=limit + 1)
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(sql, params)
+            fetched = db_cursor.fetchall()
+
+        width = len(self.columns)
+        extra = self.extra_sort_columns
+        positions = [
+            width + extra.index(name) if name in extra else self.columns.index(name)
+            for name, _ in self.sort
+        ]
+        next_cursor = None
+        if len(fetched) > limit:
+            fetched = fetched[:limit]
+            next_cursor = encode_cursor(
+                [[name, descending] for name, descending in self.sort],
+                [fetched[-1][position] for position in positions]
+            )
+        rows = [dict(zip(self.columns, row[:width])) for row in fetched]
+        return rows, next_cursor
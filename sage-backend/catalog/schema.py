@@ -0,0 +1,353 @@
+import datetime
+import re
+import threading
+from decimal import Decimal
+from django.db.models import Count, Max
+from .utils import DATE_INPUT_FORMATS, DATETIME_INPUT_FORMATS
+
+# Date formats offered by ValidationRule.date_format / the Excel template
+DATE_FORMAT_MAP = {
+    'MM/DD/YYYY': '%m/%d/%Y',
+    'DD/MM/YYYY': '%d/%m/%Y',
+    'YYYY-MM-DD': '%Y-%m-%d',
+    'MM-DD-YYYY': '%m-%d-%Y',
+    'DD-MM-YYYY': '%d-%m-%Y',
+}
+
+INTEGER_RE = re.compile(r'[+-]?\d+')
+NUMBER_RE = re.compile(r'[+-]?(?:\d+(?:\.(\d*))?|\.(\d+))(?:[eE][+-]?\d+)?')
+EMAIL_RE = re.compile(r'\S+@\S+\.\S+')
+
+TRUE_VALUES = frozenset(['true', '1', 't', 'y', 'yes'])
+FALSE_VALUES = frozenset(['false', '0', 'f', 'n', 'no'])
+
+
+def is_blank(value):
+    if value is None:
+        return True
+    if isinstance(value, float):
+        return value != value  # NaN
+    return isinstance(value, str) and not value.strip()
+
+
+def cell_text(value):
+    """
+    Normalise a spreadsheet/JSON cell to the text the checks run against.
+    Integral floats (Excel stores every number as a float) lose their '.0'.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def decimal_places(text):
+    """Number of digits after the decimal point of a NUMBER_RE match."""
+    match = NUMBER_RE.fullmatch(text)
+    if not match:
+        return 0
+    return len(match.group(1) or match.group(2) or '')
+
+
+def parse_temporal(text, formats):
+    for fmt in formats:
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+class FieldSpec:
+    """
+    Plain snapshot of a ProductField and its ValidationRule.
+    Holds no model instances, so schemas can be pickled to worker processes.
+    """
+
+    def __init__(self, field):
+        rule = getattr(field, 'validation_rule', None)
+        self.id = field.id
+        self.name = field.name
+        self.field_type = field.field_type
+        self.length = field.length
+        self.is_null = field.is_null
+        self.is_primary_key = field.is_primary_key
+        self.is_unique = bool(rule and rule.is_unique)
+        self.min_value = rule.min_value if rule else None
+        self.max_value = rule.max_value if rule else None
+        self.max_decimal_places = rule.max_decimal_places if rule else None
+        self.is_email_format = bool(rule and rule.is_email_format)
+        self.picklist = None
+        if rule and rule.is_picklist and rule.picklist_values:
+            self.picklist = tuple(value.strip() for value in rule.picklist_values.split(','))
+
+        self.date_format = rule.date_format if rule else None
+        if self.field_type == 'date' and self.date_format in DATE_FORMAT_MAP:
+            self.temporal_formats = (DATE_FORMAT_MAP[self.date_format],)
+        elif self.field_type == 'date':
+            self.temporal_formats = tuple(DATE_INPUT_FORMATS)
+        elif self.field_type == 'datetime':
+            self.temporal_formats = tuple(DATETIME_INPUT_FORMATS)
+        else:
+            self.temporal_formats = ()
+
+    @property
+    def date_format_label(self):
+        return self.date_format or 'YYYY-MM-DD, MM/DD/YYYY or DD/MM/YYYY'
+
+
+def build_converter(spec):
+    """Return a function converting a raw cell to the column's Python value."""
+    field_type = spec.field_type
+
+    if field_type == 'int':
+        def convert(value):
+            text = cell_text(value)
+            return int(text) if INTEGER_RE.fullmatch(text) else None
+
+    elif field_type in ('float', 'decimal'):
+        number = float if field_type == 'float' else Decimal
+
+        def convert(value):
+            text = cell_text(value)
+            return number(text) if NUMBER_RE.fullmatch(text) else None
+
+    elif field_type == 'boolean':
+        def convert(value):
+            text = cell_text(value).lower()
+            if text in TRUE_VALUES:
+                return True
+            if text in FALSE_VALUES:
+                return False
+            return None
+
+    elif field_type in ('date', 'datetime'):
+        formats = spec.temporal_formats
+        as_date = field_type == 'date'
+
+        def convert(value):
+            if isinstance(value, datetime.datetime):
+                return value.date() if as_date else value
+            if isinstance(value, datetime.date):
+                return value if as_date else datetime.datetime.combine(value, datetime.time())
+            if is_blank(value):
+                return None
+            parsed = parse_temporal(cell_text(value), formats)
+            if parsed is None:
+                return None
+            return parsed.date() if as_date else parsed
+
+    else:
+        def convert(value):
+            return str(value) if value is not None else None
+
+    return convert
+
+
+def build_checks(spec):
+    """
+    Return the list of checks for a column. Each check takes a non-blank cell
+    value and returns an error message, or None when the value passes.
+    """
+    checks = []
+    field_type = spec.field_type
+
+    if field_type == 'int':
+        checks.append(lambda value: None if INTEGER_RE.fullmatch(cell_text(value)) else 'Must be an integer')
+    elif field_type == 'float':
+        checks.append(lambda value: None if NUMBER_RE.fullmatch(cell_text(value)) else 'Must be a number')
+    elif field_type == 'decimal':
+        checks.append(lambda value: None if NUMBER_RE.fullmatch(cell_text(value)) else 'Must be a valid decimal number')
+    elif field_type in ('date', 'datetime'):
+        formats = spec.temporal_formats
+        message = (
+            f'Invalid date format. Date format must be: {spec.date_format_label}'
+            if field_type == 'date' else 'Invalid datetime format'
+        )
+
+        def check_temporal(value):
+            if isinstance(value, datetime.date):
+                return None
+            return None if parse_temporal(cell_text(value), formats) else message
+        checks.append(check_temporal)
+    elif field_type == 'boolean':
+        checks.append(
+            lambda value: None if cell_text(value).lower() in TRUE_VALUES | FALSE_VALUES
+            else 'Must be true/false, yes/no or 0/1'
+        )
+
+    if field_type in ('int', 'float', 'decimal'):
+        def as_number(value):
+            text = cell_text(value)
+            return float(text) if NUMBER_RE.fullmatch(text) else None
+
+        if spec.min_value is not None:
+            min_value = spec.min_value
+
+            def check_min(value):
+                number = as_number(value)
+                return f'Value must be >= {min_value}' if number is not None and number < min_value else None
+            checks.append(check_min)
+
+        if spec.max_value is not None:
+            max_value = spec.max_value
+
+            def check_max(value):
+                number = as_number(value)
+                return f'Value must be <= {max_value}' if number is not None and number > max_value else None
+            checks.append(check_max)
+
+    if field_type == 'decimal' and spec.max_decimal_places is not None:
+        places = spec.max_decimal_places
+        checks.append(
+            lambda value: f'Maximum {places} decimal places allowed'
+            if decimal_places(cell_text(value)) > places else None
+        )
+
+    if field_type in ('varchar', 'text'):
+        if spec.length:
+            length = spec.length
+            checks.append(
+                lambda value: f'Exceeds maximum length of {length}' if len(str(value)) > length else None
+            )
+        if spec.is_email_format:
+            checks.append(lambda value: None if EMAIL_RE.match(cell_text(value)) else 'Invalid email format')
+
+    if spec.picklist:
+        allowed = frozenset(spec.picklist)
+        message = f"Value must be one of: {', '.join(spec.picklist)}"
+        checks.append(lambda value: None if cell_text(value) in allowed else message)
+
+    return checks
+
+
+class CompiledField:
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec.name
+        self.field_type = spec.field_type
+        self.convert = build_converter(spec)
+        self.checks = build_checks(spec)
+
+    def validate(self, value):
+        """Return the list of error messages for one cell."""
+        if is_blank(value):
+            return [] if self.spec.is_null else ['This field is required']
+        errors = []
+        for check in self.checks:
+            try:
+                message = check(value)
+            except Exception as e:
+                message = str(e)
+            if message:
+                errors.append(message)
+        return errors
+
+
+class CompiledProductSchema:
+    """
+    Converters and validation checks for every column of a product's dynamic
+    table, built once from ProductField + ValidationRule so that converting or
+    validating rows doesn't touch the database.
+    """
+
+    def __init__(self, product_id, specs, stamp=None):
+        self.product_id = product_id
+        self.specs = list(specs)
+        self.stamp = stamp
+        self.fields = [CompiledField(spec) for spec in self.specs]
+        self.field_names = [field.name for field in self.fields]
+        self.by_name = {field.name: field for field in self.fields}
+        self.primary_key = [spec.name for spec in self.specs if spec.is_primary_key]
+        # Declared uniqueness: the primary key, then each unique field
+        self.unique_keys = [self.primary_key] if self.primary_key else []
+        self.unique_keys += [[spec.name] for spec in self.specs if spec.is_unique and [spec.name] != self.primary_key]
+
+    def __getstate__(self):
+        # Closures can't be pickled; rebuild them from the specs instead
+        return {'product_id': self.product_id, 'specs': self.specs, 'stamp': self.stamp}
+
+    def __setstate__(self, state):
+        self.__init__(state['product_id'], state['specs'], state['stamp'])
+
+    def convert_row(self, values):
+        """Convert cells given in field order."""
+        return [field.convert(value) for field, value in zip(self.fields, values)]
+
+    def validate_rows(self, headers, rows, start_row=1, max_errors=None):
+        """
+        Validate rows given as lists aligned with `headers`.
+        Returns errors in the {'row', 'field', 'error'} format, ordered by row
+        and then by field. Scanning stops once `max_errors` errors are found.
+        """
+        positions = {}
+        for index, header in enumerate(headers):
+            positions.setdefault(header, index)
+        columns = [(field, positions.get(field.name)) for field in self.fields]
+
+        errors = []
+        for row_index, row in enumerate(rows, start=start_row):
+            row_length = len(row)
+            for field, index in columns:
+                value = row[index] if index is not None and index < row_length else None
+                for message in field.validate(value):
+                    errors.append({'row': row_index, 'field': field.name, 'error': message})
+            if max_errors and len(errors) >= max_errors:
+                return errors[:max_errors]
+        return errors
+
+
+_schema_cache = {}
+_schema_lock = threading.Lock()
+
+
+def _schema_stamp(product_id):
+    from .models import ProductField
+
+    return tuple(sorted(ProductField.objects.filter(product_id=product_id).aggregate(
+        fields=Count('id'),
+        fields_updated=Max('updated_at'),
+        rules=Count('validation_rule'),
+        rules_updated=Max('validation_rule__updated_at'),
+    ).items()))
+
+
+def compile_product_schema(product_id, stamp=None):
+    from .models import ProductField
+
+    fields = ProductField.objects.filter(product_id=product_id).select_related('validation_rule')
+    return CompiledProductSchema(product_id, [FieldSpec(field) for field in fields], stamp)
+
+
+def get_product_schema(product_id):
+    """
+    Return the cached compiled schema for a product.
+
+    Entries are dropped by the ProductField/ValidationRule signal handlers in
+    this process; the single stamp query also catches edits made by other
+    worker processes.
+    """
+    stamp = _schema_stamp(product_id)
+    schema = _schema_cache.get(product_id)
+    if schema is not None and schema.stamp == stamp:
+        return schema
+
+    schema = compile_product_schema(product_id, stamp)
+    with _schema_lock:
+        _schema_cache[product_id] = schema
+    return schema
+
+
+def invalidate_product_schema(product_id=None):
+    with _schema_lock:
+        if product_id is None:
+            _schema_cache.clear()
+        else:
+            _schema_cache.pop(product_id, None)
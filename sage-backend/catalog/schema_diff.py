@@ -0,0 +1,416 @@
+import logging
+import re
+from django.conf import settings
+from django.db import connection
+from .aggregates import create_summary_view, drop_summary_view
+from .bulk_load import quote_column
+from .lineage import LINEAGE_COLUMNS
+from .queries import QueryError
+from .schema import get_product_schema
+from .tables import is_partitioned, table_changed
+from .utils import get_sql_field_type
+
+logger = logging.getLogger(__name__)
+
+# Column comment identifying the ProductField behind a column, so a renamed
+# field renames its column instead of dropping it
+FIELD_COMMENT = 'product_field:{}'
+FIELD_COMMENT_RE = re.compile(r'^product_field:(\d+)$')
+# Constraints owned by the catalog form; anything else on the table is left alone
+MANAGED_CONSTRAINT_RE = re.compile(r'^(unique_\d+|check_\d+_(min|max|decimals))$')
+
+# SQL types as format_type() reports them
+CANONICAL_TYPES = {
+    'VARCHAR': 'character varying',
+    'INTEGER': 'integer',
+    'FLOAT': 'double precision',
+    'BOOLEAN': 'boolean',
+    'DATE': 'date',
+    'TIMESTAMP': 'timestamp without time zone',
+    'TEXT': 'text',
+    'DECIMAL': 'numeric',
+}
+
+
+class SchemaChangeError(Exception):
+    """A schema change failed; the table is left as it was before that change."""
+
+
+class SchemaChange:
+    """
+    One step of a schema diff: statements run in order, each committing on
+    its own outside a transaction. If one fails, `rollback` statements undo
+    what the step had already done. `blocked_by_views` marks changes that
+    PostgreSQL refuses while a materialized view uses the column.
+    """
+
+    def __init__(self, description, statements, rollback=(), blocked_by_views=False, renamed=None):
+        self.description = description
+        self.statements = list(statements)
+        self.rollback = list(rollback)
+        self.blocked_by_views = blocked_by_views
+        # (old name, new name) of a renamed column
+        self.renamed = renamed
+
+    def __repr__(self):
+        return f'<SchemaChange: {self.description}>'
+
+
+def field_rule(field):
+    return field.validation_rule if hasattr(field, 'validation_rule') else None
+
+
+def column_type(field):
+    """Full SQL type of a field's column, e.g. VARCHAR(20) or DECIMAL(10, 2)."""
+    sql_type = get_sql_field_type(field)
+    if field.field_type == 'decimal':
+        rule = field_rule(field)
+        scale = rule.max_decimal_places if rule and rule.has_max_decimal and rule.max_decimal_places else 0
+        return f'{sql_type}({field.length or 10}, {scale})'
+    if field.field_type == 'varchar' and field.length:
+        return f'{sql_type}({field.length})'
+    return sql_type
+
+
+def canonical_type(sql_type):
+    base, _, modifier = sql_type.partition('(')
+    canonical = CANONICAL_TYPES.get(base.strip().upper(), base.strip().lower())
+    return f"{canonical}({modifier.replace(' ', '')}" if modifier else canonical
+
+
+def legacy_column_name(name):
+    """Tables were created with unquoted names unless they needed quoting, which folds them to lower case."""
+    if ' ' in name or any(c in name for c in [';', '"', "'"]):
+        return name
+    return name.lower()
+
+
+def desired_constraints(fields, partition_key='', column_names=None):
+    """
+    Managed constraints as {name: (kind, definition)}: 'u' with the unique
+    columns (the partition key added, as partitioned tables require) or 'c'
+    with the CHECK expression. `column_names` maps field ids to column
+    names where they differ from the field name.
+    """
+    constraints = {}
+    for field in fields:
+        rule = field_rule(field)
+        if not rule:
+            continue
+        name = (column_names or {}).get(field.id, field.name)
+        column = quote_column(name)
+        if rule.is_unique:
+            columns = [name] + ([partition_key] if partition_key and partition_key != name else [])
+            constraints[f'unique_{field.id}'] = ('u', columns)
+        if rule.has_min_max:
+            if rule.min_value is not None:
+                constraints[f'check_{field.id}_min'] = ('c', f'{column} >= {rule.min_value}')
+            if rule.max_value is not None:
+                constraints[f'check_{field.id}_max'] = ('c', f'{column} <= {rule.max_value}')
+        if rule.has_max_decimal and field.field_type == 'decimal':
+            constraints[f'check_{field.id}_decimals'] = (
+                'c', f'ROUND({column}, {rule.max_decimal_places}) = {column}'
+            )
+    return constraints
+
+
+def existing_columns(cursor, table_name):
+    """Columns as {name: (type, not null, field id from the comment)}."""
+    cursor.execute("""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod), a.attnotnull, col_description(a.attrelid, a.attnum)
+        FROM pg_attribute a
+        WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+    """, [table_name])
+    columns = {}
+    for name, sql_type, not_null, comment in cursor.fetchall():
+        match = FIELD_COMMENT_RE.match(comment or '')
+        columns[name] = (sql_type, not_null, int(match.group(1)) if match else None)
+    return columns
+
+
+def existing_constraints(cursor, table_name):
+    """CHECK, PRIMARY KEY and UNIQUE constraints as {name: (kind, expression, columns, comment)}."""
+    cursor.execute("""
+        SELECT con.conname, con.contype, pg_get_expr(con.conbin, con.conrelid),
+               ARRAY(
+                   SELECT a.attname::text
+                   FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, position)
+                   JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+                   ORDER BY k.position
+               ),
+               obj_description(con.oid, 'pg_constraint')
+        FROM pg_constraint con
+        WHERE con.conrelid = %s::regclass AND con.contype IN ('c', 'p', 'u')
+    """, [table_name])
+    return {name: (kind, expression, columns, comment) for name, kind, expression, columns, comment in cursor.fetchall()}
+
+
+def constraint_comment(table_name, name, text):
+    escaped = text.replace("'", "''")
+    return f'COMMENT ON CONSTRAINT "{name}" ON {table_name} IS \'{escaped}\''
+
+
+def check_changes(table_name, name, expression, exists):
+    """
+    Add a CHECK without a long lock: ADD ... NOT VALID only takes the lock
+    briefly and checks new rows, VALIDATE CONSTRAINT then scans the existing
+    rows under a lock that lets reads and writes continue. A changed check
+    is built under a temporary name and swapped in once it validated, so a
+    failing validation keeps the old check.
+    """
+    new_name = f'{name}_new' if exists else name
+    statements = [
+        f'ALTER TABLE {table_name} DROP CONSTRAINT IF EXISTS "{new_name}"',
+        f'ALTER TABLE {table_name} ADD CONSTRAINT "{new_name}" CHECK ({expression}) NOT VALID',
+        constraint_comment(table_name, new_name, expression),
+        f'ALTER TABLE {table_name} VALIDATE CONSTRAINT "{new_name}"',
+    ]
+    if exists:
+        statements += [
+            f'ALTER TABLE {table_name} DROP CONSTRAINT "{name}"',
+            f'ALTER TABLE {table_name} RENAME CONSTRAINT "{new_name}" TO "{name}"',
+        ]
+    return SchemaChange(
+        f"{'Replace' if exists else 'Add'} check {name}: {expression}",
+        statements,
+        rollback=[f'ALTER TABLE {table_name} DROP CONSTRAINT IF EXISTS "{new_name}"'],
+    )
+
+
+def plan_schema_changes(table_name, fields, partition_key=''):
+    """
+    Compare the fields' columns and validation rules with the table in the
+    database and return the SchemaChanges that bring the table in line:
+    renamed, dropped, added and retyped columns, nullability, the primary
+    key and the managed UNIQUE/CHECK constraints. Anything already matching
+    produces no statement, so saving an unchanged catalog runs no DDL.
+    """
+    fields = list(fields)
+    changes = []
+    with connection.cursor() as cursor:
+        columns = existing_columns(cursor, table_name)
+        constraints = existing_constraints(cursor, table_name)
+        partitioned = is_partitioned(cursor, table_name)
+    online = not connection.in_atomic_block and not partitioned
+
+    # Map each field to its current column: same name, legacy folded name, or renamed
+    by_field_id = {field_id: name for name, (_, _, field_id) in columns.items() if field_id}
+    matched = {}
+    for field in fields:
+        for candidate in (field.name, legacy_column_name(field.name)):
+            if candidate in columns and candidate not in matched.values():
+                matched[field.id] = candidate
+                break
+        else:
+            old_name = by_field_id.get(field.id)
+            if old_name and old_name not in matched.values() and old_name not in (f.name for f in fields):
+                matched[field.id] = old_name
+                changes.append(SchemaChange(f'Rename column {old_name} to {field.name}', [
+                    f'ALTER TABLE {table_name} RENAME COLUMN {quote_column(old_name)} TO {quote_column(field.name)}'
+                ], renamed=(old_name, field.name)))
+
+    keep = set(matched.values()) | set(LINEAGE_COLUMNS) | ({partition_key} if partition_key else set())
+    unmatched = [field.name for field in fields if field.id not in matched]
+    for name in columns:
+        if name not in keep:
+            if unmatched and columns[name][2] is None:
+                # Without a field tag a rename can't be told apart from a drop and an add
+                raise SchemaChangeError(
+                    f"Column {name} isn't tagged with its field, so it may be the renamed "
+                    f"{', '.join(unmatched)}; save the catalog once without the rename so its columns get tagged"
+                )
+            changes.append(SchemaChange(f'Drop column {name}', [
+                f'ALTER TABLE {table_name} DROP COLUMN {quote_column(name)}'
+            ], blocked_by_views=True))
+
+    # Column each field ends up in: its own name, or the folded name of a legacy column
+    names = {
+        field.id: matched[field.id] if matched.get(field.id) == legacy_column_name(field.name) else field.name
+        for field in fields
+    }
+    primary_key = []
+    for field in fields:
+        column = quote_column(names[field.id])
+        sql_type = column_type(field)
+        if field.is_primary_key:
+            primary_key.append(names[field.id])
+
+        current = matched.get(field.id)
+        if current is None:
+            changes.append(SchemaChange(f'Add column {field.name} {sql_type}', [
+                f"ALTER TABLE {table_name} ADD COLUMN {column} {sql_type}{'' if field.is_null else ' NOT NULL'}",
+                f"COMMENT ON COLUMN {table_name}.{column} IS '{FIELD_COMMENT.format(field.id)}'",
+            ]))
+            continue
+
+        current_type, not_null, field_id = columns[current]
+        if current_type != canonical_type(sql_type):
+            if field.name == partition_key:
+                raise SchemaChangeError(f'Cannot change the type of partition key {field.name}')
+            changes.append(SchemaChange(f'Change type of {field.name} from {current_type} to {sql_type}', [
+                f'ALTER TABLE {table_name} ALTER COLUMN {column} TYPE {sql_type} USING {column}::{sql_type}'
+            ], blocked_by_views=True))
+        if field.is_null and not_null and not field.is_primary_key and field.name != partition_key:
+            changes.append(SchemaChange(f'Make {field.name} nullable', [
+                f'ALTER TABLE {table_name} ALTER COLUMN {column} DROP NOT NULL'
+            ]))
+        elif not field.is_null and not not_null:
+            # SET NOT NULL skips its table scan when a validated CHECK proves it
+            check = f'{table_name}_{field.id}_not_null'
+            changes.append(SchemaChange(f'Make {field.name} required', [
+                f'ALTER TABLE {table_name} ADD CONSTRAINT "{check}" CHECK ({column} IS NOT NULL) NOT VALID',
+                f'ALTER TABLE {table_name} VALIDATE CONSTRAINT "{check}"',
+                f'ALTER TABLE {table_name} ALTER COLUMN {column} SET NOT NULL',
+                f'ALTER TABLE {table_name} DROP CONSTRAINT "{check}"',
+            ], rollback=[f'ALTER TABLE {table_name} DROP CONSTRAINT IF EXISTS "{check}"']))
+        if field_id != field.id:
+            changes.append(SchemaChange(f'Tag column {field.name} with field {field.id}', [
+                f"COMMENT ON COLUMN {table_name}.{column} IS '{FIELD_COMMENT.format(field.id)}'"
+            ]))
+
+    # Primary key, with the partition key added on partitioned tables
+    if primary_key and partition_key and partition_key not in primary_key:
+        primary_key.append(partition_key)
+    current_pk = next(((name, cols) for name, (kind, _, cols, _) in constraints.items() if kind == 'p'), None)
+    if (current_pk[1] if current_pk else []) != primary_key:
+        statements = [f'ALTER TABLE {table_name} DROP CONSTRAINT "{current_pk[0]}"'] if current_pk else []
+        if primary_key:
+            statements.append(
+                f"ALTER TABLE {table_name} ADD PRIMARY KEY ({', '.join(quote_column(c) for c in primary_key)})"
+            )
+        changes.append(SchemaChange(f"Set primary key to ({', '.join(primary_key)})", statements))
+
+    desired = desired_constraints(fields, partition_key, names)
+    for name, (kind, _, _, _) in constraints.items():
+        if MANAGED_CONSTRAINT_RE.match(name) and name not in desired:
+            changes.append(SchemaChange(f'Drop constraint {name}', [
+                f'ALTER TABLE {table_name} DROP CONSTRAINT IF EXISTS "{name}"'
+            ]))
+
+    for name, (kind, definition) in desired.items():
+        current = constraints.get(name)
+        if kind == 'u':
+            if current and current[0] == 'u' and current[2] == definition:
+                continue
+            quoted = ', '.join(quote_column(c) for c in definition)
+            statements = [f'ALTER TABLE {table_name} DROP CONSTRAINT IF EXISTS "{name}"'] if current else []
+            if online:
+                # Build the index without blocking writes, then attach it as the constraint
+                statements += [
+                    f'DROP INDEX IF EXISTS "{name}_idx"',
+                    f'CREATE UNIQUE INDEX CONCURRENTLY "{name}_idx" ON {table_name} ({quoted})',
+                    f'ALTER TABLE {table_name} ADD CONSTRAINT "{name}" UNIQUE USING INDEX "{name}_idx"',
+                ]
+                rollback = [f'DROP INDEX IF EXISTS "{name}_idx"']
+            else:
+                statements.append(f'ALTER TABLE {table_name} ADD CONSTRAINT "{name}" UNIQUE ({quoted})')
+                rollback = []
+            changes.append(SchemaChange(f'Add unique constraint {name} ({quoted})', statements, rollback))
+        else:
+            # Checks are compared with the expression recorded in their comment when they were added
+            if current and current[0] == 'c' and current[3] == definition:
+                continue
+            changes.append(check_changes(table_name, name, definition, exists=bool(current)))
+
+    # Custom validation SQL is opaque: it's rerun when it changes, recorded on
+    # the check_<id>_custom constraint it is expected to create
+    for field in fields:
+        rule = field_rule(field)
+        if not rule or not rule.custom_validation:
+            continue
+        name = f'check_{field.id}_custom'
+        current = constraints.get(name)
+        if current and current[3] == rule.custom_validation:
+            continue
+        changes.append(SchemaChange(f'Apply custom validation of {field.name}', [
+            f'ALTER TABLE {table_name} DROP CONSTRAINT IF EXISTS "{name}"',
+            rule.custom_validation,
+        ]))
+    return changes
+
+
+def apply_schema_changes(table_name, changes):
+    """
+    Run planned SchemaChanges with a lock timeout, so DDL waiting behind a
+    long query fails fast instead of queueing every other query on the
+    table behind it. Raises SchemaChangeError naming the failed step.
+    """
+    if not changes:
+        return []
+    applied = []
+    # Inside a transaction the timeout ends with it, and a failure rolls back everything
+    in_transaction = connection.in_atomic_block
+    with connection.cursor() as cursor:
+        cursor.execute(f"SET {'LOCAL ' if in_transaction else ''}lock_timeout = %s",
+                       [settings.DYNAMIC_TABLE_DDL_LOCK_TIMEOUT])
+        try:
+            for change in changes:
+                try:
+                    for statement in change.statements:
+                        cursor.execute(statement)
+                except Exception as e:
+                    if not in_transaction:
+                        for statement in change.rollback:
+                            cursor.execute(statement)
+                    raise SchemaChangeError(f'{change.description} failed: {e}') from e
+                applied.append(change)
+                logger.info("Schema change on %s: %s", table_name, change.description)
+        finally:
+            if not in_transaction:
+                cursor.execute('RESET lock_timeout')
+    return applied
+
+
+def mark_custom_validations(table_name, fields):
+    """Record applied custom validation SQL on the constraint it created."""
+    with connection.cursor() as cursor:
+        constraints = existing_constraints(cursor, table_name)
+        for field in fields:
+            rule = field_rule(field)
+            name = f'check_{field.id}_custom'
+            if rule and rule.custom_validation and name in constraints:
+                cursor.execute(constraint_comment(table_name, name, rule.custom_validation))
+
+
+def rename_in_specs(specs, renames):
+    """Rewrite `field`, `field:bucket` and `function:field` specs for renamed fields."""
+    rewritten = []
+    for spec in specs:
+        parts = spec.split(':')
+        rewritten.append(':'.join(renames.get(part, part) for part in parts))
+    return rewritten
+
+
+def sync_product_table(table_name, fields, partition_key='', summaries=()):
+    """
+    Plan and apply the changes that bring a dynamic table in line with its
+    fields. Materialized summaries are only dropped when a change needs
+    it, then rebuilt; a summary on a dropped field is deleted.
+    """
+    fields = list(fields)
+    changes = plan_schema_changes(table_name, fields, partition_key)
+    summaries = list(summaries) if any(change.blocked_by_views for change in changes) else []
+    for summary in summaries:
+        drop_summary_view(summary)
+
+    try:
+        applied = apply_schema_changes(table_name, changes)
+    finally:
+        if changes:
+            table_changed(table_name)
+        renames = dict(change.renamed for change in changes if change.renamed)
+        schema = get_product_schema(fields[0].product_id) if summaries and fields else None
+        for summary in summaries:
+            summary.group_by = rename_in_specs(summary.group_by, renames)
+            summary.metrics = rename_in_specs(summary.metrics, renames)
+            try:
+                create_summary_view(summary, schema)
+            except QueryError as e:
+                logger.warning("Deleting summary %s of %s: %s", summary.name, table_name, e)
+                summary.delete()
+                continue
+            summary.save(update_fields=['group_by', 'metrics'])
+
+    mark_custom_validations(table_name, fields)
+    return applied
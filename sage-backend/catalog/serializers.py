@@ -4,7 +4,7 @@ from django.core.files.base import ContentFile
 import base64
 import uuid
 from django.contrib.auth import get_user_model
-from .models import Product, Catalog, ValidationRule, ProductField, UploadedFile
+from .models import Product, Catalog, ValidationRule, ProductField, UploadedFile, SubmissionJob, ProductSummary
 from django.conf import settings
 
 User = get_user_model()
@@ -217,7 +217,7 @@ class UploadedFileSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = UploadedFile
-        fields = ['id', 'catalog', 'catalog_name', 'file', 'domain', 'username', 'uploaded_at']
+        fields = ['id', 'catalog', 'catalog_name', 'file', 'domain', 'username', 'uploaded_at', 'content_hash']
     
     def get_catalog_name(self, obj):
         # Fetch and return the name of the related catalog
@@ -249,7 +249,7 @@ class ProductFieldSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductField
         fields = [
-            'id', 'name', 'field_type', 'length', 'is_null', 'is_primary_key',
+            'id', 'name', 'field_type', 'length', 'is_null', 'is_primary_key', 'is_filterable',
             'product', 'created_at', 'updated_at', 'validation_rule'
         ]
         read_only_fields = ['created_at', 'updated_at']
@@ -284,4 +284,43 @@ class ProductFieldValidationRuleSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ProductField
-        fields = ['name', 'field_type', 'length', 'is_null', 'is_primary_key', 'validation_rule']
\ No newline at end of file
+        fields = ['name', 'field_type', 'length', 'is_null', 'is_primary_key', 'is_filterable', 'validation_rule']
+
+
+class SubmissionJobSerializer(serializers.ModelSerializer):
+    """Status of a background Excel submission job"""
+    submitted_by = serializers.CharField(source='submitted_by.username', read_only=True)
+
+    class Meta:
+        model = SubmissionJob
+        fields = [
+            'id',
+            'product',
+            'submitted_by',
+            'file_name',
+            'content_hash',
+            'mode',
+            'status',
+            'phase',
+            'rows_processed',
+            'rows_loaded',
+            'error_count',
+            'errors',
+            'message',
+            'submission',
+            'created_at',
+            'started_at',
+            'finished_at',
+            'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class ProductSummarySerializer(serializers.ModelSerializer):
+    """Materialized aggregate over a product's dynamic table"""
+    view_name = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = ProductSummary
+        fields = ['id', 'product', 'name', 'group_by', 'metrics', 'refresh_minutes', 'refreshed_at', 'view_name', 'created_at']
+        read_only_fields = ['product', 'refreshed_at', 'created_at']
@@ -0,0 +1,95 @@
+import logging
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+from .models import Alert
+
+logger = logging.getLogger(__name__)
+
+
+class EmailService:
+    @staticmethod
+    def send_validation_error_email(user, product, validation_errors, error_summary=None, truncated=False):
+        """
+        Send email to user about validation errors.
+        When a per-field `error_summary` is given, the email lists it (with
+        its example rows) instead of every error.
+        """
+        try:
+            # Prepare email context
+            context = {
+                'username': user.get_full_name() or user.username,
+                'product_name': product.schema_name,
+                'validation_errors': validation_errors,
+                'error_summary': error_summary,
+                'error_count': len(validation_errors),
+                'truncated': truncated
+            }
+
+            # Render HTML email template
+            html_message = render_to_string('emails/validation_errors.html', context)
+            plain_message = strip_tags(html_message)
+            logger.debug("Sending validation error email for %s to %s", product.schema_name, user.email)
+
+            # Send email
+            send_mail(
+                subject=f'Excel Validation Errors for {product.schema_name}',
+                message=plain_message,
+                from_email=settings.EMAIL_HOST_USER,
+                recipient_list=[user.email],
+                html_message=html_message,
+                fail_silently=False,
+            )
+            return True
+        except Exception as e:
+            logging.error(f"Email sending failed: {str(e)}")
+            return False
+
+    @staticmethod
+    def send_save_error_email(user, product, save_errors):
+        """
+        Send email to user about data save errors
+        """
+        try:
+            # Prepare email context
+            context = {
+                'username': user.get_full_name() or user.username,
+                'product_name': product.schema_name,
+                'save_errors': save_errors
+            }
+
+            # Render HTML email template
+            html_message = render_to_string('emails/save_errors.html', context)
+            plain_message = strip_tags(html_message)
+            logger.debug("Sending save error email for %s to %s", product.schema_name, user.email)
+
+            # Send email
+            send_mail(
+                subject=f'Data Save Errors for {product.schema_name}',
+                message=plain_message,
+                from_email=settings.EMAIL_HOST_USER,
+                recipient_list=[user.email],
+                html_message=html_message,
+                fail_silently=False,
+            )
+            return True
+        except Exception as e:
+            logging.error(f"Email sending failed: {str(e)}")
+            return False
+
+class AlertService:
+    @staticmethod
+    def create_alert(user, message):
+        """
+        Create an alert for the user
+        """
+        try:
+            alert = Alert.objects.create(
+                user=user,
+                message=message
+            )
+            return alert
+        except Exception as e:
+            logging.error(f"Alert creation failed: {str(e)}")
+            return None
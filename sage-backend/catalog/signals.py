@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import ProductField, ValidationRule
+from .schema import invalidate_product_schema
+
+
+@receiver([post_save, post_delete], sender=ProductField)
+def product_field_changed(sender, instance, **kwargs):
+    invalidate_product_schema(instance.product_id)
+
+
+@receiver([post_save, post_delete], sender=ValidationRule)
+def validation_rule_changed(sender, instance, **kwargs):
+    try:
+        product_id = instance.product_field.product_id
+    except ProductField.DoesNotExist:
+        # The field is being deleted along with its rule
+        product_id = None
+    invalidate_product_schema(product_id)
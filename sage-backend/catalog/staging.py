@@ -0,0 +1,304 @@
+import logging
+import time
+import uuid
+from django.db import connection
+from .bulk_load import BulkLoader, quote_column
+from .lineage import LOADED_AT_COLUMN, SUBMISSION_COLUMN
+from .stats import adjust_row_count
+from .tables import get_table_metadata
+from .validation import ValidationReport
+
+logger = logging.getLogger(__name__)
+
+ROW_COLUMN = '_row'
+
+MERGE_PARTITIONED_ERROR = (
+    'Merge mode is not supported on partitioned tables: their primary key includes the partition key'
+)
+
+
+class StagingTable:
+    """
+    Unlogged scratch copy of a dynamic product table.
+
+    Rows are COPYed into the staging table with their row number and
+    without any constraints, so a bad row can't abort the load. `check()`
+    then runs the target's NOT NULL, length, precision, CHECK, PRIMARY KEY
+    and UNIQUE rules as set-based queries, recording each rejected row in a
+    rejects table, and `merge()` moves the accepted rows into the target
+    with a single INSERT ... SELECT. Only the merge needs to run in the
+    caller's transaction, so the target is written to in one short step.
+
+    With `key_columns` (the product's primary key fields) the merge is an
+    upsert instead: INSERT ... ON CONFLICT (keys) DO UPDATE, rewriting an
+    existing row only when one of its values actually changed, so resending
+    a nearly identical file writes (and WAL-logs) just the differences.
+
+    With `unique_keys` (the product's declared keys, as column lists) rows
+    are checked for duplicates on those instead of on the table's PRIMARY
+    KEY and UNIQUE constraints, which on a partitioned table also include
+    the partition key.
+
+    With `replace_submission` (a SubmissionInfo id) the rows that submission
+    wrote are deleted by merge() before the new ones go in, and don't count
+    as conflicts in check().
+
+    Use it as a context manager; both scratch tables are dropped on exit.
+    On databases other than PostgreSQL the rows are kept in memory and
+    inserted into the target by merge() without staging checks.
+    """
+
+    def __init__(self, table_name, columns, key_columns=None, replace_submission=None, unique_keys=None):
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.key_columns = list(key_columns or [])
+        self.unique_keys = [list(key) for key in unique_keys] if unique_keys is not None else None
+        self.replace_submission = replace_submission
+        suffix = uuid.uuid4().hex[:12]
+        self.staging_name = f'{table_name}_stage_{suffix}'
+        self.rejects_name = f'{table_name}_rejects_{suffix}'
+        self.column_sql = ', '.join(quote_column(column) for column in self.columns)
+        self.enabled = connection.vendor == 'postgresql'
+        self.target_columns = {}
+        self.constraints = []
+        self.rows_staged = 0
+        self.rows_rejected = 0
+        self.rows_updated = 0
+        self.rows_unchanged = 0
+        self.rows_deleted = 0
+        self._rows = None
+
+    def __enter__(self):
+        self.create()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.drop()
+
+    def create(self):
+        if not self.enabled:
+            if self.key_columns:
+                raise ValueError('Merging on primary key fields requires PostgreSQL')
+            return
+        metadata = get_table_metadata(self.table_name)
+        if metadata is None:
+            raise ValueError(f'Table {self.table_name} does not exist')
+        with connection.cursor() as cursor:
+            self.target_columns = metadata.columns
+            missing = [column for column in self.columns if column not in self.target_columns]
+            if missing:
+                raise ValueError(f"Columns missing from {self.table_name}: {', '.join(missing)}")
+
+            self.constraints = metadata.constraints
+            if self.key_columns:
+                missing = [column for column in self.key_columns if column not in self.columns]
+                if missing:
+                    raise ValueError(f"Merge key columns are not being loaded: {', '.join(missing)}")
+                # ON CONFLICT needs a unique index on exactly the key columns
+                if not any(kind in ('p', 'u') and set(columns) == set(self.key_columns)
+                           for _, kind, _, columns in self.constraints):
+                    raise ValueError(
+                        f"{self.table_name} has no primary key or unique constraint on "
+                        f"{', '.join(self.key_columns)}"
+                    )
+
+            # Unsized base types, so over-long or out-of-range values are
+            # staged and reported instead of failing the COPY
+            column_defs = ', '.join(
+                f'{quote_column(column)} {self.target_columns[column]["data_type"]}' for column in self.columns
+            )
+            cursor.execute(
+                f'CREATE UNLOGGED TABLE {self.staging_name} ({ROW_COLUMN} INTEGER NOT NULL, {column_defs})'
+            )
+            cursor.execute(
+                f'CREATE UNLOGGED TABLE {self.rejects_name} '
+                f'(seq SERIAL, {ROW_COLUMN} INTEGER NOT NULL, field TEXT, error TEXT)'
+            )
+
+    def drop(self):
+        if not self.enabled:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.staging_name}, {self.rejects_name}')
+
+    def load(self, rows, start_row=1):
+        """Stage rows given in column order; rows are numbered from `start_row`."""
+        if not self.enabled:
+            self._rows = list(rows)
+            self.rows_staged = len(self._rows)
+            return None
+
+        numbered = ([row_number, *row] for row_number, row in enumerate(rows, start=start_row))
+        result = BulkLoader(self.staging_name, [ROW_COLUMN] + self.columns).load(numbered)
+        self.rows_staged = result.rows
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE INDEX ON {self.staging_name} ({ROW_COLUMN})')
+            cursor.execute(f'ANALYZE {self.staging_name}')
+        return result
+
+    def _reject(self, cursor, field, error, row_query, params=None):
+        cursor.execute(
+            f'INSERT INTO {self.rejects_name} ({ROW_COLUMN}, field, error) '
+            f'SELECT {ROW_COLUMN}, %s, %s FROM ({row_query}) AS rejected',
+            [field, error] + list(params or [])
+        )
+
+    def check(self, max_errors=None):
+        """
+        Run the target table's constraints against the staged rows and return
+        the rejected rows as a ValidationReport (capped at `max_errors`).
+
+        When merging, rows matching an existing row on the merge keys are
+        updates rather than conflicts; other unique constraints only reject
+        values held by a different row.
+        """
+        report = ValidationReport(max_errors=max_errors)
+        if not self.enabled:
+            return report
+
+        started = time.monotonic()
+        staging = self.staging_name
+        with connection.cursor() as cursor:
+            for column in self.columns:
+                info = self.target_columns[column]
+                quoted = quote_column(column)
+                if info['not_null']:
+                    self._reject(cursor, column, 'This field is required',
+                                 f'SELECT {ROW_COLUMN} FROM {staging} WHERE {quoted} IS NULL')
+                if info['max_length']:
+                    self._reject(cursor, column, f"Exceeds maximum length of {info['max_length']}",
+                                 f'SELECT {ROW_COLUMN} FROM {staging} WHERE char_length({quoted}) > %s',
+                                 [info['max_length']])
+                if info['data_type'] == 'numeric' and info['precision'] is not None:
+                    precision, scale = info['precision'], info['scale'] or 0
+                    self._reject(cursor, column, f'Value out of range for numeric({precision}, {scale})',
+                                 f'SELECT {ROW_COLUMN} FROM {staging} WHERE abs(round({quoted}, %s)) >= 10 ^ %s',
+                                 [scale, precision - scale])
+
+            for name, kind, expression, key_columns in self.constraints:
+                if kind != 'c' or not key_columns or any(column not in self.columns for column in key_columns):
+                    continue
+                # Like CHECK itself, a NULL result passes
+                self._reject(cursor, ', '.join(key_columns), f'Violates constraint {name}',
+                             f"SELECT {ROW_COLUMN} FROM {staging} WHERE NOT ({expression.replace('%', '%%')})")
+
+            if self.unique_keys is not None:
+                unique_keys = self.unique_keys
+            else:
+                unique_keys = [columns for _, kind, _, columns in self.constraints if kind in ('p', 'u')]
+            for key_columns in unique_keys:
+                if not key_columns or any(column not in self.columns for column in key_columns):
+                    continue
+                field = ', '.join(key_columns)
+                keys = ', '.join(quote_column(column) for column in key_columns)
+                present = ' AND '.join(f'{quote_column(column)} IS NOT NULL' for column in key_columns)
+                self._reject(cursor, field, f'Duplicate value for {field} within the submission', f"""
+                    SELECT {ROW_COLUMN} FROM (
+                        SELECT {ROW_COLUMN}, row_number() OVER (PARTITION BY {keys} ORDER BY {ROW_COLUMN}) AS copy
+                        FROM {staging} WHERE {present}
+                    ) AS numbered WHERE copy > 1
+                """)
+                if self.key_columns and set(key_columns) == set(self.key_columns):
+                    continue
+                matches = ' AND '.join(f's.{quote_column(c)} = t.{quote_column(c)}' for c in key_columns)
+                if self.key_columns:
+                    matches += ' AND ({}) IS DISTINCT FROM ({})'.format(
+                        ', '.join(f't.{quote_column(c)}' for c in self.key_columns),
+                        ', '.join(f's.{quote_column(c)}' for c in self.key_columns)
+                    )
+                params = []
+                if self.replace_submission:
+                    # Those rows are deleted before the merge
+                    matches += f' AND t.{SUBMISSION_COLUMN} IS DISTINCT FROM %s'
+                    params.append(self.replace_submission)
+                self._reject(cursor, field, f'Value for {field} already exists', f"""
+                    SELECT s.{ROW_COLUMN} FROM {staging} s
+                    WHERE EXISTS (SELECT 1 FROM {self.table_name} t WHERE {matches})
+                """, params)
+
+            cursor.execute(f'SELECT count(DISTINCT {ROW_COLUMN}) FROM {self.rejects_name}')
+            self.rows_rejected = cursor.fetchone()[0]
+            limit = report.scan_limit
+            cursor.execute(
+                f'SELECT {ROW_COLUMN}, field, error FROM {self.rejects_name} ORDER BY {ROW_COLUMN}, seq'
+                + (' LIMIT %s' if limit else ''),
+                [limit] if limit else []
+            )
+            report.add({'row': row, 'field': field, 'error': error} for row, field, error in cursor.fetchall())
+
+        logger.info(
+            "Checked %s staged rows for %s in %.2fs: %s rejected",
+            self.rows_staged, self.table_name, time.monotonic() - started, self.rows_rejected
+        )
+        return report
+
+    def accepted_rows_sql(self, submission_id=None):
+        stamp = ', %s' if submission_id else ''
+        return (
+            f'SELECT {self.column_sql}{stamp} FROM {self.staging_name} s '
+            f'WHERE NOT EXISTS (SELECT 1 FROM {self.rejects_name} r WHERE r.{ROW_COLUMN} = s.{ROW_COLUMN}) '
+            f'ORDER BY s.{ROW_COLUMN}'
+        )
+
+    def upsert_sql(self, submission_id=None):
+        keys = ', '.join(quote_column(column) for column in self.key_columns)
+        values = [column for column in self.columns if column not in self.key_columns]
+        if not values:
+            return f'ON CONFLICT ({keys}) DO NOTHING'
+        assignments = ', '.join(f'{quote_column(column)} = EXCLUDED.{quote_column(column)}' for column in values)
+        if submission_id:
+            # A rewritten row now belongs to this submission
+            assignments += ''.join(f', {column} = EXCLUDED.{column}' for column in (SUBMISSION_COLUMN, LOADED_AT_COLUMN))
+        current = ', '.join(f'{self.table_name}.{quote_column(column)}' for column in values)
+        incoming = ', '.join(f'EXCLUDED.{quote_column(column)}' for column in values)
+        # Rows whose values didn't change are left alone: no new tuple, no WAL
+        return (
+            f'ON CONFLICT ({keys}) DO UPDATE SET {assignments} '
+            f'WHERE ROW({current}) IS DISTINCT FROM ROW({incoming})'
+        )
+
+    def merge(self, submission_id=None):
+        """
+        Write the accepted staged rows into the target and return the number
+        of rows inserted; in merge mode `rows_updated` and `rows_unchanged`
+        are set as well. Written rows are stamped with `submission_id`, and
+        the table's maintained row count is adjusted.
+        """
+        if not self.enabled:
+            columns, rows = self.columns, self._rows or []
+            if submission_id:
+                columns, rows = columns + [SUBMISSION_COLUMN], [list(row) + [submission_id] for row in rows]
+            inserted = BulkLoader(self.table_name, columns).load(rows).rows
+            adjust_row_count(self.table_name, inserted, loaded=True)
+            return inserted
+
+        started = time.monotonic()
+        stamp = f', {SUBMISSION_COLUMN}' if submission_id else ''
+        params = [submission_id] if submission_id else []
+        insert_sql = (
+            f'INSERT INTO {self.table_name} ({self.column_sql}{stamp}) {self.accepted_rows_sql(submission_id)}'
+        )
+        with connection.cursor() as cursor:
+            if self.replace_submission:
+                cursor.execute(
+                    f'DELETE FROM {self.table_name} WHERE {SUBMISSION_COLUMN} = %s', [self.replace_submission]
+                )
+                self.rows_deleted = cursor.rowcount
+            if self.key_columns:
+                # xmax is 0 on freshly inserted tuples and set on updated ones
+                cursor.execute(f"""
+                    WITH merged AS ({insert_sql} {self.upsert_sql(submission_id)} RETURNING (xmax = 0) AS inserted)
+                    SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+                """, params)
+                inserted, self.rows_updated = cursor.fetchone()
+                self.rows_unchanged = self.rows_staged - self.rows_rejected - inserted - self.rows_updated
+            else:
+                cursor.execute(insert_sql, params)
+                inserted = cursor.rowcount
+        adjust_row_count(self.table_name, inserted - self.rows_deleted, loaded=True)
+        logger.info(
+            "Merged staged rows into %s in %.2fs: %s inserted, %s updated, %s unchanged, %s replaced",
+            self.table_name, time.monotonic() - started, inserted, self.rows_updated, self.rows_unchanged,
+            self.rows_deleted
+        )
+        return inserted
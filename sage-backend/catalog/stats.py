@@ -0,0 +1,95 @@
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+
+def adjust_row_count(table_name, delta, loaded=False):
+    """
+    Keep ProductTableInfo.row_count exact without counting: every path that
+    inserts or deletes rows reports the difference, inside its own
+    transaction, so the count commits or rolls back with the rows.
+    `loaded` also stamps last_loaded_at.
+    """
+    from .models import ProductTableInfo
+
+    updates = {}
+    if delta:
+        updates['row_count'] = F('row_count') + delta
+    if loaded:
+        updates['last_loaded_at'] = timezone.now()
+    if updates:
+        # Tables whose count was never taken stay unknown (NULL + delta is NULL)
+        ProductTableInfo.objects.filter(table_name=table_name).update(**updates)
+
+
+def subtract_estimated_rows(table_name, partitions):
+    """
+    Take the rows of partitions about to be detached or dropped out of the
+    maintained count using their planner estimates instead of counting
+    them. The count is approximate from then on, until recounted; if a
+    partition was never analyzed it becomes unknown.
+    """
+    from .models import ProductTableInfo
+
+    estimates = [estimate for estimate, _, _ in table_sizes(partitions).values()]
+    if len(estimates) < len(partitions) or None in estimates:
+        ProductTableInfo.objects.filter(table_name=table_name).update(row_count=None)
+    else:
+        adjust_row_count(table_name, -sum(estimates))
+
+
+def count_rows(table_name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {table_name}')
+        return cursor.fetchone()[0]
+
+
+def recount_rows(product_table):
+    """Reset the maintained row count with an exact count(*)."""
+    product_table.row_count = count_rows(product_table.table_name)
+    product_table.save(update_fields=['row_count'])
+    return product_table.row_count
+
+
+def table_sizes(table_names):
+    """
+    Planner estimates and storage for many tables in one catalog query, as
+    {table name: (estimated rows, total bytes, partitions)}. Partitioned
+    tables are summed over their partitions; the estimate is None until the
+    table has been analyzed.
+    """
+    if connection.vendor != 'postgresql' or not table_names:
+        return {}
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT root.relname,
+                   sum(c.reltuples) FILTER (WHERE c.relkind = 'r' AND c.reltuples >= 0)::bigint,
+                   sum(pg_total_relation_size(c.oid))::bigint,
+                   count(*) FILTER (WHERE tree.level > 0)
+            FROM unnest(%s::text[]) AS t(name)
+            JOIN pg_class root ON root.oid = to_regclass(t.name)
+            -- pg_partition_tree is empty for plain tables
+            LEFT JOIN LATERAL pg_partition_tree(root.oid) tree ON true
+            JOIN pg_class c ON c.oid = COALESCE(tree.relid, root.oid)
+            GROUP BY root.relname
+        """, [list(table_names)])
+        return {name: (estimate, size, partitions) for name, estimate, size, partitions in cursor.fetchall()}
+
+
+def table_statistics(product_tables):
+    """Statistics of each ProductTableInfo, without scanning any table."""
+    product_tables = list(product_tables)
+    sizes = table_sizes([product_table.table_name for product_table in product_tables])
+    statistics = []
+    for product_table in product_tables:
+        estimate, size, partitions = sizes.get(product_table.table_name, (None, None, 0))
+        statistics.append({
+            'product_id': product_table.product_id,
+            'table_name': product_table.table_name,
+            'row_count': product_table.row_count,
+            'estimated_rows': estimate,
+            'total_bytes': size,
+            'partitions': partitions,
+            'last_loaded_at': product_table.last_loaded_at,
+        })
+    return statistics
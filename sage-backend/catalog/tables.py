@@ -0,0 +1,150 @@
+import threading
+from django.db import connection
+from django.db.models import F
+from .lineage import LINEAGE_COLUMNS
+
+
+def table_columns(cursor, table_name):
+    """Return {column name: information_schema.columns row} for a table."""
+    cursor.execute("""
+        SELECT column_name, data_type, character_maximum_length, numeric_precision, numeric_scale, is_nullable
+        FROM information_schema.columns
+        WHERE table_name = %s AND table_schema = current_schema()
+        ORDER BY ordinal_position
+    """, [table_name])
+    return {
+        row[0]: {
+            'data_type': row[1],
+            'max_length': row[2],
+            'precision': row[3],
+            'scale': row[4],
+            'not_null': row[5] == 'NO',
+        }
+        for row in cursor.fetchall()
+    }
+
+
+def table_constraints(cursor, table_name):
+    """Return (name, type, check expression, columns) for CHECK, PRIMARY KEY and UNIQUE constraints."""
+    cursor.execute("""
+        SELECT con.conname, con.contype, pg_get_expr(con.conbin, con.conrelid),
+               ARRAY(
+                   SELECT a.attname::text
+                   FROM unnest(con.conkey) WITH ORDINALITY AS k(attnum, position)
+                   JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+                   ORDER BY k.position
+               )
+        FROM pg_constraint con
+        JOIN pg_class rel ON rel.oid = con.conrelid
+        JOIN pg_namespace nsp ON nsp.oid = rel.relnamespace
+        WHERE rel.relname = %s AND nsp.nspname = current_schema()
+        AND con.contype IN ('c', 'p', 'u')
+        ORDER BY con.contype, con.conname
+    """, [table_name])
+    return cursor.fetchall()
+
+
+def is_partitioned(cursor, table_name):
+    """Whether the table is a partitioned (parent) table."""
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_class
+            WHERE relname = %s AND relkind = 'p' AND relnamespace = current_schema()::regnamespace
+        )
+    """, [table_name])
+    return cursor.fetchone()[0]
+
+
+class TableMetadata:
+    """
+    What the database says about a dynamic table: its columns (in table
+    order, as returned by table_columns), its CHECK/PRIMARY KEY/UNIQUE
+    constraints and whether it is partitioned.
+    """
+
+    def __init__(self, table_name, version, columns, constraints, partitioned):
+        self.table_name = table_name
+        self.version = version
+        self.columns = columns
+        self.constraints = constraints
+        self.partitioned = partitioned
+
+    @property
+    def field_columns(self):
+        """Columns holding product fields, without the lineage columns."""
+        return [name for name in self.columns if name not in LINEAGE_COLUMNS]
+
+
+_table_cache = {}
+_table_lock = threading.Lock()
+
+
+def _table_version(table_name):
+    from .models import ProductTableInfo
+
+    return ProductTableInfo.objects.filter(table_name=table_name).values_list(
+        'schema_version', flat=True).first() or 0
+
+
+def get_table_metadata(table_name, version=None):
+    """
+    Return the cached metadata of a dynamic table, or None if it doesn't
+    exist.
+
+    Entries are tagged with ProductTableInfo.schema_version, which every
+    DDL path bumps through table_changed(); pass the version of a
+    ProductTableInfo already at hand to skip looking it up. The catalog is
+    only introspected again after the table's schema changed.
+    """
+    if version is None:
+        version = _table_version(table_name)
+    metadata = _table_cache.get(table_name)
+    if metadata is not None and metadata.version == version:
+        return metadata
+
+    with connection.cursor() as cursor:
+        columns = table_columns(cursor, table_name)
+        if not columns:
+            return None
+        metadata = TableMetadata(
+            table_name, version, columns, table_constraints(cursor, table_name), is_partitioned(cursor, table_name)
+        )
+    with _table_lock:
+        _table_cache[table_name] = metadata
+    return metadata
+
+
+def table_exists(table_name):
+    """
+    Ask the database rather than the metadata cache: another process may
+    have dropped the table since it was cached here, and to_regclass is a
+    single catalog lookup.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [table_name])
+        return cursor.fetchone()[0]
+
+
+def invalidate_table_metadata(table_name=None):
+    with _table_lock:
+        if table_name is None:
+            _table_cache.clear()
+        else:
+            _table_cache.pop(table_name, None)
+
+
+def table_changed(table_name):
+    """
+    Record that DDL ran on a table: bump its schema version, so every
+    process reloads the metadata, and refresh ProductTableInfo.fields from
+    the actual columns.
+    """
+    from .models import ProductTableInfo
+
+    invalidate_table_metadata(table_name)
+    with connection.cursor() as cursor:
+        columns = table_columns(cursor, table_name)
+    ProductTableInfo.objects.filter(table_name=table_name).update(
+        schema_version=F('schema_version') + 1,
+        fields=[name for name in columns if name not in LINEAGE_COLUMNS],
+    )
@@ -1,3 +1,1066 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import importlib
+import io
+import json
+import openpyxl
+import tempfile
+import time
+from decimal import Decimal
+from unittest import mock
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .aggregates import Aggregation
+from .bulk_load import BulkLoader, CopyStream
+from .cron import RefreshProductSummariesCronJob
+from .export import copy_chunks
+from .indexes import desired_indexes, reconcile_indexes
+from .ingestion import ExcelRowReader, clean_header, map_columns, project_row
+from .jobs import heartbeat, requeue_stale_jobs
+from .models import (
+    Catalog, Product, ProductField, ProductSummary, ProductTableInfo, SubmissionInfo, SubmissionJob, ValidationRule
+)
+from .partitions import (
+    interval_start, list_partitions, maintain_partitions, next_interval, partition_name, partition_table,
+    validate_partition_key
+)
+from .queries import QueryError, TableQuery, decode_cursor, encode_cursor
+from .schema import get_product_schema
+from .schema_diff import SchemaChangeError, plan_schema_changes
+from .staging import StagingTable
+from .stats import table_sizes
+from .tables import get_table_metadata, table_changed, table_exists
+from .validation import ValidationReport, validate_chunk, validate_submission
 
-# Create your tests here.
+FIELDS = [
+    # name, type, length, nullable, primary key, validation rule
+    ('sku', 'varchar', 10, False, True, {}),
+    ('qty', 'int', None, True, False, {'has_min_max': True, 'min_value': 0, 'max_value': 100}),
+    ('price', 'decimal', 8, True, False, {'has_max_decimal': True, 'max_decimal_places': 2}),
+    ('ratio', 'float', None, True, False, {}),
+    ('active', 'boolean', None, True, False, {}),
+    ('sold_on', 'date', None, False, False, {'has_date_format': True, 'date_format': 'YYYY-MM-DD'}),
+    ('seen_at', 'datetime', None, True, False, {}),
+    ('color', 'varchar', 10, True, False, {'is_picklist': True, 'picklist_values': 'red, green, blue'}),
+    ('email', 'varchar', 50, True, False, {'is_email_format': True, 'is_unique': True}),
+]
+
+
+def create_product(fields=FIELDS):
+    """A product with the given fields and validation rules (but no table)."""
+    product = Product.objects.create(schema_name='Test product', domain='test')
+    for name, field_type, length, is_null, is_primary_key, rule in fields:
+        field = ProductField.objects.create(
+            product=product, name=name, field_type=field_type, length=length, is_null=is_null,
+            is_primary_key=is_primary_key
+        )
+        ValidationRule.objects.create(product_field=field, **rule)
+    return product
+
+
+class ProductTableTestCase(TestCase):
+    """Tests against dynamic tables, created the way creating a catalog creates them."""
+    client_class = APIClient
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='tester', email='tester@example.com')
+        self.client.force_authenticate(self.user)
+
+    def create_table(self, product):
+        response = self.client.post('/api/catalogs/', {
+            'name': f'{product.schema_name} catalog', 'corporate': 'Test', 'menu': 'test', 'product_id': product.id,
+            'responsible_user_id': self.user.id, 'submission_email': 'catalog@example.com'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return f'product_{product.id}'
+
+
+VALID_ROW = ['A1', '5', '1.50', '0.25', 'yes', '2024-01-31', '2024-01-31 10:00:00', 'red', 'a@example.com']
+INVALID_ROWS = [
+    ['', 'x', '1.234', 'nan?', 'maybe', '31/01/2024', 'noon', 'purple', 'not-an-email'],
+    ['B' * 11, '101', 'abc', '', '', '', '', '', ''],
+    ['C1', '-1', '1e3', '1.5', 'false', '2024-02-30', '2024-01-31', 'RED', 'b@example'],
+    [None, 3.0, 12.5, 7, True, datetime.date(2024, 1, 1), datetime.datetime(2024, 1, 1), 'green', None],
+]
+
+
+def workbook(*rows):
+    """An in-memory .xlsx whose active sheet holds `rows`."""
+    book = openpyxl.Workbook()
+    for row in rows:
+        book.active.append(row)
+    file = io.BytesIO()
+    book.save(file)
+    file.seek(0)
+    return file
+
+
+class ExcelRowReaderTests(SimpleTestCase):
+    def test_headers_drop_template_annotations(self):
+        self.assertEqual(clean_header('price (decimal) [Min: 0]'), 'price')
+        self.assertEqual(clean_header(' sku '), 'sku')
+        self.assertEqual(clean_header(None), '')
+
+    def test_rows_skip_empty_lines(self):
+        file = workbook(['sku (varchar)', 'qty (int)'], ['A', 1], [None, None], ['B', ''], ['', None], ['C', 3])
+        with ExcelRowReader(file) as reader:
+            self.assertEqual(reader.headers, ['sku', 'qty'])
+            self.assertEqual(list(reader.iter_rows()), [('A', 1), ('B', None), ('C', 3)])
+
+    def test_chunks_hold_at_most_chunk_size_rows(self):
+        file = workbook(['sku'], *[[f'S{index}'] for index in range(7)])
+        with ExcelRowReader(file) as reader:
+            self.assertEqual([len(chunk) for chunk in reader.iter_chunks(3)], [3, 3, 1])
+
+    def test_empty_workbook_has_no_headers(self):
+        with ExcelRowReader(workbook()) as reader:
+            self.assertEqual(reader.headers, [])
+            self.assertEqual(list(reader.iter_chunks(10)), [])
+
+    def test_rows_are_projected_in_field_order(self):
+        fields = [ProductField(name=name) for name in ('sku', 'qty', 'color')]
+        positions = map_columns(['qty', 'extra', 'sku', 'qty'], fields)
+        self.assertEqual(positions, [2, 0, None])
+        self.assertEqual(project_row((5, 'x', 'A'), positions), ['A', 5, None])
+        self.assertEqual(project_row((5,), positions), [None, 5, None])
+
+
+class CompiledSchemaTests(TestCase):
+    def setUp(self):
+        self.product = create_product()
+
+    def convert(self, schema, **cells):
+        values = schema.convert_row([cells.get(name) for name in schema.field_names])
+        return {name: value for name, value in zip(schema.field_names, values) if name in cells}
+
+    def test_converts_spreadsheet_cells(self):
+        schema = get_product_schema(self.product.id)
+        self.assertEqual(
+            self.convert(schema, sku='A1', qty=5.0, price='1.50', ratio='0.25', active='Yes', sold_on='2024-01-31',
+                         seen_at='2024-01-31 10:00:00', email=''),
+            {'sku': 'A1', 'qty': 5, 'price': Decimal('1.50'), 'ratio': 0.25, 'active': True,
+             'sold_on': datetime.date(2024, 1, 31), 'seen_at': datetime.datetime(2024, 1, 31, 10), 'email': ''}
+        )
+        self.assertEqual(
+            self.convert(schema, qty='x', price='abc', ratio=None, active='maybe', sold_on='31/01/2024', seen_at='noon'),
+            {'qty': None, 'price': None, 'ratio': None, 'active': None, 'sold_on': None, 'seen_at': None}
+        )
+
+    def test_reports_errors_by_row_and_field(self):
+        schema = get_product_schema(self.product.id)
+        headers = ['qty', 'sku', 'sold_on', 'price', 'color', 'email']
+        rows = [
+            [5, 'A1', '2024-01-31', '1.5', 'red', 'a@example.com'],
+            [101, '', '31/01/2024', '1.234', 'purple', 'not-an-email'],
+        ]
+        self.assertEqual(schema.validate_rows(headers, rows, start_row=2), [
+            {'row': 3, 'field': 'color', 'error': 'Value must be one of: red, green, blue'},
+            {'row': 3, 'field': 'email', 'error': 'Invalid email format'},
+            {'row': 3, 'field': 'price', 'error': 'Maximum 2 decimal places allowed'},
+            {'row': 3, 'field': 'qty', 'error': 'Value must be <= 100.0'},
+            {'row': 3, 'field': 'sku', 'error': 'This field is required'},
+            {'row': 3, 'field': 'sold_on', 'error': 'Invalid date format. Date format must be: YYYY-MM-DD'},
+        ])
+
+    def test_schema_is_cached_until_a_field_changes(self):
+        schema = get_product_schema(self.product.id)
+        self.assertIs(get_product_schema(self.product.id), schema)
+
+        rule = ValidationRule.objects.get(product_field__product=self.product, product_field__name='qty')
+        rule.max_value = 10
+        rule.save()
+        changed = get_product_schema(self.product.id)
+        self.assertIsNot(changed, schema)
+        self.assertEqual(changed.by_name['qty'].validate(50), ['Value must be <= 10.0'])
+
+    def test_edits_without_signals_are_picked_up(self):
+        # As made by another worker process, whose signals don't reach this one
+        schema = get_product_schema(self.product.id)
+        ProductField.objects.filter(product=self.product, name='sku').update(length=2, updated_at=timezone.now())
+        changed = get_product_schema(self.product.id)
+        self.assertIsNot(changed, schema)
+        self.assertEqual(changed.by_name['sku'].validate('ABC'), ['Exceeds maximum length of 2'])
+
+
+class ValidationEngineTests(TestCase):
+    def setUp(self):
+        self.schema = get_product_schema(create_product().id)
+        # Rows as a sheet with the columns in FIELDS order
+        self.headers = [name for name, *_ in FIELDS]
+        self.rows = ([VALID_ROW] + INVALID_ROWS) * 5
+
+    def test_columnar_engine_matches_row_engine(self):
+        rows_errors = validate_chunk(self.schema, self.headers, self.rows, engine='rows')
+        columnar_errors = validate_chunk(self.schema, self.headers, self.rows, engine='columnar')
+        self.assertTrue(rows_errors)
+        self.assertEqual(columnar_errors, rows_errors)
+
+    def test_engines_agree_on_missing_columns_and_short_rows(self):
+        headers = ['qty', 'sku', 'unknown']
+        rows = [['1', 'A'], ['x'], ['200', 'B', 'extra', 'more'], []]
+        self.assertEqual(
+            validate_chunk(self.schema, headers, rows, start_row=2, engine='columnar'),
+            validate_chunk(self.schema, headers, rows, start_row=2, engine='rows')
+        )
+
+    def test_engines_agree_on_capped_results(self):
+        for max_errors in (1, 7, 30):
+            self.assertEqual(
+                validate_chunk(self.schema, self.headers, self.rows, start_row=10, engine='columnar',
+                               max_errors=max_errors),
+                validate_chunk(self.schema, self.headers, self.rows, start_row=10, engine='rows',
+                               max_errors=max_errors)
+            )
+
+    @override_settings(EXCEL_VALIDATION_PARALLEL_THRESHOLD=0)
+    def test_process_pool_matches_inline_validation(self):
+        for max_errors in (None, 12):
+            inline = validate_submission(self.schema, self.headers, self.rows, start_row=2, engine='columnar',
+                                         workers=1, report=ValidationReport(max_errors=max_errors))
+            for engine in ('columnar', 'rows'):
+                with self.subTest(engine=engine, max_errors=max_errors):
+                    pooled = validate_submission(self.schema, self.headers, self.rows, start_row=2, engine=engine,
+                                                 workers=2, chunk_size=7,
+                                                 report=ValidationReport(max_errors=max_errors))
+                    self.assertEqual(pooled.errors, inline.errors)
+                    self.assertEqual(pooled.truncated, inline.truncated)
+
+    def test_submission_stops_at_error_cap(self):
+        report = validate_submission(self.schema, self.headers, self.rows, engine='columnar', workers=1,
+                                     report=ValidationReport(max_errors=5))
+        self.assertEqual(len(report), 5)
+        self.assertTrue(report.truncated)
+        self.assertEqual(report.errors, validate_chunk(self.schema, self.headers, self.rows, engine='rows')[:5])
+
+    def test_valid_row_has_no_errors(self):
+        self.assertEqual(validate_chunk(self.schema, self.headers, [VALID_ROW], engine='columnar'), [])
+
+
+class ValidationReportTests(SimpleTestCase):
+    def errors(self, count, field='qty'):
+        return [{'row': row, 'field': field, 'error': 'Must be an integer'} for row in range(1, count + 1)]
+
+    def test_caps_errors_and_marks_truncation(self):
+        report = ValidationReport(max_errors=3, examples_per_field=2)
+        self.assertTrue(report.add(self.errors(5)))
+        self.assertEqual(len(report), 3)
+        self.assertTrue(report.truncated)
+        self.assertEqual(report.scan_limit, 1)
+        summary = report.summary()
+        self.assertEqual(summary[0]['error_count'], 3)
+        self.assertEqual(len(summary[0]['examples']), 2)
+
+    def test_exact_fit_is_not_truncated(self):
+        report = ValidationReport(max_errors=3)
+        self.assertTrue(report.add(self.errors(3)))
+        self.assertFalse(report.truncated)
+        self.assertEqual(report.as_dict()['error_count'], 3)
+
+    def test_scan_limit_looks_one_past_the_cap(self):
+        report = ValidationReport(max_errors=10)
+        report.add(self.errors(4))
+        self.assertEqual(report.scan_limit, 7)
+        self.assertIsNone(ValidationReport(max_errors=0).scan_limit)
+
+    def test_summary_orders_fields_by_error_count(self):
+        report = ValidationReport(max_errors=None)
+        report.add(self.errors(1, 'price') + self.errors(2, 'qty'))
+        self.assertEqual([field['field'] for field in report.summary()], ['qty', 'price'])
+
+
+class BulkLoaderTests(TestCase):
+    columns = ['label', 'amount', 'ratio', 'flag', 'day', 'seen_at']
+    rows = [
+        ['plain', Decimal('1.50'), 0.25, True, datetime.date(2024, 1, 31), datetime.datetime(2024, 1, 31, 10, 30)],
+        ['a "quoted", comma', 2, -1.5, False, None, None],
+        ['two\nlines\\ and a backslash', None, None, None, None, None],
+        ['', Decimal('0'), 0, None, None, None],
+        [None, None, None, None, None, None],
+        ['\\N', None, None, None, None, None],
+        ['tab\tand ,"', Decimal('-3.25'), 1e-9, True, datetime.date(1999, 12, 31), None],
+    ]
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TABLE bulk_load_test (id serial, label text, amount numeric(8, 2), ratio double precision, '
+                'flag boolean, day date, seen_at timestamp)'
+            )
+
+    def loaded(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {", ".join(self.columns)} FROM bulk_load_test ORDER BY id')
+            return [list(row) for row in cursor.fetchall()]
+
+    def test_copy_round_trips_escapes_and_nulls(self):
+        result = BulkLoader('bulk_load_test', self.columns).load(iter(self.rows))
+        self.assertEqual((result.method, result.rows), ('copy', len(self.rows)))
+        self.assertEqual(self.loaded(), self.rows)
+
+    def test_insert_fallback_loads_the_same_rows(self):
+        with mock.patch.object(BulkLoader, 'can_copy', return_value=False):
+            result = BulkLoader('bulk_load_test', self.columns, page_size=3).load(iter(self.rows))
+        self.assertEqual((result.method, result.rows), ('values', len(self.rows)))
+        self.assertEqual(self.loaded(), self.rows)
+
+    def test_stream_reads_in_any_size(self):
+        by_line = CopyStream(self.rows)
+        lines = ''.join(by_line.readline() for _ in self.rows)
+        stream = CopyStream(self.rows)
+        pieces = iter(lambda: stream.read(5), '')
+        self.assertEqual(''.join(pieces), lines)
+        self.assertEqual(stream.rows_read, len(self.rows))
+
+
+class ExcelUploadTests(ProductTableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = create_product([
+            ('sku', 'varchar', 10, False, True, {}),
+            ('qty', 'int', None, True, False, {}),
+        ])
+        self.table_name = self.create_table(self.product)
+
+    def upload(self, file, **data):
+        file.name = 'upload.xlsx'
+        return self.client.post(f'/api/product/{self.product.id}/save-excel-data/', {'file': file, **data},
+                                format='multipart')
+
+    def table_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT sku, qty FROM {self.table_name} ORDER BY sku')
+            return cursor.fetchall()
+
+    @override_settings(DYNAMIC_TABLE_LOAD_CHUNK_SIZE=2)
+    def test_uploaded_file_is_loaded_in_chunks(self):
+        response = self.upload(workbook(['qty (int)', 'sku (varchar)'], *[[index, f'S{index}'] for index in range(5)]))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.table_rows(), [(f'S{index}', index) for index in range(5)])
+        submission = SubmissionInfo.objects.get(product=self.product)
+        self.assertEqual(submission.submitted_data, {'file_name': 'upload.xlsx', 'rows': 5})
+
+    def test_merge_mode_updates_existing_keys(self):
+        self.upload(workbook(['sku', 'qty'], ['A', 1], ['B', 2]))
+        response = self.upload(workbook(['sku', 'qty'], ['B', 3], ['C', 4]), mode='merge')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.table_rows(), [('A', 1), ('B', 3), ('C', 4)])
+
+        # B existed before the merge, so its rows can't be rolled back
+        url = f'/api/product/{self.product.id}/submissions/{response.data["submission_id"]}/rows/'
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertEqual(self.table_rows(), [('A', 1), ('B', 3), ('C', 4)])
+
+    def test_reupload_returns_the_previous_submission(self):
+        content = workbook(['sku', 'qty'], ['A', 1], ['B', 2]).getvalue()
+        self.assertEqual(self.upload(io.BytesIO(content)).status_code, 201)
+        submission = SubmissionInfo.objects.get(product=self.product)
+
+        response = self.upload(io.BytesIO(content))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['duplicate'])
+        self.assertEqual(response.data['submission_id'], submission.id)
+        self.assertEqual(SubmissionInfo.objects.filter(product=self.product).count(), 1)
+
+        # Forcing it saves the file again, here with a merge
+        response = self.upload(io.BytesIO(content), mode='merge', force='true')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(SubmissionInfo.objects.filter(product=self.product).count(), 2)
+
+    def test_submission_rows_can_be_replaced_and_rolled_back(self):
+        first = self.upload(workbook(['sku', 'qty'], ['A', 1], ['B', 2])).data['submission_id']
+        second_content = workbook(['sku', 'qty'], ['C', 3]).getvalue()
+        second = self.upload(io.BytesIO(second_content)).data['submission_id']
+        url = f'/api/product/{self.product.id}/submissions/{{}}/rows/'
+
+        # Replacing may reuse the keys of the rows it replaces
+        file = workbook(['sku', 'qty'], ['A', 10], ['D', 4])
+        file.name = 'replacement.xlsx'
+        response = self.client.put(url.format(first), {'file': file}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['submission_id'], first)
+        self.assertEqual(self.table_rows(), [('A', 10), ('C', 3), ('D', 4)])
+        self.assertEqual(self.client.get(url.format(first)).data['row_count'], 2)
+        response = self.client.get(f'/api/product/{self.product.id}/rows/', {'submission': first, 'sort': 'sku'})
+        self.assertEqual([row['sku'] for row in response.data['results']], ['A', 'D'])
+
+        response = self.client.delete(url.format(second))
+        self.assertEqual(response.data['rows_deleted'], 1)
+        self.assertEqual(self.table_rows(), [('A', 10), ('D', 4)])
+        self.assertEqual(SubmissionInfo.objects.get(pk=second).submitted_data['rows_deleted'], 1)
+
+        # A rolled-back file is loaded again rather than deduplicated
+        self.assertEqual(self.upload(io.BytesIO(second_content)).status_code, 201)
+        self.assertEqual(self.table_rows(), [('A', 10), ('C', 3), ('D', 4)])
+
+    def test_failed_upload_saves_nothing(self):
+        response = self.upload(workbook(['sku', 'qty'], ['A', 1], ['A', 2]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.table_rows(), [])
+
+
+    def test_field_definitions_are_deduplicated_only_once_saved(self):
+        catalog = Catalog.objects.get(product=self.product)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+
+        @override_settings(MEDIA_ROOT=media.name)
+        def upload(file):
+            file.name = 'fields.xlsx'
+            return self.client.post(f'/api/catalogs/{catalog.id}/upload/', {'file': file}, format='multipart')
+
+        # A file that failed to parse is processed again when it is re-sent
+        self.assertEqual(upload(io.BytesIO(b'not a workbook')).status_code, 400)
+        self.assertEqual(upload(io.BytesIO(b'not a workbook')).status_code, 400)
+        definitions = workbook(['name', 'type', 'length', 'nullable'], ['note', 'text', None, True] + [False] * 16)
+        content = definitions.getvalue()
+        self.assertEqual(upload(definitions).status_code, 201)
+        response = upload(io.BytesIO(content))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['duplicate'])
+
+
+class SubmissionJobTests(TransactionTestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='tester', email='tester@example.com')
+        self.job = SubmissionJob.objects.create(
+            product=create_product([('sku', 'varchar', 10, False, True, {})]), submitted_by=user,
+            file='submission_jobs/upload.xlsx', file_name='upload.xlsx', status=SubmissionJob.STATUS_RUNNING,
+            phase=SubmissionJob.PHASE_LOADING, rows_processed=10, rows_loaded=4, error_count=2, errors={'total': 2}
+        )
+        SubmissionJob.objects.filter(pk=self.job.pk).update(updated_at=timezone.now() - datetime.timedelta(days=1))
+
+    def test_stale_jobs_are_requeued_with_their_progress_reset(self):
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.phase), (SubmissionJob.STATUS_QUEUED, SubmissionJob.PHASE_QUEUED))
+        self.assertEqual((self.job.rows_processed, self.job.rows_loaded, self.job.error_count, self.job.errors),
+                         (0, 0, 0, {}))
+
+    def test_heartbeat_keeps_a_running_job_alive(self):
+        stale_at = SubmissionJob.objects.get(pk=self.job.pk).updated_at
+        with heartbeat(self.job, interval=0.01):
+            while SubmissionJob.objects.get(pk=self.job.pk).updated_at == stale_at:
+                time.sleep(0.01)
+        self.assertEqual(requeue_stale_jobs(), 0)
+
+class StagingTableTests(ProductTableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.table_name = self.create_table(create_product([
+            ('sku', 'varchar', 10, False, True, {}),
+            ('qty', 'int', None, True, False, {'has_min_max': True, 'min_value': 0, 'max_value': 100}),
+            ('sold_on', 'date', None, False, False, {}),
+        ]))
+        self.columns = ['sku', 'qty', 'sold_on']
+        BulkLoader(self.table_name, self.columns).load([
+            ['A', 1, datetime.date(2024, 1, 1)],
+            ['B', 2, datetime.date(2024, 1, 1)],
+        ])
+
+    def rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT sku, qty FROM {self.table_name} ORDER BY sku')
+            return cursor.fetchall()
+
+    def test_rejected_rows_are_reported_and_not_merged(self):
+        with StagingTable(self.table_name, self.columns) as staging:
+            staging.load([
+                ['C', 3, datetime.date(2024, 1, 2)],
+                ['A', 4, datetime.date(2024, 1, 2)],
+                ['D', 500, datetime.date(2024, 1, 2)],
+                ['E', 5, None],
+                ['F' * 11, 5, datetime.date(2024, 1, 2)],
+                ['C', 6, datetime.date(2024, 1, 2)],
+            ])
+            report = staging.check()
+            self.assertEqual(staging.rows_rejected, 5)
+            self.assertEqual([(error['row'], error['field']) for error in report.errors], [
+                (2, 'sku'), (3, 'qty'), (4, 'sold_on'), (5, 'sku'), (6, 'sku'),
+            ])
+            self.assertEqual(staging.merge(), 1)
+        self.assertEqual(self.rows(), [('A', 1), ('B', 2), ('C', 3)])
+
+    def test_merge_upserts_on_the_primary_key(self):
+        with StagingTable(self.table_name, self.columns, key_columns=['sku']) as staging:
+            staging.load([
+                ['A', 1, datetime.date(2024, 1, 1)],
+                ['B', 9, datetime.date(2024, 1, 1)],
+                ['C', 3, datetime.date(2024, 1, 2)],
+            ])
+            self.assertFalse(staging.check())
+            self.assertEqual(staging.merge(), 1)
+            self.assertEqual((staging.rows_updated, staging.rows_unchanged), (1, 1))
+        self.assertEqual(self.rows(), [('A', 1), ('B', 9), ('C', 3)])
+
+    def test_staging_table_is_dropped(self):
+        with StagingTable(self.table_name, self.columns) as staging:
+            staging.load([['C', 3, datetime.date(2024, 1, 2)]])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s), to_regclass(%s)', [staging.staging_name, staging.rejects_name])
+            self.assertEqual(cursor.fetchone(), (None, None))
+
+
+class TableQueryTests(ProductTableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = create_product([
+            ('sku', 'varchar', 10, False, True, {}),
+            ('qty', 'int', None, True, False, {}),
+            ('active', 'boolean', None, True, False, {}),
+            ('sold_on', 'date', None, False, False, {}),
+            ('color', 'varchar', 10, True, False, {'is_picklist': True, 'picklist_values': 'red, green, blue'}),
+        ])
+        self.table_name = self.create_table(self.product)
+        self.schema = get_product_schema(self.product.id)
+        BulkLoader(self.table_name, ['sku', 'qty', 'sold_on', 'color']).load(
+            [f'S{index:02d}', index % 4, datetime.date(2024, 1, 1 + index % 5), 'red'] for index in range(23)
+        )
+
+    def pages(self, params, limit=5):
+        rows, cursor = [], None
+        while True:
+            query = TableQuery(self.table_name, self.schema, params)
+            page, cursor = query.page(connection, cursor=cursor, limit=limit)
+            rows += page
+            if cursor is None:
+                return rows
+
+    def test_cursor_pages_cover_every_row_once(self):
+        rows = self.pages({'sort': 'sold_on,-sku', 'fields': 'sku,sold_on'})
+        expected = sorted(sorted(rows, key=lambda row: row['sku'], reverse=True), key=lambda row: row['sold_on'])
+        self.assertEqual(len(rows), 23)
+        self.assertEqual(len({row['sku'] for row in rows}), 23)
+        self.assertEqual(rows, expected)
+
+    def test_filters_apply_to_every_page(self):
+        rows = self.pages({'qty__in': '1,2', 'sold_on__gte': '2024-01-02'}, limit=3)
+        self.assertTrue(rows)
+        self.assertTrue(all(row['qty'] in (1, 2) and row['sold_on'] >= datetime.date(2024, 1, 2) for row in rows))
+
+    def test_cursor_round_trip(self):
+        sort = [['sold_on', False], ['sku', False]]
+        self.assertEqual(decode_cursor(encode_cursor(sort, [datetime.date(2024, 1, 2), 'S01'])),
+                         (sort, ['2024-01-02', 'S01']))
+
+    def test_rejected_params(self):
+        for params in (
+            {'fields': 'sku,missing'},
+            {'missing': '1'},
+            {'qty__like': '1'},
+            {'qty': 'many'},
+            {'active__gt': 'true'},
+            {'qty__in': ','},
+            {'sort': 'qty'},
+            {'submission': 'first'},
+        ):
+            with self.subTest(params=params), self.assertRaises(QueryError):
+                TableQuery(self.table_name, self.schema, params)
+
+    def test_rejected_cursors(self):
+        query = TableQuery(self.table_name, self.schema, {'sort': 'sold_on'})
+        _, cursor = query.page(connection, limit=5)
+        with self.assertRaises(QueryError):
+            TableQuery(self.table_name, self.schema, {'sort': '-sold_on'}).select_sql(cursor=cursor)
+        with self.assertRaises(QueryError):
+            query.select_sql(cursor='not a cursor')
+        with self.assertRaises(QueryError):
+            query.select_sql(cursor=encode_cursor([['sold_on', False], ['sku', False]], [None, 'S01']))
+
+    def test_rows_endpoint_pages_with_next_cursor(self):
+        url = f'/api/product/{self.product.id}/rows/'
+        response = self.client.get(url, {'sort': '-sku', 'fields': 'sku', 'limit': 20})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['has_more'])
+        response = self.client.get(url, {'sort': '-sku', 'fields': 'sku', 'cursor': response.data['next_cursor']})
+        self.assertEqual([row['sku'] for row in response.data['results']], ['S02', 'S01', 'S00'])
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual(self.client.get(url, {'sort': 'color'}).status_code, 400)
+
+
+@override_settings(DYNAMIC_TABLE_EXPORT_BATCH_SIZE=2)
+class ExportTests(ProductTableTestCase):
+    rows = [
+        ['A', 3, datetime.date(2024, 1, 31), True, 'plain'],
+        ['B', None, datetime.date(2024, 2, 1), None, 'with "quotes", a comma\nand a newline'],
+        ['C', -1, datetime.date(2024, 2, 2), False, None],
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.product = create_product([
+            ('sku', 'varchar', 10, False, True, {}),
+            ('qty', 'int', None, True, False, {}),
+            ('sold_on', 'date', None, False, False, {}),
+            ('active', 'boolean', None, True, False, {}),
+            ('note', 'text', None, True, False, {}),
+        ])
+        BulkLoader(self.create_table(self.product), ['sku', 'qty', 'sold_on', 'active', 'note']).load(self.rows)
+
+    def export(self, **params):
+        response = self.client.get(f'/api/product/{self.product.id}/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        content = self.export(file_format='csv', fields='sku,qty,sold_on,active,note', sort='sku').decode()
+        self.assertEqual(list(csv.reader(io.StringIO(content))), [
+            ['sku', 'qty', 'sold_on', 'active', 'note'],
+            ['A', '3', '2024-01-31', 'True', 'plain'],
+            ['B', '', '2024-02-01', '', 'with "quotes", a comma\nand a newline'],
+            ['C', '-1', '2024-02-02', 'False', ''],
+        ])
+
+    def test_ndjson(self):
+        content = self.export(file_format='ndjson', fields='sku,qty,sold_on,note', sort='-sku', qty__gte=0)
+        self.assertEqual([json.loads(line) for line in content.decode().splitlines()], [
+            {'sku': 'A', 'qty': 3, 'sold_on': '2024-01-31', 'note': 'plain'},
+        ])
+
+    def test_xlsx(self):
+        content = self.export(file_format='xlsx', fields='sku,qty,sold_on', sort='sku')
+        book = openpyxl.load_workbook(io.BytesIO(content), read_only=True)
+        self.assertEqual(list(book.active.iter_rows(values_only=True)), [
+            ('sku', 'qty', 'sold_on'),
+            ('A', 3, datetime.datetime(2024, 1, 31)),
+            ('B', None, datetime.datetime(2024, 2, 1)),
+            ('C', -1, datetime.datetime(2024, 2, 2)),
+        ])
+
+    def test_unsorted_export_has_every_row(self):
+        content = self.export(file_format='csv', fields='sku').decode()
+        self.assertEqual(sorted(content.split()[1:]), ['A', 'B', 'C'])
+
+    def dump(self, **params):
+        response = self.client.get(f'/api/export/product/{self.product.id}/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_copy_dump(self):
+        response, content = self.dump(fields='sku,qty,active,note')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        header, *rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(header, ['sku', 'qty', 'active', 'note'])
+        self.assertEqual(sorted(rows), [
+            ['A', '3', 't', 'plain'],
+            ['B', '', '', 'with "quotes", a comma\nand a newline'],
+            ['C', '-1', 'f', ''],
+        ])
+
+    def test_gzipped_copy_dump_with_filters(self):
+        response, content = self.dump(fields='sku,sold_on', sold_on__gte='2024-02-01', gzip='true')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.csv.gz"'))
+        lines = gzip.decompress(content).decode().splitlines()
+        self.assertEqual(lines[0], 'sku,sold_on')
+        self.assertEqual(sorted(lines[1:]), ['B,2024-02-01', 'C,2024-02-02'])
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get(f'/api/product/{self.product.id}/export/', {'file_format': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AbandonedDumpTests(TransactionTestCase):
+    def setUp(self):
+        self.product = create_product([('sku', 'varchar', 40, False, True, {})])
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE dump_cancel_test AS SELECT md5(n::text) AS sku FROM generate_series(1, 200000) n")
+        self.addCleanup(self.drop_table)
+
+    def drop_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS dump_cancel_test")
+
+    def test_abandoned_dump_drops_its_connection(self):
+        chunks = copy_chunks(TableQuery('dump_cancel_test', get_product_schema(self.product.id), {}))
+        self.assertTrue(next(chunks).startswith(b'sku\n'))
+        chunks.close()
+        self.assertIsNone(connection.connection)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM dump_cancel_test")
+            self.assertEqual(cursor.fetchone(), (200000,))
+
+class AggregationTests(ProductTableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = create_product([
+            ('sku', 'varchar', 10, False, True, {}),
+            ('qty', 'int', None, True, False, {}),
+            ('price', 'decimal', 8, True, False, {}),
+            ('active', 'boolean', None, True, False, {}),
+            ('sold_on', 'date', None, False, False, {}),
+            ('color', 'varchar', 10, True, False, {'is_picklist': True, 'picklist_values': 'red, green, blue'}),
+        ])
+        self.table_name = self.create_table(self.product)
+        self.schema = get_product_schema(self.product.id)
+        self.load([
+            ['A', 1, datetime.date(2024, 1, 5), 'red'],
+            ['B', 2, datetime.date(2024, 1, 20), 'red'],
+            ['C', 4, datetime.date(2024, 2, 1), 'blue'],
+        ])
+
+    def load(self, rows):
+        BulkLoader(self.table_name, ['sku', 'qty', 'sold_on', 'color']).load(rows)
+
+    def test_groups_and_metrics(self):
+        rows, truncated = Aggregation(self.schema, 'color,sold_on:month', 'count,sum:qty,max:sold_on').fetch(
+            self.table_name
+        )
+        self.assertFalse(truncated)
+        self.assertEqual(rows, [
+            {'color': 'blue', 'sold_on__month': datetime.date(2024, 2, 1), 'count': 1, 'sum__qty': 4,
+             'max__sold_on': datetime.date(2024, 2, 1)},
+            {'color': 'red', 'sold_on__month': datetime.date(2024, 1, 1), 'count': 2, 'sum__qty': 3,
+             'max__sold_on': datetime.date(2024, 1, 20)},
+        ])
+
+    def test_only_whitelisted_groups_and_metrics(self):
+        for group_by, metrics in (
+            ('missing', 'count'),
+            ('price', 'count'),
+            ('color:month', 'count'),
+            ('sold_on:century', 'count'),
+            ('color', 'median:qty'),
+            ('color', 'sum:color'),
+            ('color', 'avg:active'),
+            ('color', 'sum'),
+            ('color', 'sum:qty); DROP TABLE x; --'),
+        ):
+            with self.subTest(group_by=group_by, metrics=metrics), self.assertRaises(QueryError):
+                Aggregation(self.schema, group_by, metrics)
+
+    def test_matching_summary_is_read_until_refreshed(self):
+        response = self.client.post(f'/api/product/{self.product.id}/summaries/', {
+            'name': 'By color', 'group_by': ['color'], 'metrics': ['count', 'sum:qty'], 'refresh_minutes': 1
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.load([['D', 8, datetime.date(2024, 2, 2), 'red']])
+
+        url = f'/api/product/{self.product.id}/aggregate/'
+        params = {'group_by': 'color', 'metrics': 'sum:qty', 'color': 'red'}
+        response = self.client.get(url, params)
+        self.assertEqual(response.data['source'], 'summary')
+        self.assertEqual(response.data['results'], [{'color': 'red', 'sum__qty': 3}])
+        self.assertEqual(self.client.get(url, {**params, 'summary': 'false'}).data['results'],
+                         [{'color': 'red', 'sum__qty': 11}])
+
+        ProductSummary.objects.update(refreshed_at=timezone.now() - datetime.timedelta(minutes=2))
+        RefreshProductSummariesCronJob().do()
+        self.assertEqual(self.client.get(url, params).data['results'], [{'color': 'red', 'sum__qty': 11}])
+
+
+class IndexTests(ProductTableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = create_product([
+            ('sku', 'varchar', 10, False, True, {}),
+            ('qty', 'int', None, True, False, {}),
+            ('sold_on', 'date', None, False, False, {}),
+            ('color', 'varchar', 10, True, False, {'is_picklist': True, 'picklist_values': 'red, green, blue'}),
+            ('code', 'varchar', 20, True, False, {}),
+            ('note', 'text', None, True, False, {}),
+            ('email', 'varchar', 50, True, False, {'is_unique': True}),
+        ])
+        ProductField.objects.filter(product=self.product, name__in=['sku', 'code', 'note', 'email']).update(
+            is_filterable=True
+        )
+        self.table_name = self.create_table(self.product)
+
+    def fields(self):
+        return ProductField.objects.filter(product=self.product).select_related('validation_rule')
+
+    def index_name(self, field_name, method):
+        field = ProductField.objects.get(product=self.product, name=field_name)
+        return f'{self.table_name}_auto_{field.id}_{method}'
+
+    def table_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname LIKE %s",
+                           [self.table_name, f'{self.table_name}_auto_%'])
+            return {name: definition.split(' USING ')[1] for name, definition in cursor.fetchall()}
+
+    def test_indexes_follow_field_metadata(self):
+        self.assertEqual(desired_indexes(self.table_name, self.fields()), {
+            self.index_name('code', 'btree'): ('btree', 'code'),
+            self.index_name('color', 'btree'): ('btree', 'color'),
+            self.index_name('note', 'hash'): ('hash', 'note'),
+            self.index_name('sold_on', 'brin'): ('brin', 'sold_on'),
+        })
+        # Catalog creation built them
+        self.assertEqual(self.table_indexes(), {
+            self.index_name('code', 'btree'): 'btree (code)',
+            self.index_name('color', 'btree'): 'btree (color)',
+            self.index_name('note', 'hash'): 'hash (note)',
+            self.index_name('sold_on', 'brin'): 'brin (sold_on)',
+        })
+
+    def test_reconcile_creates_and_drops_only_the_difference(self):
+        ProductField.objects.filter(product=self.product, name='code').update(is_filterable=False)
+        ProductField.objects.filter(product=self.product, name__in=['qty', 'sold_on']).update(is_filterable=True)
+        created, dropped = reconcile_indexes(self.table_name, self.fields())
+        self.assertEqual(sorted(created), sorted([self.index_name('qty', 'btree'), self.index_name('sold_on', 'btree')]))
+        self.assertEqual(dropped, [self.index_name('code', 'btree')])
+        self.assertEqual(self.table_indexes()[self.index_name('sold_on', 'btree')], 'btree (sold_on)')
+        self.assertEqual(reconcile_indexes(self.table_name, self.fields()), ([], []))
+
+    def test_indexes_added_by_hand_are_left_alone(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE INDEX {self.table_name}_qty_manual ON {self.table_name} (qty)')
+        self.assertEqual(reconcile_indexes(self.table_name, self.fields()), ([], []))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [f'{self.table_name}_qty_manual'])
+            self.assertIsNotNone(cursor.fetchone()[0])
+
+
+class PartitionTests(ProductTableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = create_product([
+            ('sku', 'varchar', 10, False, True, {}),
+            ('qty', 'int', None, True, False, {}),
+            ('sold_on', 'date', None, False, False, {}),
+            ('shipped_on', 'date', None, True, False, {}),
+        ])
+        self.table_name = self.create_table(self.product)
+        self.product_table = ProductTableInfo.objects.get(product=self.product)
+        self.this_month = interval_start(timezone.localdate(), 'month')
+        self.months = [self.month(steps) for steps in (-2, -1, 0)]
+        BulkLoader(self.table_name, ['sku', 'qty', 'sold_on']).load(
+            [sku, index, month] for index, (sku, month) in enumerate(zip('ABC', self.months))
+        )
+
+    def month(self, steps):
+        return next_interval(self.this_month, 'month', steps)
+
+    def partition(self, steps):
+        return partition_name(self.table_name, self.month(steps), 'month')
+
+    def partitions(self):
+        with connection.cursor() as cursor:
+            return [name for name, _, _ in list_partitions(cursor, self.table_name)]
+
+    def rows_by_partition(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT tableoid::regclass::text, sku FROM {self.table_name} ORDER BY sku')
+            return cursor.fetchall()
+
+    def test_rows_are_moved_into_range_partitions(self):
+        partition_table(self.product_table, 'sold_on', ahead=1)
+        self.assertEqual(self.partitions(), [self.partition(steps) for steps in (-2, -1, 0, 1)])
+        self.assertEqual(self.rows_by_partition(), [
+            (self.partition(-2), 'A'), (self.partition(-1), 'B'), (self.partition(0), 'C'),
+        ])
+        self.product_table.refresh_from_db()
+        self.assertEqual((self.product_table.partition_key, self.product_table.partition_interval),
+                         ('sold_on', 'month'))
+        with self.assertRaises(ValueError):
+            partition_table(self.product_table, 'sold_on')
+
+    def test_lineage_indexes_survive_partitioning(self):
+        partition_table(self.product_table, 'sold_on')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT indexname FROM pg_indexes WHERE tablename = %s', [self.table_name])
+            indexes = {name for name, in cursor.fetchall()}
+        self.assertLessEqual({f'{self.table_name}_submission_idx', f'{self.table_name}_loaded_at_idx'}, indexes)
+
+    def test_partition_key_must_be_a_required_date(self):
+        validate_partition_key(self.product_table, 'sold_on')
+        # The load timestamp would leave the sku primary key unenforced
+        for key in ('qty', 'shipped_on', 'missing', '_loaded_at'):
+            with self.subTest(key=key), self.assertRaises(ValueError):
+                validate_partition_key(self.product_table, key)
+
+    def test_maintenance_adds_future_partitions_and_drops_expired_ones(self):
+        partition_table(self.product_table, 'sold_on', ahead=1, retention=2, retention_action='drop')
+        ProductTableInfo.objects.filter(pk=self.product_table.pk).update(row_count=3)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {self.table_name}')
+        created, expired = maintain_partitions(self.product_table, today=self.month(1))
+        self.assertEqual(created, [self.partition(2)])
+        self.assertEqual(expired, [self.partition(-2), self.partition(-1)])
+        self.assertEqual(self.partitions(), [self.partition(steps) for steps in (0, 1, 2)])
+        self.assertEqual(self.rows_by_partition(), [(self.partition(0), 'C')])
+        # The expired rows are subtracted by their estimates
+        self.product_table.refresh_from_db()
+        self.assertEqual(self.product_table.row_count, 1)
+        self.assertEqual(maintain_partitions(self.product_table, today=self.month(1)), ([], []))
+
+    def test_declared_keys_are_checked_across_partitions(self):
+        partition_table(self.product_table, 'sold_on', ahead=1)
+        schema = get_product_schema(self.product.id)
+        columns = ['sku', 'qty', 'sold_on']
+        with StagingTable(self.table_name, columns, unique_keys=schema.unique_keys) as staging:
+            # A is in another month's partition, where the (sku, sold_on) key doesn't see it
+            staging.load([['D', 1, self.months[2]], ['A', 2, self.months[2]]])
+            report = staging.check()
+            self.assertEqual([(error['row'], error['field']) for error in report.errors], [(2, 'sku')])
+            self.assertEqual(staging.merge(), 1)
+
+        file = workbook(['sku', 'qty', 'sold_on'], ['E', 1, self.months[2]])
+        file.name = 'merge.xlsx'
+        response = self.client.post(f'/api/product/{self.product.id}/save-excel-data/',
+                                    {'file': file, 'mode': 'merge'}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+
+class SchemaDiffTests(ProductTableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = create_product()
+        self.table_name = self.create_table(self.product)
+
+    def fields(self):
+        return list(ProductField.objects.filter(product=self.product).select_related('validation_rule'))
+
+    def descriptions(self):
+        return [change.description for change in plan_schema_changes(self.table_name, self.fields())]
+
+    def test_unchanged_fields_plan_nothing(self):
+        self.assertEqual(self.descriptions(), [])
+
+    def test_rename_drop_and_add(self):
+        ProductField.objects.filter(product=self.product, name='color').update(name='colour')
+        ProductField.objects.filter(product=self.product, name='ratio').delete()
+        ProductField.objects.create(product=self.product, name='notes', field_type='text')
+        self.assertEqual(self.descriptions(), [
+            'Rename column color to colour',
+            'Drop column ratio',
+            'Add column notes TEXT',
+        ])
+
+    def test_rule_changes(self):
+        qty = ProductField.objects.get(product=self.product, name='qty')
+        ValidationRule.objects.filter(product_field=qty).update(max_value=50)
+        ProductField.objects.filter(pk=qty.pk).update(is_null=False)
+        self.assertEqual(self.descriptions(), [
+            'Make qty required',
+            f'Replace check check_{qty.id}_max: "qty" <= 50.0',
+        ])
+
+    def test_catalog_update_applies_the_changes_in_place(self):
+        BulkLoader(self.table_name, ['sku', 'sold_on', 'color']).load([['A', datetime.date(2024, 1, 1), 'red']])
+        ProductField.objects.filter(product=self.product, name='color').update(name='colour')
+        ProductField.objects.create(product=self.product, name='notes', field_type='text')
+
+        catalog = Catalog.objects.get(product=self.product)
+        response = self.client.patch(f'/api/catalogs/{catalog.id}/', {'menu': 'updated'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.descriptions(), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT sku, colour, notes FROM {self.table_name}')
+            self.assertEqual(cursor.fetchall(), [('A', 'red', None)])
+
+    def test_untagged_columns_are_tagged_before_a_rename(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'COMMENT ON COLUMN {self.table_name}.color IS NULL')
+        ProductField.objects.filter(product=self.product, name='color').update(name='colour')
+        with self.assertRaises(SchemaChangeError):
+            self.descriptions()
+
+        ProductField.objects.filter(product=self.product, name='colour').update(name='color')
+        migration = importlib.import_module('catalog.migrations.0030_tag_product_table_columns')
+        with connection.schema_editor() as schema_editor:
+            migration.tag_field_columns(apps, schema_editor)
+        ProductField.objects.filter(product=self.product, name='color').update(name='colour')
+        self.assertEqual(self.descriptions(), ['Rename column color to colour'])
+
+
+class TableMetadataTests(ProductTableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = create_product([
+            ('sku', 'varchar', 10, False, True, {}),
+            ('qty', 'int', None, True, False, {}),
+        ])
+        self.table_name = self.create_table(self.product)
+
+    def add_column(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {self.table_name} ADD COLUMN {name} TEXT')
+
+    def test_metadata_is_cached_per_schema_version(self):
+        metadata = get_table_metadata(self.table_name)
+        self.assertEqual(metadata.field_columns, ['qty', 'sku'])
+        with self.assertNumQueries(0):
+            self.assertIs(get_table_metadata(self.table_name, metadata.version), metadata)
+
+        # DDL that doesn't go through table_changed() isn't seen
+        self.add_column('unseen')
+        self.assertIs(get_table_metadata(self.table_name), metadata)
+
+        table_changed(self.table_name)
+        changed = get_table_metadata(self.table_name)
+        self.assertEqual(changed.field_columns, ['qty', 'sku', 'unseen'])
+        self.assertEqual(ProductTableInfo.objects.get(product=self.product).fields, ['qty', 'sku', 'unseen'])
+
+    def test_version_bumped_by_another_process_reloads(self):
+        metadata = get_table_metadata(self.table_name)
+        self.add_column('remote')
+        # What table_changed() in another process leaves behind: a new version, but this cache untouched
+        ProductTableInfo.objects.filter(product=self.product).update(schema_version=F('schema_version') + 1)
+        self.assertEqual(get_table_metadata(self.table_name).field_columns, ['qty', 'sku', 'remote'])
+        self.assertNotEqual(get_table_metadata(self.table_name).version, metadata.version)
+
+    def test_field_change_refreshes_cached_metadata(self):
+        get_table_metadata(self.table_name)
+        ProductField.objects.create(product=self.product, name='notes', field_type='text')
+        catalog = Catalog.objects.get(product=self.product)
+        self.client.patch(f'/api/catalogs/{catalog.id}/', {'menu': 'updated'}, format='json')
+        self.assertEqual(get_table_metadata(self.table_name).field_columns, ['qty', 'sku', 'notes'])
+
+    def test_table_dropped_by_another_process_no_longer_exists(self):
+        get_table_metadata(self.table_name)
+        self.assertTrue(table_exists(self.table_name))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {self.table_name}')
+        self.assertFalse(table_exists(self.table_name))
+
+
+class TableStatisticsTests(ProductTableTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = create_product([
+            ('sku', 'varchar', 10, False, True, {}),
+            ('sold_on', 'date', None, False, False, {}),
+        ])
+        self.table_name = self.create_table(self.product)
+        BulkLoader(self.table_name, ['sku', 'sold_on']).load(
+            [f'S{index}', timezone.localdate()] for index in range(3)
+        )
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {self.table_name}')
+
+    def test_sizes_of_a_plain_table(self):
+        estimate, size, partitions = table_sizes([self.table_name])[self.table_name]
+        self.assertIsNone(estimate)
+        self.assertGreater(size, 0)
+        self.assertEqual(partitions, 0)
+        self.analyze()
+        self.assertEqual(table_sizes([self.table_name, 'missing_table']), {self.table_name: (3, size, 0)})
+
+    def test_sizes_of_a_partitioned_table_add_up_its_partitions(self):
+        partition_table(ProductTableInfo.objects.get(product=self.product), 'sold_on', ahead=1)
+        self.analyze()
+        estimate, size, partitions = table_sizes([self.table_name])[self.table_name]
+        # This month, next month and the default partition
+        self.assertEqual((estimate, partitions), (3, 3))
+        self.assertGreater(size, 0)
+
+    def test_uploads_keep_the_row_count(self):
+        file = workbook(['sku', 'sold_on'], ['A', '2024-01-01'], ['B', '2024-01-02'])
+        file.name = 'rows.xlsx'
+        response = self.client.post(f'/api/product/{self.product.id}/save-excel-data/', {'file': file},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 201)
+        stats = self.client.get(f'/api/product/{self.product.id}/stats/').data
+        # The rows loaded outside the API aren't counted until a recount
+        self.assertEqual(stats['row_count'], 2)
+        self.assertEqual(self.client.get(f'/api/product/{self.product.id}/stats/', {'exact': 'true'}).data['row_count'],
+                         5)
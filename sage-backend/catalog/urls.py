@@ -28,6 +28,7 @@ urlpatterns = [
     path('catalogs/<int:catalog_id>/delete/', DeleteCatalogView.as_view(), name='delete_catalog'),
     path('uploads/', RecentAndOverdueUploadsView.as_view(), name='recent_and_overdue_uploads'),
     path('export/pending-catalogs/', PendingCatalogsExportView.as_view(), name='pending_catalogs_export'),
+    path('export/product/<int:product_id>/', ProductTableDumpView.as_view(), name='product_table_dump'),
     path('catalog-status-count/', CatalogStatusCountView.as_view(), name='catalog_status_count'),
 
     # List view for all dynamic table data of a product
@@ -35,12 +36,22 @@ urlpatterns = [
     
     # Detail view for a specific dynamic table's data
     path('product/<int:product_id>/product-data/<int:product_data_id>/', DynamicTableDataDetailView.as_view(), name='dynamic_table_detail'),
+    path('product/<int:product_id>/rows/', DynamicTableRowsView.as_view(), name='dynamic_table_rows'),
+    path('product/<int:product_id>/export/', DynamicTableExportView.as_view(), name='dynamic_table_export'),
+    path('product/<int:product_id>/stats/', ProductTableStatsView.as_view(), name='product_table_stats'),
+    path('tables/stats/', ProductTableStatsListView.as_view(), name='product_table_stats_list'),
+    path('product/<int:product_id>/aggregate/', DynamicTableAggregateView.as_view(), name='dynamic_table_aggregate'),
+    path('product/<int:product_id>/summaries/', ProductSummaryListCreateView.as_view(), name='product_summary_list'),
+    path('product/<int:product_id>/summaries/<int:summary_id>/', ProductSummaryDetailView.as_view(), name='product_summary_detail'),
 
      path('product/<int:product_id>/save-data/', DynamicTableDataSaveView.as_view(), name='save-product-data'),
      path('product/<int:product_id>/validate-excel/', DynamicTableExcelValidationView.as_view(), name='validaate-excel-data'),
      path('product/<int:product_id>/save-excel-data/', DynamicTableExcelSaveView.as_view(), name='save-excel-data'),
      path('product/<int:product_id>/excel-template/', ExcelTemplateGenerationView.as_view(), name='excel-template'),
      path('product/<int:product_id>/submissions/', SubmissionListView.as_view(), name='submission_list'),
+     path('product/<int:product_id>/submissions/<int:submission_id>/rows/', SubmissionRowsView.as_view(), name='submission_rows'),
+     path('product/<int:product_id>/submission-jobs/', SubmissionJobListCreateView.as_view(), name='submission_job_list_create'),
+     path('submission-jobs/<int:job_id>/', SubmissionJobDetailView.as_view(), name='submission_job_detail'),
 #     # path("create-catalog/", views.create_catalog),
 #     path('schema-create/', views.create_schema, name='create_schema'),
 #     path('catalog-create/', views.create_catalog, name='create_catalog'),
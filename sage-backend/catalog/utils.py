@@ -1,4 +1,16 @@
-from django.db import connection
+DATE_INPUT_FORMATS = [
+    "%m/%d/%Y",   # MM/DD/YYYY
+    "%Y-%m-%d",   # YYYY-MM-DD
+    "%d/%m/%Y",   # DD/MM/YYYY
+]
+
+DATETIME_INPUT_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y",
+]
 
 def get_sql_field_type(field):
     """
@@ -10,49 +22,13 @@ def get_sql_field_type(field):
         'float': 'FLOAT',
         'boolean': 'BOOLEAN',
         'date': 'DATE',
-        'datetime': 'DATETIME',
+        'datetime': 'TIMESTAMP',
         'text': 'TEXT',
         'decimal': 'DECIMAL',
     }
     return sql_field_map.get(field.field_type, 'TEXT')
 
-def apply_validation_rules(fields, table_name):
-    """Apply validation rules to the dynamic table."""
-    for field in fields:
-        if hasattr(field, 'validation_rule') and field.validation_rule:
-            validation = field.validation_rule
-            
-            with connection.cursor() as cursor:
-                # Escape field names and constraint names with spaces
-                field_name = f'"{field.name}"' if ' ' in field.name or any(c in field.name for c in [';', '"', "'"]) else field.name
-                
-                # Unique Constraint
-                if validation.is_unique:
-                    cursor.execute(
-                        f'ALTER TABLE {table_name} ADD CONSTRAINT "unique_{field.id}" UNIQUE ({field_name});'
-                    )
-                
-                # Min/Max Value Constraints
-                if validation.has_min_max:
-                    if validation.min_value is not None:
-                        cursor.execute(
-                            f'ALTER TABLE {table_name} ADD CONSTRAINT "check_{field.id}_min" '
-                            f'CHECK ({field_name} >= {validation.min_value});'
-                        )
-                    if validation.max_value is not None:
-                        cursor.execute(
-                            f'ALTER TABLE {table_name} ADD CONSTRAINT "check_{field.id}_max" '
-                            f'CHECK ({field_name} <= {validation.max_value});'
-                        )
-
-                # Decimal Places Constraint
-                if validation.has_max_decimal and field.field_type == 'decimal':
-                    cursor.execute(
-                        f'ALTER TABLE {table_name} ADD CONSTRAINT "check_{field.id}_decimals" '
-                        f'CHECK (ROUND({field_name}, {validation.max_decimal_places}) = {field_name});'
-                    )
 
-                # Custom Validation Rules (if provided)
-                if validation.custom_validation:
-                    # Execute custom SQL validation (requires careful handling)
-                    cursor.execute(validation.custom_validation)
+def parse_bool(value):
+    """Interpret a query/form/JSON flag such as force=true or partial=1."""
+    return str(value).strip().lower() in ('true', '1', 'yes', 'y', 'on')
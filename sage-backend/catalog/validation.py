@@ -0,0 +1,176 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from .columnar import validate_frame
+
+
+class ValidationReport:
+    """
+    Errors collected while validating a submission.
+
+    At most `max_errors` errors are kept (None or 0 keeps everything); once
+    the cap is hit the report is full, `truncated` is set and callers stop
+    scanning. Alongside the capped list the report keeps, for each field, the
+    number of errors per message and the first `examples_per_field` failing
+    rows, which is what responses and emails show.
+    """
+
+    def __init__(self, max_errors=None, examples_per_field=None):
+        if max_errors is None:
+            max_errors = settings.EXCEL_VALIDATION_MAX_ERRORS
+        if examples_per_field is None:
+            examples_per_field = settings.EXCEL_VALIDATION_ERROR_EXAMPLES
+        self.max_errors = max_errors or None
+        self.examples_per_field = examples_per_field
+        self.errors = []
+        self.fields = {}
+        self.truncated = False
+
+    def __bool__(self):
+        return bool(self.errors)
+
+    def __len__(self):
+        return len(self.errors)
+
+    @property
+    def is_full(self):
+        return self.max_errors is not None and len(self.errors) >= self.max_errors
+
+    @property
+    def scan_limit(self):
+        """
+        How many more errors a validator should look for: one past the cap,
+        so that a truncated result can be told apart from an exact fit.
+        """
+        if self.max_errors is None:
+            return None
+        return max(self.max_errors - len(self.errors), 0) + 1
+
+    def add(self, errors):
+        """Record errors in order; returns True once the report is full."""
+        for error in errors:
+            if self.is_full:
+                self.truncated = True
+                break
+            self.errors.append(error)
+            summary = self.fields.setdefault(error['field'], {'count': 0, 'errors': {}, 'examples': []})
+            summary['count'] += 1
+            summary['errors'][error['error']] = summary['errors'].get(error['error'], 0) + 1
+            if len(summary['examples']) < self.examples_per_field:
+                summary['examples'].append({'row': error['row'], 'error': error['error']})
+        return self.is_full
+
+    def summary(self):
+        """Per-field error counts, most affected field first."""
+        return [
+            {
+                'field': field,
+                'error_count': summary['count'],
+                'errors': [
+                    {'error': message, 'count': count}
+                    for message, count in sorted(summary['errors'].items(), key=lambda item: -item[1])
+                ],
+                'examples': summary['examples'],
+            }
+            for field, summary in sorted(self.fields.items(), key=lambda item: -item[1]['count'])
+        ]
+
+    def as_dict(self):
+        return {
+            'errors': self.errors,
+            'error_count': len(self.errors),
+            'truncated': self.truncated,
+            'max_errors': self.max_errors,
+            'error_summary': self.summary(),
+        }
+
+
+def header_errors(schema, headers):
+    """Errors for sheet columns that aren't fields of the product."""
+    return [
+        {
+            'row': 0,
+            'field': header,
+            'error': f'Unexpected column header: {header}'
+        }
+        for header in headers if header not in schema.by_name
+    ]
+
+
+def validate_chunk(schema, headers, rows, start_row=1, engine=None, max_errors=None):
+    """
+    Validate rows against a compiled product schema in this process.
+
+    `engine` is 'columnar' (pandas, one vectorised pass per check) or 'rows'
+    (cell by cell); it defaults to the EXCEL_VALIDATION_ENGINE setting. Both
+    return the same errors in the same order, at most `max_errors` of them.
+    """
+    engine = engine or settings.EXCEL_VALIDATION_ENGINE
+    if engine == 'columnar':
+        return validate_frame(schema, headers, rows, start_row=start_row, max_errors=max_errors)
+    return schema.validate_rows(headers, rows, start_row=start_row, max_errors=max_errors)
+
+
+def _validate_chunk_in_worker(args):
+    return validate_chunk(*args)
+
+
+def validate_submission(schema, headers, rows, start_row=1, engine=None, workers=None, chunk_size=None,
+                        report=None):
+    """
+    Validate submission rows into a ValidationReport, splitting large
+    submissions into row ranges that are validated in a process pool.
+
+    Submissions smaller than EXCEL_VALIDATION_PARALLEL_THRESHOLD rows, or a
+    worker count of 1, run inline in blocks of EXCEL_VALIDATION_BLOCK_SIZE
+    rows so small uploads don't pay for starting the pool. Either way,
+    scanning stops as soon as the report's error cap is reached. Pass a
+    `report` to append to errors found earlier (e.g. on the header row).
+    """
+    engine = engine or settings.EXCEL_VALIDATION_ENGINE
+    workers = workers or settings.EXCEL_VALIDATION_WORKERS
+    chunk_size = chunk_size or settings.EXCEL_VALIDATION_CHUNK_SIZE
+    report = report if report is not None else ValidationReport()
+    rows = rows if isinstance(rows, list) else list(rows)
+    if report.is_full:
+        report.truncated = report.truncated or bool(rows)
+        return report
+
+    if workers <= 1 or len(rows) < max(settings.EXCEL_VALIDATION_PARALLEL_THRESHOLD, chunk_size + 1):
+        block_size = settings.EXCEL_VALIDATION_BLOCK_SIZE
+        for offset in range(0, len(rows), block_size):
+            errors = validate_chunk(
+                schema, headers, rows[offset:offset + block_size], start_row + offset, engine, report.scan_limit
+            )
+            if report.add(errors) and (report.truncated or offset + block_size < len(rows)):
+                report.truncated = True
+                break
+        return report
+
+    # The schema pickles to its field specs; workers rebuild the checks and
+    # never touch the database. Only a couple of chunks per worker are in
+    # flight, so hitting the cap early doesn't pickle the whole submission.
+    offsets = iter(range(0, len(rows), chunk_size))
+    workers = min(workers, -(-len(rows) // chunk_size))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        def submit_next():
+            offset = next(offsets, None)
+            if offset is not None:
+                task = (schema, headers, rows[offset:offset + chunk_size], start_row + offset, engine,
+                        report.scan_limit)
+                pending.append((offset, pool.submit(_validate_chunk_in_worker, task)))
+
+        for _ in range(workers * 2):
+            submit_next()
+        # Results are consumed in submission order, i.e. in row order
+        while pending:
+            offset, future = pending.popleft()
+            if report.add(future.result()) and (report.truncated or offset + chunk_size < len(rows)):
+                report.truncated = True
+                for _, later in pending:
+                    later.cancel()
+                break
+            submit_next()
+    return report
@@ -14,24 +14,39 @@ from django.db.models import F, Q
 from datetime import date
 import datetime
 import io
+import time
 from django.http import HttpResponse
 from django.views import View
 from rest_framework import status
 from django.db.models import Count
-from .utils import get_sql_field_type, apply_validation_rules
-from django.db import connection
-from decimal import Decimal, InvalidOperation
-import re
+from .utils import parse_bool
+from .indexes import reconcile_indexes
+from .schema_diff import column_type, sync_product_table
+from .tables import get_table_metadata, table_changed, table_exists
+from .stats import adjust_row_count, recount_rows, table_statistics
+from .lineage import SUBMISSION_COLUMN, count_submission_rows, delete_submission_rows, ensure_lineage_columns
+from .fingerprint import file_sha256
+from .ingestion import ExcelRowReader, clean_header, map_columns, project_row
+from .schema import get_product_schema
+from .validation import ValidationReport, header_errors, validate_submission
+from .bulk_load import BulkLoader
+from .staging import MERGE_PARTITIONED_ERROR, StagingTable
+from .services import EmailService, AlertService
+from .jobs import enqueue_submission_job
+from .queries import QueryError, TableQuery
+from .export import EXPORT_FORMATS, dump_response, export_response
+from .aggregates import Aggregation, create_summary_view, drop_summary_view
+from django.db import connection, transaction
 import xlsxwriter
 from django.utils import timezone
+from django.shortcuts import get_object_or_404
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from .models import Product, Catalog, ProductField, ValidationRule, UploadedFile, Alert, ProductTableInfo, SubmissionInfo
-from .serializers import ProductSerializer, CatalogSerializer, CatalogListSerializer, ProductFieldSerializer, ValidationRuleSerializer, UploadedFileSerializer, ProductFieldValidationRuleSerializer
+from .models import Product, Catalog, ProductField, ValidationRule, UploadedFile, Alert, ProductTableInfo, SubmissionInfo, SubmissionJob, ProductSummary
+from .serializers import ProductSerializer, CatalogSerializer, CatalogListSerializer, ProductFieldSerializer, ValidationRuleSerializer, UploadedFileSerializer, ProductFieldValidationRuleSerializer, SubmissionJobSerializer, ProductSummarySerializer
 import logging
-from django.core.mail import send_mail
 from django.conf import settings
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+
+logger = logging.getLogger(__name__)
 
 
 class ProductListCreateView(generics.ListCreateAPIView):
@@ -90,7 +105,8 @@ class CatalogListCreateView(generics.ListCreateAPIView):
             table_info = ProductTableInfo(
                 product=product,
                 table_name=table_name,
-                fields=[field.name for field in fields]  # List of field names
+                fields=[field.name for field in fields],  # List of field names
+                row_count=0
             )
             table_info.save()
 
@@ -103,14 +119,7 @@ class CatalogListCreateView(generics.ListCreateAPIView):
 
         # Check if the table for this product already exists
         table_name = f"product_{product.id}"
-        with connection.cursor() as cursor:
-            cursor.execute(
-                f"SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = %s)",
-                [table_name]
-            )
-            exists = cursor.fetchone()[0]
-
-        if not exists:
+        if not table_exists(table_name):
             # Retrieve fields for the product
             fields = ProductField.objects.filter(product=product)
 
@@ -120,28 +129,8 @@ class CatalogListCreateView(generics.ListCreateAPIView):
                 # Escape column name if it contains spaces or special characters
                 column_name = f'"{field.name}"' if ' ' in field.name or any(c in field.name for c in [';', '"', "'"]) else field.name
 
-                # Determine the SQL data type
-                column_def = f"{column_name} {get_sql_field_type(field)}"
-
-                # Apply length and decimal constraints
-                if field.field_type == 'decimal':
-                    max_decimal_places = None
-                    try:
-                        # Fetch validation rule for max decimal places
-                        validation_rule = ValidationRule.objects.filter(product_field__product=product).first()
-                        if validation_rule:
-                            if validation_rule.has_max_decimal:
-                                max_decimal_places = validation_rule.max_decimal_places
-                    except ValidationRule.DoesNotExist:
-                        pass  # No validation rule for max decimal places
-
-                    if field.length:
-                        column_def += f"({field.length}, {max_decimal_places if max_decimal_places else 0})"
-                    else:
-                        column_def += f"(10, {max_decimal_places if max_decimal_places else 0})"  # Default precision
-
-                elif field.field_type == 'varchar' and field.length:
-                    column_def += f"({field.length})"
+                # Determine the SQL data type, with length or precision and scale
+                column_def = f"{column_name} {column_type(field)}"
 
                 # Apply NOT NULL or NULL constraint
                 column_def += " NOT NULL" if not field.is_null else " NULL"
@@ -160,8 +149,13 @@ class CatalogListCreateView(generics.ListCreateAPIView):
             with connection.cursor() as cursor:
                 cursor.execute(create_table_sql)
 
+            # Submission id / load time of every row
+            ensure_lineage_columns(table_name)
+
             # Apply validation rules as constraints
-            apply_validation_rules(fields, table_name)
+            sync_product_table(table_name, fields)
+            # Secondary indexes derived from field types and flags
+            reconcile_indexes(table_name, fields)
             self.create_product_table_info(product)
 
 
@@ -221,138 +215,34 @@ class CatalogDetailView(generics.RetrieveUpdateDestroyAPIView):
 
         return Response(data)
 
-    def get_existing_constraints(self, table_name):
-        """
-        Get existing constraints for the table.
-        Returns a dictionary of constraint names and their definitions.
-        """
-        with connection.cursor() as cursor:
-            # Get check constraints
-            cursor.execute("""
-                SELECT con.conname, pg_get_constraintdef(con.oid)
-                FROM pg_constraint con
-                INNER JOIN pg_class rel ON rel.oid = con.conrelid
-                WHERE rel.relname = %s
-                AND con.contype IN ('c', 'u')
-            """, [table_name])
-            
-            constraints = {row[0]: row[1] for row in cursor.fetchall()}
-            return constraints
-
-    def drop_constraint(self, cursor, table_name, constraint_name):
-        """Safely drop a constraint if it exists."""
-        cursor.execute(f"""
-            ALTER TABLE {table_name} 
-            DROP CONSTRAINT IF EXISTS "{constraint_name}";
-        """)
-
-    def update_field_constraints(self, field, table_name, existing_constraints):
-        """
-        Update constraints for a single field.
-        """
-        with connection.cursor() as cursor:
-            field_name = f'"{field.name}"' if ' ' in field.name or any(c in field.name for c in [';', '"', "'"]) else field.name
-            
-            # Handle validation rules if they exist
-            if hasattr(field, 'validation_rule') and field.validation_rule:
-                validation = field.validation_rule
-                
-                # Unique constraint
-                unique_constraint_name = f'unique_{field.id}'
-                if validation.is_unique:
-                    if unique_constraint_name not in existing_constraints:
-                        cursor.execute(
-                            f'ALTER TABLE {table_name} ADD CONSTRAINT "{unique_constraint_name}" '
-                            f'UNIQUE ({field_name});'
-                        )
-                else:
-                    self.drop_constraint(cursor, table_name, unique_constraint_name)
-
-                # Min/Max constraints
-                min_constraint_name = f'check_{field.id}_min'
-                max_constraint_name = f'check_{field.id}_max'
-                
-                if validation.has_min_max:
-                    if validation.min_value is not None:
-                        self.drop_constraint(cursor, table_name, min_constraint_name)
-                        cursor.execute(
-                            f'ALTER TABLE {table_name} ADD CONSTRAINT "{min_constraint_name}" '
-                            f'CHECK ({field_name} >= {validation.min_value});'
-                        )
-                    if validation.max_value is not None:
-                        self.drop_constraint(cursor, table_name, max_constraint_name)
-                        cursor.execute(
-                            f'ALTER TABLE {table_name} ADD CONSTRAINT "{max_constraint_name}" '
-                            f'CHECK ({field_name} <= {validation.max_value});'
-                        )
-                else:
-                    self.drop_constraint(cursor, table_name, min_constraint_name)
-                    self.drop_constraint(cursor, table_name, max_constraint_name)
-
-                # Decimal places constraint
-                decimal_constraint_name = f'check_{field.id}_decimals'
-                if validation.has_max_decimal and field.field_type == 'decimal':
-                    self.drop_constraint(cursor, table_name, decimal_constraint_name)
-                    cursor.execute(
-                        f'ALTER TABLE {table_name} ADD CONSTRAINT "{decimal_constraint_name}" '
-                        f'CHECK (ROUND({field_name}, {validation.max_decimal_places}) = {field_name});'
-                    )
-                else:
-                    self.drop_constraint(cursor, table_name, decimal_constraint_name)
-
-                # Custom validation
-                custom_constraint_name = f'check_{field.id}_custom'
-                if validation.custom_validation:
-                    self.drop_constraint(cursor, table_name, custom_constraint_name)
-                    cursor.execute(validation.custom_validation)
-
     def update_product_table(self, instance):
         """
-        Update the product table schema and constraints if necessary.
+        Update the product table schema and constraints if necessary, by
+        diffing the product's fields against the table (see schema_diff).
         """
         product = instance.product
         table_name = f"product_{product.id}"
         
-        with connection.cursor() as cursor:
-            # Check if table exists
-            cursor.execute(
-                "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = %s)",
-                [table_name]
-            )
-            table_exists = cursor.fetchone()[0]
-            
-            if not table_exists:
-                # If table doesn't exist, create it
-                self.perform_create(instance)
-                return
-            
-            # Get current fields and existing constraints
-            current_fields = ProductField.objects.filter(product=product)
-            existing_constraints = self.get_existing_constraints(table_name)
-            
-            # Get existing columns
-            cursor.execute("""
-                SELECT column_name, data_type 
-                FROM information_schema.columns 
-                WHERE table_name = %s
-            """, [table_name])
-            existing_columns = {row[0]: row[1] for row in cursor.fetchall()}
-            
-            # Update schema and constraints for each field
-            for field in current_fields:
-                column_name = field.name
-                sql_type = get_sql_field_type(field)
-                
-                # Add new columns if needed
-                if column_name not in existing_columns:
-                    escaped_column_name = f'"{column_name}"' if ' ' in column_name else column_name
-                    alter_sql = f"ALTER TABLE {table_name} ADD COLUMN {escaped_column_name} {sql_type}"
-                    if not field.is_null:
-                        alter_sql += " NOT NULL"
-                    cursor.execute(alter_sql)
-                
-                # Update constraints for this field
-                self.update_field_constraints(field, table_name, existing_constraints)
+        if not table_exists(table_name):
+            # If table doesn't exist, create it
+            self.perform_create(instance)
+            return
+
+        current_fields = ProductField.objects.filter(product=product).select_related('validation_rule')
+        product_table = ProductTableInfo.objects.filter(table_name=table_name).first()
+        partition_key = product_table.partition_key if product_table else ''
+
+        # Tables created before lineage tracking get the columns here
+        metadata = get_table_metadata(table_name, product_table.schema_version if product_table else None)
+        if SUBMISSION_COLUMN not in metadata.columns:
+            ensure_lineage_columns(table_name)
+            table_changed(table_name)
+
+        # Only the DDL for what changed runs; constraints are validated online
+        sync_product_table(table_name, current_fields, partition_key, product.summaries.all())
+
+        # Add indexes for new or newly filterable fields, drop stale ones
+        reconcile_indexes(table_name, current_fields)
 
     def perform_update(self, serializer):
         instance = serializer.save()
@@ -441,13 +331,25 @@ class FileUploadView(APIView):
                 {"error": "Invalid file type. Please upload an Excel file."},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        # Identical content was already stored and parsed without errors for this catalog
+        content_hash = file_sha256(file)
+        previous = UploadedFile.objects.filter(catalog=catalog, content_hash=content_hash).first()
+        if previous and not parse_bool(request.data.get('force')):
+            return Response({
+                "message": "This file was already uploaded",
+                "duplicate": True,
+                "uploaded_file_id": previous.id,
+                "uploaded_at": previous.uploaded_at
+            }, status=status.HTTP_200_OK)
+
         # Extract the domain from the catalog's product
         domain = getattr(catalog.product, 'domain', None)
 
         # Get the user from the request
         user = request.user if request.user.is_authenticated else None
 
-        # Save the file record in the database
+        # Save the file record in the database; content_hash is only set once the
+        # file was processed without errors, so failed uploads are never deduplicated
         uploaded_file = UploadedFile.objects.create(
             catalog=catalog,
             file=file,
@@ -524,6 +426,8 @@ class FileUploadView(APIView):
         if errors:
             return Response({"message": "File uploaded with some errors", "errors": errors}, status=status.HTTP_207_MULTI_STATUS)
 
+        uploaded_file.content_hash = content_hash
+        uploaded_file.save(update_fields=['content_hash'])
         return Response(
             {"message": "File uploaded and data saved successfully"},
             status=status.HTTP_201_CREATED
@@ -772,6 +676,82 @@ class PendingCatalogsExportView(APIView):
 
 
 
+class ProductTableDumpView(APIView):
+    """
+    API to download a full CSV extract of a product's dynamic table.
+    URL: /export/product/{product_id}/?gzip=true
+
+    Uses COPY (SELECT ...) TO STDOUT, so PostgreSQL formats the CSV and the
+    bytes are piped to the response as they arrive. Accepts the fields and
+    filter parameters of DynamicTableRowsView; rows are in table order.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, product_id):
+        try:
+            product = Product.objects.get(pk=product_id)
+        except Product.DoesNotExist:
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        product_table = ProductTableInfo.objects.filter(product=product).first()
+        if not product_table:
+            return Response({'error': 'No dynamic table found for this product'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            query = TableQuery(product_table.table_name, get_product_schema(product.id), request.query_params)
+        except QueryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = dump_response(query, product_table.table_name, compress=parse_bool(request.query_params.get('gzip')))
+        response['Access-Control-Expose-Headers'] = 'Content-Disposition'
+        return response
+
+
+class ProductTableStatsListView(APIView):
+    """
+    API returning the size and health of every dynamic table, for the
+    catalog list. URL: /tables/stats/?product_ids=1,2
+
+    Row counts are the ones maintained by the loaders; estimates and sizes
+    come from pg_class in a single catalog query. No table is scanned.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        product_tables = ProductTableInfo.objects.order_by('product_id')
+        product_ids = request.query_params.get('product_ids')
+        if product_ids:
+            try:
+                product_tables = product_tables.filter(
+                    product_id__in=[int(item) for item in product_ids.split(',') if item.strip()]
+                )
+            except ValueError:
+                return Response({'error': 'product_ids must be a comma separated list of ids'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        return Response(table_statistics(product_tables), status=status.HTTP_200_OK)
+
+
+class ProductTableStatsView(APIView):
+    """
+    API returning the size and health of a product's dynamic table.
+    URL: /product/{product_id}/stats/?exact=true
+
+    `exact=true` recounts the rows with count(*) and resets the maintained
+    count, e.g. after rows were changed outside the API or partitions
+    expired (their rows are subtracted by estimate).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, product_id):
+        product_table = ProductTableInfo.objects.filter(product_id=product_id).first()
+        if not product_table:
+            return Response({'error': 'No dynamic table found for this product'}, status=status.HTTP_404_NOT_FOUND)
+
+        if parse_bool(request.query_params.get('exact')):
+            recount_rows(product_table)
+        return Response(table_statistics([product_table])[0], status=status.HTTP_200_OK)
+
+
 class CatalogStatusCountView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -903,34 +883,36 @@ class DynamicTableDataListView(APIView):
             }
             field_details[field.name] = field_info
 
-        # Fetch all rows from the dynamic table and update fields in the database
+        # Columns and types come from the table metadata registry, which is
+        # only reloaded after DDL; ProductTableInfo.fields is kept up to date there
         data = {}
-        with connection.cursor() as cursor:
-            cursor.execute(f"SELECT * FROM {product_table.table_name}")
-            columns = [col[0] for col in cursor.description]
-
-            # Update the fields attribute in ProductTableInfo
-            product_table.fields = columns
-            product_table.save(update_fields=['fields'])
-
-            column_types = [col[1] for col in cursor.description]  # Extract column types
-            column_type_mapping = {
-                'INTEGER': 'Integer',
-                'VARCHAR': 'String',
-                'TEXT': 'Text',
-                'BOOLEAN': 'Boolean',
-                'DATE': 'Date',
-                'TIMESTAMP': 'Timestamp',
-                'DECIMAL': 'Decimal',
-            }
-            field_types = [column_type_mapping.get(str(col_type), str(col_type)) for col_type in column_types]
+        metadata = get_table_metadata(product_table.table_name, product_table.schema_version)
+        if metadata is None:
+            return Response({'error': 'Dynamic table does not exist'}, status=status.HTTP_404_NOT_FOUND)
+        # Lineage columns are bookkeeping, not product fields
+        columns = metadata.field_columns
+
+        column_type_mapping = {
+            'integer': 'Integer',
+            'character varying': 'String',
+            'text': 'Text',
+            'boolean': 'Boolean',
+            'date': 'Date',
+            'timestamp without time zone': 'Timestamp',
+            'numeric': 'Decimal',
+            'double precision': 'Float',
+        }
+        field_types = [
+            column_type_mapping.get(metadata.columns[column]['data_type'], metadata.columns[column]['data_type'])
+            for column in columns
+        ]
 
-            # Include comprehensive table information in the response
-            data[product_table.table_name] = {
-                'fields': columns,  # Updated fields
-                'field_types': field_types,  # SQL field types
-                'field_details': field_details,
-            }
+        # Include comprehensive table information in the response
+        data[product_table.table_name] = {
+            'fields': columns,
+            'field_types': field_types,  # SQL field types
+            'field_details': field_details,
+        }
 
         return Response(data, status=status.HTTP_200_OK)
     
@@ -953,99 +935,38 @@ class DynamicTableDataSaveView(APIView):
         if not product_table:
             return Response({'error': 'No dynamic table found for this product'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Get the product fields to map data types
-        product_fields = ProductField.objects.filter(product=product)
+        # Compiled per-column converters
+        schema = get_product_schema(product.id)
         
         # Get the data from the request
         data = request.data
-        print("Received Data:", data)
-
-        # Initialize the list for converted values
-        converted_values = []
-
-        # Prepare the SQL insert statement
-        columns = ', '.join([f'"{field}"' for field in data.keys()])  # Wrap column names in double quotes
-        placeholders = ', '.join(['%s'] * len(data))
 
         # Convert the values based on the field type in ProductField
+        converted_values = []
         for field_name, value in data.items():
-            field = product_fields.filter(name=field_name).first()  # Get the field metadata
-            if field:
-                field_type = field.field_type
-
-                if field_type == 'varchar' or field_type == 'text':
-                    # For varchar or text, keep the value as a string
-                    converted_values.append(str(value))
-
-                elif field_type == 'int':
-                    # For integer fields, convert to integer
-                    try:
-                        converted_values.append(int(value))
-                    except ValueError:
-                        converted_values.append(None)  # Or handle as per your need
-
-                elif field_type == 'float':
-                    # For float fields, convert to float
-                    try:
-                        converted_values.append(float(value))
-                    except ValueError:
-                        converted_values.append(None)  # Or handle as per your need
-
-                elif field_type == 'boolean':
-                    # For boolean fields, convert to True/False
-                    converted_values.append(value.lower() in ['true', '1', 't', 'y', 'yes'])
-
-                elif field_type == 'date':
-                    # For date fields, convert to date (YYYY-MM-DD format)
-                    try:
-                        converted_values.append(value)  # You can use datetime.strptime(value, "%Y-%m-%d") if you need parsing
-                    except ValueError:
-                        converted_values.append(None)  # Or handle as per your need
-
-                elif field_type == 'datetime':
-                    # For datetime fields, you can parse to datetime (if required)
-                    try:
-                        from datetime import datetime
-                        converted_values.append(datetime.strptime(value, "%Y-%m-%d %H:%M:%S"))
-                    except ValueError:
-                        converted_values.append(None)
-
-                elif field_type == 'decimal':
-                    # For decimal fields, convert to Decimal
-                    try:
-                        from decimal import Decimal
-                        converted_values.append(Decimal(value))
-                    except ValueError:
-                        converted_values.append(None)
-
-                else:
-                    converted_values.append(value)  # Default case
-
-            else:
-                # If no field metadata is found for the field name, append the value as is
-                converted_values.append(value)
+            field = schema.by_name.get(field_name)
+            # If no field metadata is found for the field name, append the value as is
+            converted_values.append(field.convert(value) if field else value)
 
         try:
-            with connection.cursor() as cursor:
-                # Construct and execute the dynamic insert SQL
-                insert_query = f"INSERT INTO {product_table.table_name} ({columns}) VALUES ({placeholders})"
-                print("SQL Query:", insert_query)
-                print("Values to Insert:", converted_values)
-                cursor.execute(insert_query, converted_values)
-            
             catalog = Catalog.objects.filter(product=product).first()
             if not catalog:
                 return Response({'error': 'Catalog not found for this product'}, status=status.HTTP_404_NOT_FOUND)
 
-            submission = SubmissionInfo.objects.create(
-                product=product,
-                submitted_by=request.user,
-                submitted_data=data,
-                submission_time=timezone.now(),
-                catalog=catalog,
-                domain=product.domain,
-                submission_type='Manual'
-            )
+            with transaction.atomic():
+                submission = SubmissionInfo.objects.create(
+                    product=product,
+                    submitted_by=request.user,
+                    submitted_data=data,
+                    submission_time=timezone.now(),
+                    catalog=catalog,
+                    domain=product.domain,
+                    submission_type='Manual'
+                )
+                BulkLoader(product_table.table_name, list(data.keys()) + [SUBMISSION_COLUMN]).load(
+                    [converted_values + [submission.id]]
+                )
+                adjust_row_count(product_table.table_name, 1, loaded=True)
 
             return Response({'message': 'Data saved successfully'}, status=status.HTTP_201_CREATED)
         except Exception as e:
@@ -1056,8 +977,11 @@ class DynamicTableDataSaveView(APIView):
 
 class DynamicTableDataDetailView(APIView):
     """
-    API to retrieve a specific row from a dynamic table for a specific product.
+    API to retrieve rows from a specific dynamic table for a specific product.
     URL: /product/{product_id}/product-data/{product_data_id}/
+
+    Returns one page at a time; takes the same parameters as
+    DynamicTableRowsView.
     """
     def get(self, request, product_id, product_data_id):
         try:
@@ -1071,17 +995,203 @@ class DynamicTableDataDetailView(APIView):
         except ProductTableInfo.DoesNotExist:
             return Response({'error': 'Dynamic table not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Fetch all rows from the specific dynamic table
-        with connection.cursor() as cursor:
-            cursor.execute(f"SELECT * FROM {product_table.table_name}")
-            columns = [col[0] for col in cursor.description]
-            rows = cursor.fetchall()
-            data = [dict(zip(columns, row)) for row in rows]
+        return DynamicTableRowsView.page_response(request, product, product_table)
 
-        return Response(data, status=status.HTTP_200_OK)
-    
 
+class DynamicTableRowsView(APIView):
+    """
+    API to page through the rows of a product's dynamic table.
+    URL: /product/{product_id}/rows/
+
+    Query parameters:
+    - fields: comma separated columns to return (default all)
+    - <field> or <field>__<op>: filters, op one of eq, ne, lt, lte, gt,
+      gte, in (comma separated values) or isnull (true/false)
+    - sort: comma separated non-nullable fields, prefix with - for
+      descending; the primary key is always the final tiebreaker
+    - limit: rows per page (DYNAMIC_TABLE_PAGE_SIZE, at most
+      DYNAMIC_TABLE_MAX_PAGE_SIZE)
+    - cursor: next_cursor from the previous page
+
+    Pages use keyset pagination, so fetching page 1000 costs the same as
+    fetching page 1.
+    """
+    def get(self, request, product_id):
+        try:
+            product = Product.objects.get(pk=product_id)
+        except Product.DoesNotExist:
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        product_table = ProductTableInfo.objects.filter(product=product).first()
+        if not product_table:
+            return Response({'error': 'No dynamic table found for this product'}, status=status.HTTP_404_NOT_FOUND)
+
+        return self.page_response(request, product, product_table)
+
+    @staticmethod
+    def page_response(request, product, product_table):
+        limit = request.query_params.get('limit')
+        try:
+            limit = int(limit) if limit else None
+        except ValueError:
+            limit = 0
+        if limit is not None and limit < 1:
+            return Response({'error': 'limit must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            query = TableQuery(product_table.table_name, get_product_schema(product.id), request.query_params)
+            rows, next_cursor = query.page(connection, cursor=request.query_params.get('cursor'), limit=limit)
+        except QueryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'fields': query.columns,
+            'results': rows,
+            'count': len(rows),
+            'has_more': next_cursor is not None,
+            'next_cursor': next_cursor,
+        }, status=status.HTTP_200_OK)
+
+
+class DynamicTableExportView(APIView):
+    """
+    API to download a product's dynamic table as CSV, NDJSON or XLSX.
+    URL: /product/{product_id}/export/?file_format=csv|ndjson|xlsx
+
+    Takes the same fields, filter and sort parameters as
+    DynamicTableRowsView. Rows are read through a server-side cursor and
+    streamed, so the table is never held in memory; without `sort` they
+    come in table order.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, product_id):
+        try:
+            product = Product.objects.get(pk=product_id)
+        except Product.DoesNotExist:
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        product_table = ProductTableInfo.objects.filter(product=product).first()
+        if not product_table:
+            return Response({'error': 'No dynamic table found for this product'}, status=status.HTTP_404_NOT_FOUND)
 
+        export_format = request.query_params.get('file_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'error': f"file_format must be one of: {', '.join(EXPORT_FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            query = TableQuery(product_table.table_name, get_product_schema(product.id), request.query_params)
+        except QueryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return export_response(query, export_format, product_table.table_name,
+                               ordered='sort' in request.query_params)
+
+
+class DynamicTableAggregateView(APIView):
+    """
+    API to compute counts, sums, min/max and group-bys over a product's
+    dynamic table in one SQL statement.
+    URL: /product/{product_id}/aggregate/?group_by=color,sold_on:month&metrics=count,sum:qty
+
+    Filters are the same as DynamicTableRowsView's. When a ProductSummary
+    with the same groups and metrics exists (and filters only use plain
+    group fields) it is read instead of the table; `summary=false` forces
+    a live query.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, product_id):
+        try:
+            product = Product.objects.get(pk=product_id)
+        except Product.DoesNotExist:
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        product_table = ProductTableInfo.objects.filter(product=product).first()
+        if not product_table:
+            return Response({'error': 'No dynamic table found for this product'}, status=status.HTTP_404_NOT_FOUND)
+
+        schema = get_product_schema(product.id)
+        try:
+            aggregation = Aggregation(schema, request.query_params.get('group_by'), request.query_params.get('metrics'))
+            query = TableQuery(product_table.table_name, schema, request.query_params)
+        except QueryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        summary = None
+        if parse_bool(request.query_params.get('summary', 'true')):
+            summary = next((
+                candidate for candidate in product.summaries.filter(refreshed_at__isnull=False)
+                if aggregation.matches_summary(candidate, query.filter_fields)
+            ), None)
+
+        if summary:
+            results, truncated = aggregation.summary_fetch(summary, query.filters, query.filter_params)
+        else:
+            results, truncated = aggregation.fetch(product_table.table_name, query.filters, query.filter_params)
+
+        return Response({
+            'group_by': [item['alias'] for item in aggregation.group_by],
+            'metrics': [item['alias'] for item in aggregation.metrics],
+            'results': results,
+            'truncated': truncated,
+            'source': 'summary' if summary else 'table',
+            'refreshed_at': summary.refreshed_at if summary else None,
+        }, status=status.HTTP_200_OK)
+
+
+class ProductSummaryListCreateView(generics.ListCreateAPIView):
+    """
+    List or define the materialized summaries of a product's dynamic table.
+    URL: /product/{product_id}/summaries/
+    """
+    serializer_class = ProductSummarySerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return ProductSummary.objects.filter(product_id=self.kwargs['product_id'])
+
+    def perform_create(self, serializer):
+        product = get_object_or_404(Product, pk=self.kwargs['product_id'])
+        if not ProductTableInfo.objects.filter(product=product).exists():
+            raise NotFound('No dynamic table found for this product')
+
+        schema = get_product_schema(product.id)
+        data = serializer.validated_data
+        try:
+            aggregation = Aggregation(schema, data.get('group_by'), data.get('metrics'))
+        except QueryError as e:
+            raise ValidationError({'error': str(e)})
+
+        with transaction.atomic():
+            summary = serializer.save(
+                product=product,
+                group_by=[item['spec'] for item in aggregation.group_by],
+                metrics=[item['spec'] for item in aggregation.metrics]
+            )
+            create_summary_view(summary, schema)
+            summary.refreshed_at = timezone.now()
+            summary.save(update_fields=['refreshed_at'])
+
+
+class ProductSummaryDetailView(generics.RetrieveDestroyAPIView):
+    """
+    Retrieve or delete (with its materialized view) a product summary.
+    URL: /product/{product_id}/summaries/{summary_id}/
+    """
+    serializer_class = ProductSummarySerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self):
+        return get_object_or_404(
+            ProductSummary, pk=self.kwargs['summary_id'], product_id=self.kwargs['product_id']
+        )
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            drop_summary_view(instance)
+            instance.delete()
 
 
 class DynamicTableExcelValidationView(APIView):
@@ -1100,173 +1210,49 @@ class DynamicTableExcelValidationView(APIView):
         if not product_table:
             return Response({'error': 'No dynamic table found for this product'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Get product fields
-        product_fields = ProductField.objects.filter(product=product)
+        # Compiled converters/checks for every column, built once per schema change
+        schema = get_product_schema(product.id)
         
         # Get data and headers from request
         excel_data = request.data.get('data', [])
-        print(excel_data)
         headers = request.data.get('headers', [])
-        headers = [re.sub(r'\(.*?\)|\[.*?\]', '', header).strip() for header in headers]
+        headers = [clean_header(header) for header in headers]
 
-        # Validation errors list
-        validation_errors = []
+        # Stop collecting errors after max_errors (request override or setting)
+        max_errors = request.data.get('max_errors')
+        try:
+            max_errors = int(max_errors) if max_errors not in (None, '') else None
+        except (TypeError, ValueError):
+            return Response({'error': 'max_errors must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if max_errors is not None and max_errors < 1:
+            return Response({'error': 'max_errors must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
+        report = ValidationReport(max_errors=max_errors)
 
         # Validate headers match expected fields
-        expected_fields = [field.name for field in product_fields]
-        for i, header in enumerate(headers):
-            if header not in expected_fields:
-                validation_errors.append({
-                    'row': 0,
-                    'field': header,
-                    'error': f'Unexpected column header: {header}'
-                })
+        report.add(header_errors(schema, headers))
 
         # Validate each row
-        for row_index, row_data in enumerate(excel_data, start=1):
-            # Create a dictionary mapping headers to values
-            row_dict = dict(zip(headers, row_data))
-
-            # Validate each field
-            for field in product_fields:
-                value = row_dict.get(field.name, '')
-                
-                # Get validation rules
-                validation_rule = ValidationRule.objects.filter(product_field=field).first()
-                
-                # Specific validations based on field type and rules
-                try:
-                    if field.field_type == 'varchar' or field.field_type == 'text':
-                        # Text length validation
-                        if validation_rule and field.length and len(str(value)) > field.length:
-                            validation_errors.append({
-                                'row': row_index,
-                                'field': field.name,
-                                'error': f'Exceeds maximum length of {field.length}'
-                            })
-                        
-                        # Email format validation
-                        if validation_rule and validation_rule.is_email_format:
-                            if not re.match(r'\S+@\S+\.\S+', str(value)):
-                                validation_errors.append({
-                                    'row': row_index,
-                                    'field': field.name,
-                                    'error': 'Invalid email format'
-                                })
-
-                    elif field.field_type == 'int':
-                        # Integer validation
-                        try:
-                            int_value = int(value)
-                            
-                            # Min-max validation
-                            if validation_rule:
-                                if validation_rule.min_value is not None and int_value < validation_rule.min_value:
-                                    validation_errors.append({
-                                        'row': row_index,
-                                        'field': field.name,
-                                        'error': f'Value must be >= {validation_rule.min_value}'
-                                    })
-                                if validation_rule.max_value is not None and int_value > validation_rule.max_value:
-                                    validation_errors.append({
-                                        'row': row_index,
-                                        'field': field.name,
-                                        'error': f'Value must be <= {validation_rule.max_value}'
-                                    })
-                        except ValueError:
-                            validation_errors.append({
-                                'row': row_index,
-                                'field': field.name,
-                                'error': 'Must be an integer'
-                            })
-
-                    elif field.field_type == 'decimal':
-                        # Decimal validation
-                        try:
-                            decimal_value = Decimal(str(value))
-                            
-                            # Decimal places validation
-                            if validation_rule and validation_rule.max_decimal_places is not None:
-                                decimal_str = str(decimal_value)
-                                if len(decimal_str.split('.')[-1]) > validation_rule.max_decimal_places:
-                                    validation_errors.append({
-                                        'row': row_index,
-                                        'field': field.name,
-                                        'error': f'Maximum {validation_rule.max_decimal_places} decimal places allowed'
-                                    })
-                            
-                            # Min-max validation
-                            if validation_rule:
-                                if validation_rule.min_value is not None and decimal_value < Decimal(str(validation_rule.min_value)):
-                                    validation_errors.append({
-                                        'row': row_index,
-                                        'field': field.name,
-                                        'error': f'Value must be >= {validation_rule.min_value}'
-                                    })
-                                if validation_rule.max_value is not None and decimal_value > Decimal(str(validation_rule.max_value)):
-                                    validation_errors.append({
-                                        'row': row_index,
-                                        'field': field.name,
-                                        'error': f'Value must be <= {validation_rule.max_value}'
-                                    })
-                        except InvalidOperation:
-                            validation_errors.append({
-                                'row': row_index,
-                                'field': field.name,
-                                'error': 'Must be a valid decimal number'
-                            })
-
-                    elif field.field_type == 'date':
-                        date_formats = ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y']
-                        date_valid = False
-                        for date_format in date_formats:
-                            try:
-                                datetime.datetime.strptime(str(value), date_format)
-                                date_valid = True
-                                break 
-                            except ValueError:
-                                continue  # Try the next format
-
-                        if not date_valid:
-                            validation_errors.append({
-                                'row': row_index,
-                                'field': field.name,
-                                'error': f'Invalid data format. Date format must be: {validation_rule.date_format}'
-                            })
-
-
-                    elif field.field_type == 'boolean':
-                        # Boolean validation
-                        if str(value).lower() not in ['true', 'false', '0', '1']:
-                            validation_errors.append({
-                                'row': row_index,
-                                'field': field.name,
-                                'error': 'Must be true/false or 0/1'
-                            })
-
-                except Exception as e:
-                    validation_errors.append({
-                        'row': row_index,
-                        'field': field.name,
-                        'error': str(e)
-                    })
+        validate_submission(schema, headers, excel_data, report=report)
 
         # If errors found, return them
-        if validation_errors:
+        if report:
             # Send email about validation errors
             email_sent = EmailService.send_validation_error_email(
                 user=request.user, 
                 product=product, 
-                validation_errors=validation_errors
+                validation_errors=report.errors,
+                error_summary=report.summary(),
+                truncated=report.truncated
             )
 
             # Create alert for the user
+            error_count = f'{len(report)}+' if report.truncated else len(report)
             alert_created = AlertService.create_alert(
                 user=request.user,
-                message=f'Excel validation failed for {product.schema_name}. {len(validation_errors)} errors detected.'
+                message=f'Excel validation failed for {product.schema_name}. {error_count} errors detected.'
             )
             return Response({
-                'errors': validation_errors, 
+                **report.as_dict(),
                 'email_sent': email_sent,
                 'alert_created': bool(alert_created)
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -1279,7 +1265,24 @@ class DynamicTableExcelSaveView(APIView):
     """
     API to save Excel data to a dynamic table
     URL: /product/{product_id}/save-excel-data/
+
+    Accepts either a JSON body with the parsed sheet in `data`, or a multipart
+    upload with the .xlsx in `file`. Uploaded files are read on the server
+    row by row, so memory use doesn't grow with the size of the sheet.
+
+    Rows are first loaded into an unlogged staging table and checked there
+    against the table's constraints; rejected rows are reported by row
+    number. Nothing is saved when rows are rejected unless `partial` is
+    true, in which case the accepted rows are merged in.
+
+    With `mode=merge`, rows are upserted on the product's primary key
+    fields: new keys are inserted and existing rows are only rewritten
+    when a value changed.
     """
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+    # SubmissionInfo whose rows the saved rows replace (SubmissionRowsView)
+    replace_submission = None
+
     def post(self, request, product_id):
         try:
             # Verify product exists
@@ -1292,13 +1295,16 @@ class DynamicTableExcelSaveView(APIView):
         if not product_table:
             return Response({'error': 'No dynamic table found for this product'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Get product fields
-        product_fields = ProductField.objects.filter(product=product)
-        field_names = [field.name for field in product_fields]
+        # Compiled per-column converters
+        schema = get_product_schema(product.id)
+
+        if 'file' in request.FILES:
+            return self.save_uploaded_file(request, product, product_table, schema)
+
+        field_names = schema.field_names
         
         # Get data from request
         excel_data = request.data.get('data', [])
-        print(excel_data)
         if not excel_data:
             return Response({'error': 'No data provided'}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -1312,143 +1318,181 @@ class DynamicTableExcelSaveView(APIView):
                 row_dict = row_data
             else:
                 continue  # Skip invalid rows
-            converted_row = []
-            for field in product_fields:
-                value = row_dict.get(field.name)
-                
-                # Type conversion logic
-                if field.field_type == 'int':
-                    try:
-                        converted_row.append(int(value))
-                    except (ValueError, TypeError):
-                        converted_row.append(None)
-
-                elif field.field_type == 'float':
-                    try:
-                        converted_row.append(float(value))
-                    except (ValueError, TypeError):
-                        converted_row.append(None)
-
-                elif field.field_type == 'decimal':
-                    try:
-                        from decimal import Decimal
-                        converted_row.append(Decimal(str(value)))
-                    except (ValueError, TypeError):
-                        converted_row.append(None)
-
-                elif field.field_type == 'boolean':
-                    # Handle various boolean representations
-                    if str(value).lower() in ['true', '1', 't', 'y', 'yes']:
-                        converted_row.append(True)
-                    elif str(value).lower() in ['false', '0', 'f', 'n', 'no']:
-                        converted_row.append(False)
-                    else:
-                        converted_row.append(None)
-
-                elif field.field_type == 'date':
-                    try:
-                        # Try multiple date formats
-                        from datetime import datetime
-                        formats = [
-                            "%m/%d/%Y",   # MM/DD/YYYY (your current input format)
-                            "%Y-%m-%d",   # YYYY-MM-DD
-                            "%d/%m/%Y"    # DD/MM/YYYY
-                        ]
-                        
-                        for fmt in formats:
-                            try:
-                                converted_date = datetime.strptime(str(value), fmt).date()
-                                converted_row.append(converted_date)
-                                break
-                            except ValueError:
-                                continue
-                        else:
-                            converted_row.append(None)
-                    except (ValueError, TypeError):
-                        converted_row.append(None)
-
-                elif field.field_type == 'datetime':
-                    try:
-                        from datetime import datetime
-                        # Try multiple common datetime formats
-                        formats = [
-                            "%Y-%m-%d %H:%M:%S",
-                            "%Y-%m-%d %H:%M",
-                            "%Y-%m-%d",
-                            "%d/%m/%Y %H:%M:%S",
-                            "%d/%m/%Y"
-                        ]
-                        
-                        for fmt in formats:
-                            try:
-                                converted_row.append(datetime.strptime(str(value), fmt))
-                                break
-                            except ValueError:
-                                continue
-                        else:
-                            converted_row.append(None)
-                    except (ValueError, TypeError):
-                        converted_row.append(None)
-
-                else:
-                    # For varchar, text, and other types, convert to string
-                    converted_row.append(str(value) if value is not None else None)
-            bulk_insert_data.append(converted_row)
+            bulk_insert_data.append(schema.convert_row([row_dict.get(name) for name in field_names]))
         try:
-            with connection.cursor() as cursor:
-                # Prepare bulk insert SQL
-                columns = ', '.join([f'"{field.name}"' for field in product_fields])
-                placeholders = ', '.join(['%s'] * len(product_fields))
-                
-                # Construct and execute the bulk insert
-                insert_query = f"INSERT INTO {product_table.table_name} ({columns}) VALUES ({placeholders})"
-                print(insert_query)
-                print(bulk_insert_data)
-                
-                # Execute bulk insert
-                cursor.executemany(insert_query, bulk_insert_data)
+            return self.save_rows(request, product, product_table, schema, bulk_insert_data, excel_data)
+        except Exception as e:
+            return self.save_failed(request, product, e)
 
-            # Save submission info
-            catalog=product.catalogs.first()
-            submission = SubmissionInfo.objects.create(
-                product=product,
-                submitted_by=request.user,
-                submitted_data=excel_data,
-                submission_time=timezone.now(),
-                catalog=catalog,
-                domain=product.domain,
-                submission_type='Upload'
-            )
+    def save_uploaded_file(self, request, product, product_table, schema):
+        """
+        Stream an uploaded .xlsx into the dynamic table.
+        Rows are converted lazily in chunks and fed to a single COPY into the
+        staging table, so the sheet is never held in memory.
+        """
+        upload = request.FILES['file']
+        chunk_size = settings.DYNAMIC_TABLE_LOAD_CHUNK_SIZE
 
+        # The same file was already saved for this product
+        content_hash = file_sha256(upload)
+        previous = SubmissionInfo.objects.filter(product=product, content_hash=content_hash).first()
+        if previous and not parse_bool(request.data.get('force')):
             return Response({
-                'message': 'Excel data saved successfully',
-                'rows_inserted': len(bulk_insert_data)
-            }, status=status.HTTP_201_CREATED)
+                'message': 'This file was already saved',
+                'duplicate': True,
+                'submission_id': previous.id,
+                'submission_time': previous.submission_time,
+                'submitted_data': previous.submitted_data
+            }, status=status.HTTP_200_OK)
 
+        try:
+            reader = ExcelRowReader(upload)
         except Exception as e:
-            # Log the full error for server-side debugging
-            error_message = str(e)
-            print(f"Excel upload error: {error_message}")
-            
-            # Send email about save errors
-            email_sent = EmailService.send_save_error_email(
-                user=request.user, 
-                product=product, 
-                save_errors=error_message
-            )
+            return Response({'error': 'Error reading Excel file: ' + str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Create alert for the user
-            alert_created = AlertService.create_alert(
-                user=request.user,
-                message=f'Excel data save failed for {product.schema_name}. Error: {error_message}'
-            )
-            
-            return Response({
-                'error': 'Failed to save Excel data',
-                'details': error_message,
-                'email_sent': email_sent,
-                'alert_created': bool(alert_created)
-            }, status=status.HTTP_400_BAD_REQUEST)
+        def converted_rows():
+            column_positions = map_columns(reader.headers, schema.fields)
+            for chunk in reader.iter_chunks(chunk_size):
+                for row in chunk:
+                    yield schema.convert_row(project_row(row, column_positions))
+
+        try:
+            with reader:
+                # The rows themselves stay in the dynamic table; only keep a summary
+                return self.save_rows(
+                    request, product, product_table, schema, converted_rows(),
+                    lambda rows: {'file_name': upload.name, 'rows': rows},
+                    content_hash=content_hash
+                )
+        except Exception as e:
+            return self.save_failed(request, product, e)
+
+    def save_rows(self, request, product, product_table, schema, rows, submitted_data, content_hash=''):
+        """
+        Stage, check and merge converted rows. `submitted_data` is stored on
+        the SubmissionInfo; pass a callable to build it from the number of
+        rows written.
+        """
+        partial = parse_bool(request.data.get('partial'))
+        mode = request.data.get('mode') or 'insert'
+        if mode not in ('insert', 'merge'):
+            return Response({'error': 'mode must be insert or merge'}, status=status.HTTP_400_BAD_REQUEST)
+        if mode == 'merge' and not schema.primary_key:
+            return Response({'error': 'Merge mode needs primary key fields'}, status=status.HTTP_400_BAD_REQUEST)
+        if mode == 'merge' and product_table.partition_key:
+            return Response({'error': MERGE_PARTITIONED_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+        if mode == 'merge' and self.replace_submission:
+            return Response({'error': 'Replacing a submission only supports insert mode'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        key_columns = schema.primary_key if mode == 'merge' else None
+        replaced = self.replace_submission
+        started = time.monotonic()
+
+        with StagingTable(product_table.table_name, schema.field_names, key_columns,
+                          replace_submission=replaced.id if replaced else None,
+                          unique_keys=schema.unique_keys) as staging:
+            staging.load(rows)
+            if not staging.rows_staged:
+                return Response({'error': 'No data provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+            rejects = staging.check()
+            if rejects and not partial:
+                return self.save_rejected(request, product, staging, rejects)
+
+            # Only the merge touches the live table
+            with transaction.atomic():
+                if replaced:
+                    submission = replaced
+                else:
+                    submission = SubmissionInfo.objects.create(
+                        product=product,
+                        submitted_by=request.user,
+                        submitted_data={},
+                        submission_time=timezone.now(),
+                        catalog=product.catalogs.first(),
+                        domain=product.domain,
+                        submission_type='Upload',
+                        content_hash=content_hash,
+                        mode=mode
+                    )
+                rows_inserted = staging.merge(submission_id=submission.id)
+                submission.submitted_data = (
+                    submitted_data(rows_inserted + staging.rows_updated) if callable(submitted_data)
+                    else submitted_data
+                )
+                if replaced:
+                    submission.submitted_data = {
+                        **(submission.submitted_data if isinstance(submission.submitted_data, dict)
+                           else {'data': submission.submitted_data}),
+                        'replaced_at': timezone.now().isoformat(),
+                        'replaced_by': request.user.username,
+                    }
+                    submission.content_hash = content_hash
+                    # The jobs' files are no longer what this submission holds
+                    SubmissionJob.objects.filter(submission=submission).update(content_hash='')
+                submission.save(update_fields=['submitted_data', 'content_hash'])
+
+        elapsed = time.monotonic() - started
+        response = {
+            'message': 'Excel data saved successfully',
+            'submission_id': submission.id,
+            'mode': mode,
+            'rows_inserted': rows_inserted,
+            'rows_updated': staging.rows_updated,
+            'rows_unchanged': staging.rows_unchanged,
+            'rows_rejected': staging.rows_rejected,
+            'rows_replaced': staging.rows_deleted,
+            'rows_per_second': round(staging.rows_staged / elapsed, 1) if elapsed else float(staging.rows_staged)
+        }
+        if rejects:
+            response['rejected'] = rejects.as_dict()
+        return Response(response, status=status.HTTP_201_CREATED)
+
+    def save_rejected(self, request, product, staging, rejects):
+        email_sent = EmailService.send_validation_error_email(
+            user=request.user,
+            product=product,
+            validation_errors=rejects.errors,
+            error_summary=rejects.summary(),
+            truncated=rejects.truncated
+        )
+        alert_created = AlertService.create_alert(
+            user=request.user,
+            message=f'Excel data save failed for {product.schema_name}. {staging.rows_rejected} rows rejected.'
+        )
+        return Response({
+            'error': 'Some rows were rejected; nothing was saved',
+            'rows_staged': staging.rows_staged,
+            'rows_rejected': staging.rows_rejected,
+            **rejects.as_dict(),
+            'email_sent': email_sent,
+            'alert_created': bool(alert_created)
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    def save_failed(self, request, product, exc):
+        # Log the full error for server-side debugging
+        error_message = str(exc)
+        logger.warning("Excel data save failed for product %s: %s", product.id, error_message)
+        
+        # Send email about save errors
+        email_sent = EmailService.send_save_error_email(
+            user=request.user, 
+            product=product, 
+            save_errors=error_message
+        )
+
+        # Create alert for the user
+        alert_created = AlertService.create_alert(
+            user=request.user,
+            message=f'Excel data save failed for {product.schema_name}. Error: {error_message}'
+        )
+        
+        return Response({
+            'error': 'Failed to save Excel data',
+            'details': error_message,
+            'email_sent': email_sent,
+            'alert_created': bool(alert_created)
+        }, status=status.HTTP_400_BAD_REQUEST)
         
 
 
@@ -1663,6 +1707,166 @@ class SubmissionListView(generics.ListAPIView):
     
 
 
+class SubmissionRowsView(DynamicTableExcelSaveView):
+    """
+    API to roll back or correct the rows one submission wrote.
+    URL: /product/{product_id}/submissions/{submission_id}/rows/
+
+    GET counts the submission's rows, DELETE removes them, and PUT replaces
+    them with new data (same body as save-excel-data, insert mode): the
+    new rows are staged and checked first, then the old rows are deleted
+    and the new ones inserted in one transaction, under the same
+    submission. Rows are found through the indexed _submission_id column.
+
+    Merge-mode submissions can't be deleted or replaced: the rows they
+    updated existed before them and would be lost, not restored.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_submission(self, product_id, submission_id):
+        product_table = ProductTableInfo.objects.filter(product_id=product_id).first()
+        if not product_table:
+            raise NotFound('No dynamic table found for this product')
+        submission = get_object_or_404(SubmissionInfo, pk=submission_id, product_id=product_id)
+        return product_table, submission
+
+    def merge_refused(self, submission):
+        if submission.mode == 'merge':
+            return Response({
+                'error': 'Submissions saved in merge mode cannot be rolled back or replaced: '
+                         'the rows they updated existed before them'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return None
+
+    def get(self, request, product_id, submission_id):
+        product_table, submission = self.get_submission(product_id, submission_id)
+        return Response({
+            'submission_id': submission.id,
+            'row_count': count_submission_rows(product_table.table_name, submission.id)
+        }, status=status.HTTP_200_OK)
+
+    def delete(self, request, product_id, submission_id):
+        product_table, submission = self.get_submission(product_id, submission_id)
+        refused = self.merge_refused(submission)
+        if refused:
+            return refused
+        with transaction.atomic():
+            rows_deleted = delete_submission_rows(product_table.table_name, submission.id)
+            submitted_data = submission.submitted_data if isinstance(submission.submitted_data, dict) else {'data': submission.submitted_data}
+            submission.submitted_data = {
+                **submitted_data,
+                'rolled_back_at': timezone.now().isoformat(),
+                'rolled_back_by': request.user.username,
+                'rows_deleted': rows_deleted,
+            }
+            # Re-uploading the same file must load it again, not report this submission
+            submission.content_hash = ''
+            submission.save(update_fields=['submitted_data', 'content_hash'])
+            SubmissionJob.objects.filter(submission=submission).update(content_hash='')
+        return Response({'submission_id': submission.id, 'rows_deleted': rows_deleted}, status=status.HTTP_200_OK)
+
+    def put(self, request, product_id, submission_id):
+        _, submission = self.get_submission(product_id, submission_id)
+        refused = self.merge_refused(submission)
+        if refused:
+            return refused
+        self.replace_submission = submission
+        return self.post(request, product_id)
+
+
+class SubmissionJobListCreateView(APIView):
+    """
+    API to queue an Excel upload for background validation and loading.
+    URL: /product/{product_id}/submission-jobs/
+
+    POST stores the .xlsx sent in `file` and returns the job id straight
+    away (202); the `process_submission_jobs` worker validates it, loads it
+    and sends the email/alert. GET lists the product's jobs.
+
+    A file identical to one already queued, saved or rejected by validation
+    for this product returns that earlier job or submission (200) instead,
+    unless `force` is set.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = (MultiPartParser, FormParser)
+
+    def get(self, request, product_id):
+        jobs = SubmissionJob.objects.filter(product_id=product_id).select_related('submitted_by')
+        return Response(SubmissionJobSerializer(jobs, many=True).data, status=status.HTTP_200_OK)
+
+    def post(self, request, product_id):
+        try:
+            product = Product.objects.get(pk=product_id)
+        except Product.DoesNotExist:
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        product_table = ProductTableInfo.objects.filter(product=product).first()
+        if not product_table:
+            return Response({'error': 'No dynamic table found for this product'}, status=status.HTTP_404_NOT_FOUND)
+
+        if 'file' not in request.FILES:
+            return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        mode = request.data.get('mode') or SubmissionJob.MODE_INSERT
+        if mode not in dict(SubmissionJob.MODE_CHOICES):
+            return Response({'error': 'mode must be insert or merge'}, status=status.HTTP_400_BAD_REQUEST)
+        if mode == SubmissionJob.MODE_MERGE and product_table.partition_key:
+            return Response({'error': MERGE_PARTITIONED_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+
+        upload = request.FILES['file']
+        content_hash = file_sha256(upload)
+        if not parse_bool(request.data.get('force')):
+            previous = self.previous_result(product, content_hash)
+            if previous is not None:
+                return Response(previous, status=status.HTTP_200_OK)
+
+        job = enqueue_submission_job(product, request.user, upload, mode=mode, content_hash=content_hash)
+        return Response({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/api/submission-jobs/{job.id}/'
+        }, status=status.HTTP_202_ACCEPTED)
+
+    def previous_result(self, product, content_hash):
+        """The earlier job or submission for the same file content, if any."""
+        job = SubmissionJob.objects.filter(product=product, content_hash=content_hash).filter(
+            Q(status__in=[SubmissionJob.STATUS_QUEUED, SubmissionJob.STATUS_RUNNING, SubmissionJob.STATUS_SUCCEEDED])
+            # Failed validation is a result worth reusing; a failed save isn't
+            | Q(status=SubmissionJob.STATUS_FAILED, error_count__gt=0)
+        ).select_related('submitted_by').first()
+        if job is not None:
+            return {
+                'duplicate': True,
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': f'/api/submission-jobs/{job.id}/',
+                'job': SubmissionJobSerializer(job).data
+            }
+
+        submission = SubmissionInfo.objects.filter(product=product, content_hash=content_hash).first()
+        if submission is not None:
+            return {
+                'duplicate': True,
+                'submission_id': submission.id,
+                'submission_time': submission.submission_time,
+                'submitted_data': submission.submitted_data
+            }
+        return None
+
+
+class SubmissionJobDetailView(APIView):
+    """
+    API to poll a submission job: status, phase, rows processed and the
+    (capped) validation errors found so far.
+    URL: /submission-jobs/{job_id}/
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(SubmissionJob.objects.select_related('submitted_by'), pk=job_id)
+        return Response(SubmissionJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
 class DeleteCatalogView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -1683,92 +1887,6 @@ class DeleteCatalogView(APIView):
     
 
 
-class EmailService:
-    @staticmethod
-    def send_validation_error_email(user, product, validation_errors):
-        """
-        Send email to user about validation errors
-        """
-        try:
-            # Prepare email context
-            context = {
-                'username': user.get_full_name() or user.username,
-                'product_name': product.schema_name,
-                'validation_errors': validation_errors
-            }
-
-            # Render HTML email template
-            html_message = render_to_string('emails/validation_errors.html', context)
-            plain_message = strip_tags(html_message)
-            print(user.email)
-            print(html_message)
-            print(plain_message)
-
-            # Send email
-            send_mail(
-                subject=f'Excel Validation Errors for {product.schema_name}',
-                message=plain_message,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            return True
-        except Exception as e:
-            logging.error(f"Email sending failed: {str(e)}")
-            return False
-
-    @staticmethod
-    def send_save_error_email(user, product, save_errors):
-        """
-        Send email to user about data save errors
-        """
-        try:
-            # Prepare email context
-            context = {
-                'username': user.get_full_name() or user.username,
-                'product_name': product.schema_name,
-                'save_errors': save_errors
-            }
-
-            # Render HTML email template
-            html_message = render_to_string('emails/save_errors.html', context)
-            plain_message = strip_tags(html_message)
-            print(user.email)
-            print(html_message)
-            print(plain_message)
-
-            # Send email
-            send_mail(
-                subject=f'Data Save Errors for {product.schema_name}',
-                message=plain_message,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
-            return True
-        except Exception as e:
-            logging.error(f"Email sending failed: {str(e)}")
-            return False
-
-class AlertService:
-    @staticmethod
-    def create_alert(user, message):
-        """
-        Create an alert for the user
-        """
-        try:
-            alert = Alert.objects.create(
-                user=user,
-                message=message
-            )
-            return alert
-        except Exception as e:
-            logging.error(f"Alert creation failed: {str(e)}")
-            return None
-
-
 class ProductFieldValidationRuleDetailView(generics.RetrieveAPIView):
     serializer_class = ProductFieldValidationRuleSerializer
     lookup_field = 'product_id'
@@ -0,0 +1,68 @@
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+
+class LSHIndex:
+    """
+    Approximate nearest-neighbour index over TF-IDF rows: the vectors are
+    reduced with TruncatedSVD and hashed with random hyperplanes
+    (random-projection LSH) into `tables` independent tables. Items sharing
+    a bucket with the query in any table are its candidates; the caller
+    re-scores them exactly.
+    """
+
+    def __init__(self, components=128, tables=16, bucket_size=64, seed=0):
+        self.components = components
+        self.tables = tables
+        self.bucket_size = bucket_size
+        self.seed = seed
+        self.svd = None
+        self.planes = None
+        self.codes = None
+        self.order = None
+        self.sorted_codes = None
+
+    def fit(self, vectors):
+        items, features = vectors.shape
+        components = max(1, min(self.components, features - 1, items - 1))
+        self.svd = TruncatedSVD(n_components=components, random_state=self.seed).fit(vectors)
+        # Enough bits that a bucket holds about bucket_size items
+        bits = int(np.clip(np.log2(max(items / self.bucket_size, 1)), 1, 62))
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal((self.tables, components, bits))
+        self._index(self.hash(vectors))
+        return self
+
+    def add(self, vectors):
+        """Index new items (rows appended after the existing ones) with the fitted projection."""
+        self._index(np.vstack([self.codes, self.hash(vectors)]))
+
+    def _index(self, codes):
+        self.codes = codes
+        self.order = np.argsort(codes, axis=0, kind='stable').T
+        self.sorted_codes = np.take_along_axis(codes, self.order.T, axis=0).T
+
+    def reduce(self, vectors):
+        return normalize(self.svd.transform(vectors))
+
+    def hash(self, vectors):
+        """Bucket code of each row in each table, shape (rows, tables)."""
+        bits = self.planes.shape[2]
+        signs = np.einsum('nd,tdb->ntb', self.reduce(vectors), self.planes) > 0
+        return signs.astype(np.int64) @ (np.int64(1) << np.arange(bits, dtype=np.int64))
+
+    def candidates(self, vectors):
+        """Indices of the items sharing a bucket with each row, one sorted array per row."""
+        codes = self.hash(vectors)
+        bounds = [
+            (np.searchsorted(self.sorted_codes[table], codes[:, table], 'left'),
+             np.searchsorted(self.sorted_codes[table], codes[:, table], 'right'))
+            for table in range(self.tables)
+        ]
+        return [
+            np.unique(np.concatenate([
+                self.order[table, starts[row]:ends[row]] for table, (starts, ends) in enumerate(bounds)
+            ]))
+            for row in range(codes.shape[0])
+        ]
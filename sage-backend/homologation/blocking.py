@@ -0,0 +1,49 @@
+import re
+import unicodedata
+from collections import defaultdict
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize_tokens(text):
+    """Lower-cased, accent-free alphanumeric tokens of `text`, without stop words or single characters."""
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode().lower()
+    return {token for token in TOKEN_RE.findall(text) if len(token) > 1 and token not in ENGLISH_STOP_WORDS}
+
+
+class BlockIndex:
+    """
+    Blocking keys of the official catalog: the normalized tokens of each
+    item's brand and category. A product's block is every item whose brand
+    or category shares a token with the product's text, so only those are
+    scored.
+    """
+
+    def __init__(self):
+        self.blocks = {}
+
+    def fit(self, official_products):
+        self.blocks = {}
+        self.add(official_products)
+        return self
+
+    def add(self, official_products, start=0):
+        """Add official products as catalog rows start, start + 1, ..."""
+        blocks = defaultdict(list)
+        for row, official_product in enumerate(official_products, start):
+            for token in normalize_tokens(f'{official_product.brand} {official_product.category}'):
+                blocks[token].append(row)
+        for token, rows in blocks.items():
+            rows = np.array(rows, dtype=np.intp)
+            self.blocks[token] = np.concatenate([self.blocks[token], rows]) if token in self.blocks else rows
+
+    def candidates(self, texts):
+        """Catalog rows in the block of each text, one sorted array per text (empty if none)."""
+        empty = np.array([], dtype=np.intp)
+        candidates = []
+        for text in texts:
+            rows = [self.blocks[token] for token in normalize_tokens(text) if token in self.blocks]
+            candidates.append(np.unique(np.concatenate(rows)) if rows else empty)
+        return candidates
@@ -2,6 +2,7 @@ from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django_cron import CronJobBase, Schedule
 from .models import Homologation, HomologationConfiguration
+from .ml_model import train_matcher
 from django.conf import settings
 from django.db import models
 
@@ -47,3 +48,20 @@ class SendHomologationReportCronJob(CronJobBase):
                 to_emails,
                 html_message=email_content
             )
+
+
+class TrainProductMatcherCronJob(CronJobBase):
+    """Bring the product matcher up to date: catalog changes, and a refit when its training data changed."""
+    code = 'homologation.train_product_matcher'
+    schedule = Schedule(run_every_mins=60)
+
+    def do(self):
+        try:
+            matcher, outcome = train_matcher()
+        except ValueError as e:
+            return str(e)
+        if outcome == 'trained':
+            return f'Trained model v{matcher.version}'
+        if outcome == 'updated':
+            return f'Updated model v{matcher.version} with catalog changes'
+        return f'Model v{matcher.version} is up to date'
@@ -0,0 +1,57 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from homologation.ml_model import get_matcher
+from homologation.models import Product
+
+class Command(BaseCommand):
+    help = "Compare the matcher's narrowed top-k (blocking, ANN index) with exact scoring: recall@k and timings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=5)
+        parser.add_argument('--sample', type=int, default=1000, help='Products to match (unhomologated first)')
+        parser.add_argument('--build', action='store_true',
+                            help='Build an ANN index for the saved model if it has none (not saved)')
+
+    def handle(self, *args, **options):
+        matcher = get_matcher()
+        if matcher.ann_index is None and options['build']:
+            started = time.perf_counter()
+            matcher.build_ann_index()
+            self.stdout.write(f'Built ANN index in {time.perf_counter() - started:.2f}s')
+
+        products = list(Product.objects.order_by('is_homologated', 'id')[:options['sample']])
+        if not products:
+            raise CommandError('No products to match')
+        k = min(options['k'], int(matcher.active.sum()))
+        texts = matcher.texts(products)
+        vectors = matcher.vectorize(products)
+
+        started = time.perf_counter()
+        exact, _ = matcher.top_matches(texts, vectors, k, blocking=False, ann=False)
+        self.stdout.write(
+            f'{len(products)} products against {matcher.active.sum()} official products\n'
+            f'exact: {time.perf_counter() - started:.3f}s'
+        )
+
+        paths = []
+        if matcher.block_index is not None:
+            paths.append(('blocking', True, False, matcher.block_index.candidates(texts)))
+        if matcher.ann_index is not None:
+            paths.append(('ann', False, True, matcher.ann_index.candidates(vectors)))
+            if matcher.block_index is not None:
+                paths.append(('blocking + ann', True, True, None))
+        if not paths:
+            raise CommandError('The saved model has no blocking or ANN index (use --build for an ANN index)')
+
+        for name, blocking, ann, candidates in paths:
+            started = time.perf_counter()
+            narrowed, _ = matcher.top_matches(texts, vectors, k, blocking=blocking, ann=ann)
+            elapsed = time.perf_counter() - started
+            recall = np.mean([len(set(n) & set(e)) / k for n, e in zip(narrowed, exact)])
+            top1 = np.mean(narrowed[:, 0] == exact[:, 0])
+            line = f'{name}: {elapsed:.3f}s  recall@{k}: {recall:.4f}  top-1 agreement: {top1:.4f}'
+            if candidates is not None:
+                line += (f'  candidates per product: {np.mean([len(c) for c in candidates]):.0f}'
+                         f'  (fewer than k for {sum(len(c) < k for c in candidates)})')
+            self.stdout.write(line)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from homologation.ml_model import train_matcher
+
+class Command(BaseCommand):
+    help = 'Fit the product matcher on approved homologations and save it for the web workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Retrain even if the training data is unchanged')
+
+    def handle(self, *args, **options):
+        try:
+            matcher, outcome = train_matcher(force=options['force'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if outcome == 'unchanged':
+            self.stdout.write(f'Model v{matcher.version} is up to date (fingerprint {matcher.fingerprint[:12]})')
+            return
+        if outcome == 'updated':
+            self.stdout.write(self.style.SUCCESS(
+                f'Updated model v{matcher.version} with catalog changes '
+                f'(vocabulary drift {matcher.vocabulary_drift():.3f})'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Trained model v{matcher.version} on {len(matcher.official_product_ids)} official products '
+            f'(fingerprint {matcher.fingerprint[:12]})'
+        ))
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homologation', '0002_homologationconfiguration_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('origin', models.CharField(max_length=100)),
+                ('uploaded_by', models.CharField(max_length=150)),
+                ('size', models.BigIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-archived_at'],
+                'unique_together': {('content_hash', 'origin')},
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homologation', '0003_archivedfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedfile',
+            name='result',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -1,59 +1,428 @@
+import hashlib
+import logging
+import os
+import threading
+import joblib
+from django.conf import settings
 from django.db.models import Q
+from django.utils import timezone
 import numpy as np
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from .ann import LSHIndex
+from .blocking import BlockIndex
 from .models import Product, OfficialCatalog, Homologation
 
+logger = logging.getLogger(__name__)
+
+# Bumped when the saved artifact's layout changes; older files are retrained
+ARTIFACT_FORMAT = 2
+
+
+def training_homologations():
+    return Homologation.objects.filter(
+        Q(status='approved') | Q(confidence_score__gte=90)
+    ).select_related('product', 'official_product')
+
+
+def training_fingerprint():
+    """
+    SHA-256 over what fitting the vectorizer reads: the training
+    homologations and the ANN index settings. The rest of the official
+    catalog is applied incrementally (ProductMatcher.sync_catalog).
+    """
+    digest = hashlib.sha256()
+    digest.update(repr((settings.PRODUCT_MATCHER_ANN_MIN_CATALOG, settings.PRODUCT_MATCHER_ANN_COMPONENTS,
+                        settings.PRODUCT_MATCHER_ANN_TABLES)).encode())
+    for row in training_homologations().order_by('id').values_list(
+            'id', 'status', 'product_id', 'official_product_id', 'product__updated_at',
+            'official_product__updated_at'):
+        digest.update(repr(row).encode())
+    return digest.hexdigest()
+
+
 class ProductMatcher:
     def __init__(self):
         self.vectorizer = TfidfVectorizer(analyzer='word', ngram_range=(1, 2), stop_words='english')
         self.model_trained = False
         self.official_products_vectors = None
-        self.official_products = None
-    
+        self.official_product_ids = []
+        self.version = 0
+        self.fingerprint = None
+        self.trained_at = None
+        self.ann_index = None
+        self.block_index = None
+        # Catalog rows still matched (edited or deactivated products are masked, not removed),
+        # and the updated_at of each active official product the matrix reflects
+        self.active = None
+        self.catalog_state = {}
+        # Terms in the catalog when the vectorizer was fitted, and out-of-vocabulary terms added since
+        self.fitted_terms = 0
+        self.unknown_terms = 0
+
     def preprocess_text(self, text):
         return str(text or '').lower().strip()
-    
+
     def combine_features(self, product):
         if isinstance(product, OfficialCatalog):
             return f"{product.name} {product.description} {product.category} {product.brand}"
         return f"{product.schema_name} {product.description} {product.domain}"
-    
+
     def train(self):
-        homologations = Homologation.objects.filter(
-            Q(status='approved') | Q(confidence_score__gte=90)
-        ).select_related('product', 'official_product')
-        
+        fingerprint = training_fingerprint()
+        homologations = list(training_homologations())
+
         if not homologations:
             raise ValueError("No training data available")
-        
+
         train_data = [
             self.preprocess_text(self.combine_features(h.product)) for h in homologations
         ] + [
             self.preprocess_text(self.combine_features(h.official_product)) for h in homologations
         ]
-        
+
         self.vectorizer.fit(train_data)
-        self.official_products = list(OfficialCatalog.objects.filter(is_active=True))
-        self.official_products_vectors = self.vectorizer.transform([
-            self.preprocess_text(self.combine_features(prod)) for prod in self.official_products
-        ])
+        official_products = list(OfficialCatalog.objects.filter(is_active=True))
+        self.official_product_ids = [prod.id for prod in official_products]
+        self.official_products_vectors = self.vectorize(official_products)
+        self.active = np.ones(len(official_products), dtype=bool)
+        self.catalog_state = {prod.id: prod.updated_at for prod in official_products}
+        self.fitted_terms, _ = self.count_terms(self.texts(official_products))
+        self.unknown_terms = 0
+        self.block_index = BlockIndex().fit(official_products)
+        ann_min_catalog = settings.PRODUCT_MATCHER_ANN_MIN_CATALOG
+        self.ann_index = None
+        if ann_min_catalog and len(official_products) >= ann_min_catalog:
+            self.build_ann_index()
         self.model_trained = True
-    
+        self.version += 1
+        self.fingerprint = fingerprint
+        self.trained_at = timezone.now()
+
+    def save(self, path=None):
+        """Write the fitted model with joblib; the file is replaced atomically."""
+        path = path or settings.PRODUCT_MATCHER_PATH
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        joblib.dump({
+            'format': ARTIFACT_FORMAT,
+            'version': self.version,
+            'fingerprint': self.fingerprint,
+            'trained_at': self.trained_at,
+            'vectorizer': self.vectorizer,
+            'official_product_ids': self.official_product_ids,
+            'official_products_vectors': self.official_products_vectors,
+            'ann_index': self.ann_index,
+            'block_index': self.block_index,
+            'active': self.active,
+            'catalog_state': self.catalog_state,
+            'fitted_terms': self.fitted_terms,
+            'unknown_terms': self.unknown_terms,
+        }, temporary)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path=None):
+        """Return the saved model, or None if there is none (or it's from an older format)."""
+        path = path or settings.PRODUCT_MATCHER_PATH
+        if not os.path.exists(path):
+            return None
+        artifact = joblib.load(path)
+        if artifact.get('format') != ARTIFACT_FORMAT:
+            return None
+        matcher = cls()
+        matcher.vectorizer = artifact['vectorizer']
+        matcher.official_product_ids = artifact['official_product_ids']
+        matcher.official_products_vectors = artifact['official_products_vectors']
+        matcher.version = artifact['version']
+        matcher.fingerprint = artifact['fingerprint']
+        matcher.trained_at = artifact['trained_at']
+        matcher.ann_index = artifact['ann_index']
+        matcher.block_index = artifact['block_index']
+        matcher.active = artifact['active']
+        matcher.catalog_state = artifact['catalog_state']
+        matcher.fitted_terms = artifact['fitted_terms']
+        matcher.unknown_terms = artifact['unknown_terms']
+        matcher.model_trained = True
+        return matcher
+
+    def count_terms(self, texts):
+        """(terms, out-of-vocabulary terms) the vectorizer's analyzer finds in `texts`."""
+        analyzer = self.vectorizer.build_analyzer()
+        vocabulary = self.vectorizer.vocabulary_
+        terms = unknown = 0
+        for text in texts:
+            for term in analyzer(text):
+                terms += 1
+                unknown += term not in vocabulary
+        return terms, unknown
+
+    def vocabulary_drift(self):
+        """Out-of-vocabulary terms added since the fit, relative to the catalog's terms at the fit."""
+        return self.unknown_terms / max(self.fitted_terms, 1)
+
+    def sync_catalog(self):
+        """
+        Bring the catalog matrix in line with the active official products
+        without refitting. New and edited products are transformed with the
+        fitted vocabulary and appended (an edited product's old row is
+        masked), deactivated and deleted ones are masked; the blocking and
+        ANN indexes follow. Returns (added or updated, removed) counts.
+        """
+        current = dict(OfficialCatalog.objects.filter(is_active=True).values_list('id', 'updated_at'))
+        changed = [pk for pk, updated_at in current.items() if self.catalog_state.get(pk) != updated_at]
+        removed = [pk for pk in self.catalog_state if pk not in current]
+        if not changed and not removed:
+            return 0, 0
+
+        rows = {pk: row for row, pk in enumerate(self.official_product_ids) if self.active[row]}
+        for pk in changed + removed:
+            if pk in rows:
+                self.active[rows[pk]] = False
+
+        official_products = list(OfficialCatalog.objects.filter(id__in=changed).order_by('id'))
+        if official_products:
+            start = len(self.official_product_ids)
+            texts = self.texts(official_products)
+            vectors = self.vectorizer.transform(texts)
+            self.unknown_terms += self.count_terms(texts)[1]
+            self.official_products_vectors = sparse.vstack([self.official_products_vectors, vectors], format='csr')
+            self.official_product_ids = self.official_product_ids + [prod.id for prod in official_products]
+            self.active = np.concatenate([self.active, np.ones(len(official_products), dtype=bool)])
+            self.block_index.add(official_products, start)
+            if self.ann_index is not None:
+                self.ann_index.add(vectors)
+        for pk in removed:
+            del self.catalog_state[pk]
+        for prod in official_products:
+            self.catalog_state[prod.id] = prod.updated_at
+        return len(official_products), len(removed)
+
     def find_matches(self, product, top_n=5):
+        return self.find_matches_batch([product], top_n)[0]
+
+    def vectorize(self, products):
+        # Rows are L2-normalized by the vectorizer, so dot products are cosine similarities
+        return self.vectorizer.transform(self.texts(products))
+
+    def texts(self, products):
+        return [self.preprocess_text(self.combine_features(product)) for product in products]
+
+    def build_ann_index(self):
+        self.ann_index = LSHIndex(
+            components=settings.PRODUCT_MATCHER_ANN_COMPONENTS, tables=settings.PRODUCT_MATCHER_ANN_TABLES
+        ).fit(self.official_products_vectors)
+
+    def exact_top(self, product_vectors, top_n, block_size=None):
+        """
+        (indices, scores) of the `top_n` catalog rows for each product row,
+        from one sparse matrix product per block of `block_size` products; a
+        block's dense score matrix is block_size x catalog size, which is
+        what bounds memory.
+        """
+        block_size = block_size or settings.PRODUCT_MATCHER_BLOCK_SIZE
+        catalog = self.official_products_vectors.T.tocsr()
+        masked = np.flatnonzero(~self.active)
+        top_indices, top_scores = [], []
+        for start in range(0, product_vectors.shape[0], block_size):
+            similarities = (product_vectors[start:start + block_size] @ catalog).toarray()
+            similarities[:, masked] = -np.inf
+            indices, scores = top_k(similarities, top_n)
+            top_indices.append(indices)
+            top_scores.append(scores)
+        return np.vstack(top_indices), np.vstack(top_scores)
+
+    def candidate_top(self, product_vectors, candidates, top_n):
+        """
+        (indices, scores, short rows): the `top_n` best of each product
+        row's candidate catalog rows, scored exactly. Rows with fewer than
+        `top_n` candidates are left for the caller, in `short`.
+        """
+        catalog = self.official_products_vectors.tocsr()
+        product_vectors = product_vectors.tocsr()
+        top_indices = np.zeros((product_vectors.shape[0], top_n), dtype=np.intp)
+        top_scores = np.zeros((product_vectors.shape[0], top_n))
+        dense = np.zeros(catalog.shape[1])
+        short = []
+        for row, row_candidates in enumerate(candidates):
+            row_candidates = row_candidates[self.active[row_candidates]]
+            if len(row_candidates) < top_n:
+                short.append(row)
+                continue
+            # Sparse matrix x dense vector is far cheaper per row than sparse x sparse
+            features = product_vectors.indices[product_vectors.indptr[row]:product_vectors.indptr[row + 1]]
+            dense[features] = product_vectors.data[product_vectors.indptr[row]:product_vectors.indptr[row + 1]]
+            similarities = catalog[row_candidates] @ dense
+            dense[features] = 0
+            indices, scores = top_k(similarities[np.newaxis], top_n)
+            top_indices[row], top_scores[row] = row_candidates[indices[0]], scores[0]
+        return top_indices, top_scores, short
+
+    def approximate_top(self, product_vectors, top_n, block_size=None):
+        """
+        Like exact_top, but only the ANN index's candidates are scored
+        (exactly). Products with fewer than `top_n` candidates are scored
+        against the whole catalog.
+        """
+        top_indices, top_scores, short = self.candidate_top(
+            product_vectors, self.ann_index.candidates(product_vectors), top_n
+        )
+        if short:
+            top_indices[short], top_scores[short] = self.exact_top(product_vectors[short], top_n, block_size)
+        return top_indices, top_scores
+
+    def top_matches(self, texts, product_vectors, top_n, block_size=None, blocking=True, ann=True):
+        """
+        (indices, scores) of the `top_n` catalog rows for each product. With
+        `blocking`, a product is scored against its block (the official
+        products sharing a brand or category token with it); products whose
+        block is empty or too small are scored against the ANN index's
+        candidates when there is one and `ann` is set, otherwise against
+        the whole catalog.
+        """
+        if blocking and self.block_index is not None:
+            top_indices, top_scores, rest = self.candidate_top(
+                product_vectors, self.block_index.candidates(texts), top_n
+            )
+        else:
+            top_indices = np.zeros((len(texts), top_n), dtype=np.intp)
+            top_scores = np.zeros((len(texts), top_n))
+            rest = list(range(len(texts)))
+        if rest:
+            if ann and self.ann_index is not None:
+                top_indices[rest], top_scores[rest] = self.approximate_top(product_vectors[rest], top_n, block_size)
+            else:
+                top_indices[rest], top_scores[rest] = self.exact_top(product_vectors[rest], top_n, block_size)
+        return top_indices, top_scores
+
+    def find_matches_batch(self, products, top_n=5, block_size=None, exact=False):
+        """
+        Top `top_n` official products for each product, as one list of
+        matches per product, in order. All products are vectorized at once
+        and narrowed by blocking (PRODUCT_MATCHER_BLOCKING) and the ANN
+        index, unless `exact`.
+        """
         if not self.model_trained:
             self.train()
-        
-        product_vector = self.vectorizer.transform([
-            self.preprocess_text(self.combine_features(product))
-        ])
-        similarities = cosine_similarity(product_vector, self.official_products_vectors)[0]
-        top_indices = np.argsort(similarities)[-top_n:][::-1]
-        
+        products = list(products)
+        top_n = min(top_n, int(self.active.sum()))
+        if not products or not top_n:
+            return [[] for _ in products]
+
+        texts = self.texts(products)
+        top_indices, top_scores = self.top_matches(
+            texts, self.vectorizer.transform(texts), top_n, block_size,
+            blocking=settings.PRODUCT_MATCHER_BLOCKING and not exact, ann=not exact
+        )
+
+        by_id = OfficialCatalog.objects.in_bulk({
+            self.official_product_ids[idx] for idx in np.unique(top_indices)
+        })
         return [
-            {
-                'official_product': self.official_products[idx],
-                'confidence_score': round(float(similarities[idx] * 100), 2)
-            }
-            for idx in top_indices
-        ]
\ No newline at end of file
+            [
+                {
+                    'official_product': by_id[self.official_product_ids[idx]],
+                    'confidence_score': round(float(score * 100), 2)
+                }
+                for idx, score in zip(indices, scores)
+                if self.official_product_ids[idx] in by_id
+            ]
+            for indices, scores in zip(top_indices, top_scores)
+        ]
+
+
+def top_k(similarities, k):
+    """(indices, scores) of the k highest scores of each row, best first."""
+    if k < similarities.shape[1]:
+        candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(similarities.shape[1]), similarities.shape)
+    scores = np.take_along_axis(similarities, candidates, axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def train_matcher(force=False, path=None):
+    """
+    Bring the saved model up to date: refit it when its training data
+    changed or the catalog's vocabulary drifted past
+    PRODUCT_MATCHER_MAX_VOCABULARY_DRIFT, otherwise apply catalog changes
+    incrementally. Returns (matcher, outcome), the outcome being 'trained',
+    'updated' or 'unchanged'.
+    """
+    current = ProductMatcher.load(path)
+    if current and not force and current.fingerprint == training_fingerprint():
+        added, removed = current.sync_catalog()
+        if current.vocabulary_drift() <= settings.PRODUCT_MATCHER_MAX_VOCABULARY_DRIFT:
+            if not added and not removed:
+                return current, 'unchanged'
+            current.save(path)
+            invalidate_matcher()
+            return current, 'updated'
+
+    matcher = ProductMatcher()
+    matcher.version = current.version if current else 0
+    matcher.train()
+    matcher.save(path)
+    invalidate_matcher()
+    logger.info("Trained product matcher v%s on %s official products", matcher.version,
+                len(matcher.official_product_ids))
+    return matcher, 'trained'
+
+
+def update_matcher(path=None):
+    """
+    Apply official catalog changes to the saved model without refitting, so
+    new and edited products can be matched right away. A refit the drift
+    calls for is left to train_product_matcher / the retraining cron job.
+    Failures are logged, not raised: this runs after catalog uploads.
+    """
+    try:
+        matcher = ProductMatcher.load(path)
+        if matcher is None:
+            return None
+        added, removed = matcher.sync_catalog()
+        if added or removed:
+            matcher.save(path)
+            invalidate_matcher()
+            logger.info("Updated product matcher v%s: %s official products added or updated, %s removed "
+                        "(vocabulary drift %.3f)", matcher.version, added, removed, matcher.vocabulary_drift())
+        return matcher
+    except Exception:
+        logger.exception("Could not update the product matcher")
+        return None
+
+
+_matcher = None
+_matcher_mtime = None
+_matcher_lock = threading.Lock()
+
+
+def get_matcher():
+    """
+    The saved model, loaded once per process and reloaded only when the file
+    changes (a stat call per use). Without a saved model one is trained and
+    saved first; after that only train_product_matcher or the retraining
+    cron job fit the vectorizer.
+    """
+    global _matcher, _matcher_mtime
+    path = settings.PRODUCT_MATCHER_PATH
+    with _matcher_lock:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if _matcher is not None and mtime == _matcher_mtime:
+            return _matcher
+
+        matcher = ProductMatcher.load(path) if mtime is not None else None
+        if matcher is None:
+            matcher, _ = train_matcher(force=True, path=path)
+            mtime = os.stat(path).st_mtime_ns
+        _matcher, _matcher_mtime = matcher, mtime
+        return matcher
+
+
+def invalidate_matcher():
+    global _matcher, _matcher_mtime
+    _matcher, _matcher_mtime = None, None
@@ -89,6 +89,27 @@ class Homologation(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+class ArchivedFile(models.Model):
+    """
+    Fingerprint of a file pushed to the SQL Server archive (ArchivosDeExcel)
+    by save_file_to_sql_server, so identical re-uploads aren't pushed again.
+    `result` is the response of the upload that processed it successfully,
+    returned again when the same file is re-sent.
+    """
+    content_hash = models.CharField(max_length=64)  # SHA-256 of the file
+    origin = models.CharField(max_length=100)
+    uploaded_by = models.CharField(max_length=150)
+    size = models.BigIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    result = models.JSONField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.origin} file {self.content_hash[:12]} by {self.uploaded_by}"
+
+    class Meta:
+        ordering = ['-archived_at']
+        unique_together = ('content_hash', 'origin')
+
 class HomologationConfiguration(models.Model):
     name = models.CharField(max_length=255)
     corporate = models.CharField(max_length=255)
@@ -1,3 +1,294 @@
-from django.test import TestCase
+import os
+import tempfile
+import joblib
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from catalog.models import Product
+from .ann import LSHIndex
+from .blocking import BlockIndex, normalize_tokens
+from .ml_model import (ARTIFACT_FORMAT, ProductMatcher, get_matcher, invalidate_matcher, top_k, train_matcher,
+                       update_matcher)
+from .models import OfficialCatalog, Homologation
 
-# Create your tests here.
+BRANDS = ['acme', 'globex', 'initech', 'umbrella', 'hooli']
+CATEGORIES = ['beverage', 'snack', 'dairy', 'cleaning']
+NOUNS = ['cola', 'chips', 'milk', 'soap', 'bread', 'juice']
+
+
+class MatcherTestCase(TestCase):
+    """An official catalog of brand/noun products, a quarter of them homologated."""
+
+    def setUp(self):
+        self.official = [
+            OfficialCatalog.objects.create(
+                sku=f'SKU{index:03d}',
+                name=f'{brand} {noun} {index}',
+                description=f'{noun} by {brand}',
+                category=CATEGORIES[index % len(CATEGORIES)],
+                brand=brand,
+            )
+            for index, (brand, noun) in enumerate((b, n) for b in BRANDS for n in NOUNS)
+        ]
+        self.products = [
+            Product.objects.create(schema_name=f'{official.brand} {official.name.split()[1]}',
+                                   description=official.description, domain=official.category)
+            for official in self.official[::4]
+        ]
+        for product, official in zip(self.products, self.official[::4]):
+            Homologation.objects.create(product=product, official_product=official, status='approved')
+
+
+class PersistedMatcherTests(MatcherTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'matcher.joblib')
+        invalidate_matcher()
+        self.addCleanup(invalidate_matcher)
+
+    def matched_ids(self, matcher):
+        return [[match['official_product'].id for match in matcher.find_matches(product, top_n=3)]
+                for product in self.products]
+
+    def test_saved_matcher_loads_with_the_same_matches(self):
+        matcher = ProductMatcher()
+        matcher.train()
+        matcher.save(self.path)
+        loaded = ProductMatcher.load(self.path)
+        self.assertEqual(loaded.official_product_ids, matcher.official_product_ids)
+        self.assertEqual((loaded.version, loaded.fingerprint), (matcher.version, matcher.fingerprint))
+        self.assertEqual(self.matched_ids(loaded), self.matched_ids(matcher))
+
+    def test_missing_or_other_format_artifact_is_not_loaded(self):
+        self.assertIsNone(ProductMatcher.load(self.path))
+        joblib.dump({'format': ARTIFACT_FORMAT - 1, 'version': 3}, self.path)
+        self.assertIsNone(ProductMatcher.load(self.path))
+
+    def test_retrains_only_when_training_data_changed(self):
+        matcher, outcome = train_matcher(path=self.path)
+        self.assertEqual(outcome, 'trained')
+        unchanged, outcome = train_matcher(path=self.path)
+        self.assertEqual(outcome, 'unchanged')
+        self.assertEqual(unchanged.version, matcher.version)
+
+        # Catalog changes are synced into the saved model
+        self.official[1].is_active = False
+        self.official[1].save()
+        updated, outcome = train_matcher(path=self.path)
+        self.assertEqual(outcome, 'updated')
+        self.assertEqual(updated.version, matcher.version)
+        self.assertEqual(ProductMatcher.load(self.path).sync_catalog(), (0, 0))
+
+        Homologation.objects.filter(product=self.products[0]).update(status='rejected')
+        retrained, outcome = train_matcher(path=self.path)
+        self.assertEqual(outcome, 'trained')
+        self.assertEqual(retrained.version, matcher.version + 1)
+        self.assertNotIn(self.official[1].id, retrained.official_product_ids)
+
+    def test_vocabulary_drift_forces_a_refit(self):
+        train_matcher(path=self.path)
+        OfficialCatalog.objects.create(sku='SKU-NEW', name='zephyr quartz lantern', description='quartz lantern',
+                                       category='lighting', brand='zephyr')
+        with override_settings(PRODUCT_MATCHER_MAX_VOCABULARY_DRIFT=1.0):
+            self.assertEqual(train_matcher(path=self.path)[1], 'updated')
+        OfficialCatalog.objects.create(sku='SKU-NEW2', name='zephyr onyx lantern', description='onyx lantern',
+                                       category='lighting', brand='zephyr')
+        with override_settings(PRODUCT_MATCHER_MAX_VOCABULARY_DRIFT=0):
+            matcher, outcome = train_matcher(path=self.path)
+        self.assertEqual(outcome, 'trained')
+        self.assertEqual(matcher.vocabulary_drift(), 0)
+
+    def test_update_matcher_syncs_the_saved_model(self):
+        self.assertIsNone(update_matcher(self.path))
+        train_matcher(path=self.path)
+        added = OfficialCatalog.objects.create(sku='SKU-NEW', name='acme sparkling cola',
+                                               description='cola by acme', category='beverage', brand='acme')
+        update_matcher(self.path)
+        self.assertIn(added.id, ProductMatcher.load(self.path).official_product_ids)
+
+    def test_worker_keeps_the_loaded_matcher_until_the_file_changes(self):
+        with override_settings(PRODUCT_MATCHER_PATH=self.path):
+            # Nothing saved yet: the first use trains and saves
+            matcher = get_matcher()
+            self.assertTrue(os.path.exists(self.path))
+            self.assertIs(get_matcher(), matcher)
+
+            # Saved by another process; force a distinct mtime on coarse clocks
+            retrained = ProductMatcher.load(self.path)
+            retrained.version += 1
+            retrained.save(self.path)
+            os.utime(self.path, ns=(0, 0))
+            self.assertEqual(get_matcher().version, matcher.version + 1)
+
+
+class BatchMatchingTests(MatcherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.matcher = ProductMatcher()
+        self.matcher.train()
+
+    def cosine(self, products):
+        vectors = self.matcher.vectorizer.transform([
+            self.matcher.preprocess_text(self.matcher.combine_features(product)) for product in products
+        ])
+        return cosine_similarity(vectors, self.matcher.official_products_vectors)
+
+    def test_batch_matches_cosine_similarity(self):
+        matches = self.matcher.find_matches_batch(self.products, top_n=3)
+        similarities = self.cosine(self.products)
+        rows = {pk: row for row, pk in enumerate(self.matcher.official_product_ids)}
+        for product_matches, product_similarities in zip(matches, similarities):
+            self.assertEqual(len(product_matches), 3)
+            expected = np.round(np.sort(product_similarities)[::-1][:3] * 100, 2)
+            self.assertEqual([match['confidence_score'] for match in product_matches], list(expected))
+            for match in product_matches:
+                score = product_similarities[rows[match['official_product'].id]]
+                self.assertEqual(match['confidence_score'], round(float(score * 100), 2))
+
+    def test_blocks_and_single_products_agree_with_one_batch(self):
+        batch = self.matcher.find_matches_batch(self.products, top_n=4)
+        blocked = self.matcher.find_matches_batch(self.products, top_n=4, block_size=2)
+        self.assertEqual(blocked, batch)
+        for product, matches in zip(self.products, batch):
+            self.assertEqual(self.matcher.find_matches(product, top_n=4), matches)
+
+    def test_sync_catalog_masks_deactivated_and_edited_products(self):
+        deactivated, edited = self.official[0], self.official[1]
+        deactivated.is_active = False
+        deactivated.save()
+        edited.name = 'hooli sparkling water'
+        edited.save()
+        added = OfficialCatalog.objects.create(
+            sku='SKU-NEW', name='acme sparkling cola', description='cola by acme', category='beverage', brand='acme'
+        )
+
+        self.assertEqual(self.matcher.sync_catalog(), (2, 1))
+        self.assertEqual(self.matcher.sync_catalog(), (0, 0))
+        ids = np.array(self.matcher.official_product_ids)
+        active_ids = list(ids[self.matcher.active])
+        self.assertNotIn(deactivated.id, active_ids)
+        self.assertEqual(active_ids.count(edited.id), 1)
+        self.assertIn(added.id, active_ids)
+        # The edited product's old row is still in the matrix, masked
+        self.assertEqual(list(ids).count(edited.id), 2)
+
+        matches = self.matcher.find_matches_batch(self.products, top_n=len(self.official), exact=True)
+        for product_matches in matches:
+            matched = [match['official_product'].id for match in product_matches]
+            self.assertNotIn(deactivated.id, matched)
+            self.assertEqual(len(matched), len(set(matched)))
+
+    def test_top_n_beyond_the_catalog(self):
+        matches = self.matcher.find_matches_batch(self.products[:1], top_n=100)
+        self.assertEqual(len(matches[0]), len(self.official))
+        self.assertEqual(self.matcher.find_matches_batch([], top_n=3), [])
+
+
+class TopKTests(SimpleTestCase):
+    def test_matches_a_full_sort(self):
+        similarities = np.random.default_rng(0).random((6, 40))
+        indices, scores = top_k(similarities, 5)
+        expected = np.argsort(-similarities, axis=1)[:, :5]
+        np.testing.assert_array_equal(indices, expected)
+        np.testing.assert_array_equal(scores, np.take_along_axis(similarities, expected, axis=1))
+
+    def test_k_covering_every_column(self):
+        similarities = np.array([[0.1, 0.9, 0.5]])
+        indices, scores = top_k(similarities, 3)
+        np.testing.assert_array_equal(indices, [[1, 2, 0]])
+        np.testing.assert_array_equal(scores, [[0.9, 0.5, 0.1]])
+
+    def test_masked_columns_come_last(self):
+        similarities = np.array([[0.8, 0.3, 0.6, 0.1]])
+        similarities[:, [0, 2]] = -np.inf
+        indices, _ = top_k(similarities, 2)
+        np.testing.assert_array_equal(indices, [[1, 3]])
+
+
+class LSHIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        words = [f'word{index}' for index in range(400)]
+        documents = [' '.join(rng.choice(words, 6, replace=False)) for _ in range(1000)]
+        # Queries are catalog items with one word swapped for a random one
+        queries = []
+        for document in documents[:100]:
+            tokens = document.split()
+            tokens[0] = rng.choice(words)
+            queries.append(' '.join(tokens))
+        vectorizer = TfidfVectorizer().fit(documents)
+        self.catalog = vectorizer.transform(documents)
+        self.queries = vectorizer.transform(queries)
+
+    def test_candidates_recall_the_exact_best_match(self):
+        index = LSHIndex(components=32, tables=8).fit(self.catalog)
+        candidates = index.candidates(self.queries)
+        best = np.argmax(cosine_similarity(self.queries, self.catalog), axis=1)
+        recall = np.mean([match in rows for match, rows in zip(best, candidates)])
+        self.assertGreaterEqual(recall, 0.9)
+        self.assertLess(np.mean([len(rows) for rows in candidates]), self.catalog.shape[0] * 0.75)
+        for rows in candidates:
+            np.testing.assert_array_equal(rows, np.unique(rows))
+
+    def test_items_are_their_own_candidates(self):
+        index = LSHIndex(components=32, tables=8).fit(self.catalog)
+        for item, rows in enumerate(index.candidates(self.catalog[:50])):
+            self.assertIn(item, rows)
+
+
+@override_settings(PRODUCT_MATCHER_ANN_MIN_CATALOG=10)
+class ApproximateMatchingTests(MatcherTestCase):
+    def setUp(self):
+        super().setUp()
+        self.matcher = ProductMatcher()
+        self.matcher.train()
+
+    def test_candidates_are_scored_exactly(self):
+        self.assertIsNotNone(self.matcher.ann_index)
+        approximate = self.matcher.find_matches_batch(self.products, top_n=3)
+        exact = self.matcher.find_matches_batch(self.products, top_n=3, exact=True)
+        for approximate_matches, exact_matches in zip(approximate, exact):
+            self.assertEqual(approximate_matches[0], exact_matches[0])
+            self.assertEqual(len(approximate_matches), 3)
+
+    @override_settings(PRODUCT_MATCHER_ANN_MIN_CATALOG=1000)
+    def test_small_catalogs_are_matched_exactly(self):
+        matcher = ProductMatcher()
+        matcher.train()
+        self.assertIsNone(matcher.ann_index)
+
+
+@override_settings(PRODUCT_MATCHER_BLOCKING=True)
+class BlockIndexTests(MatcherTestCase):
+    def test_normalize_tokens(self):
+        self.assertEqual(normalize_tokens('The Café-Crème, 2 x 500ml'), {'cafe', 'creme', '500ml'})
+        self.assertEqual(normalize_tokens(None), set())
+
+    def test_candidates_share_a_brand_or_category_token(self):
+        index = BlockIndex().fit(self.official)
+        acme_or_dairy, unknown = index.candidates(['ACME milk for the dairy aisle', 'no such brand'])
+        expected = [row for row, official in enumerate(self.official)
+                    if official.brand == 'acme' or official.category == 'dairy']
+        np.testing.assert_array_equal(acme_or_dairy, expected)
+        self.assertEqual(len(unknown), 0)
+
+    def test_blocked_matches_come_from_the_block(self):
+        matcher = ProductMatcher()
+        matcher.train()
+        product = Product(schema_name='globex cola', description='cola by globex', domain='beverage')
+        blocked = matcher.find_matches_batch([product], top_n=3)[0]
+        exact = matcher.find_matches_batch([product], top_n=3, exact=True)[0]
+        self.assertEqual(blocked[0], exact[0])
+        for match in blocked:
+            official = match['official_product']
+            self.assertTrue(official.brand == 'globex' or official.category == 'beverage')
+
+    def test_products_without_a_block_are_scored_against_the_catalog(self):
+        matcher = ProductMatcher()
+        matcher.train()
+        product = Product(schema_name='cola', description='', domain='')
+        self.assertEqual(matcher.find_matches_batch([product], top_n=3),
+                         matcher.find_matches_batch([product], top_n=3, exact=True))
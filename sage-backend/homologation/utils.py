@@ -1,14 +1,33 @@
 import pyodbc 
 import datetime
-from homologation.models import HomologationConfiguration
+from catalog.fingerprint import file_sha256
+from homologation.models import ArchivedFile, HomologationConfiguration
 
-def save_file_to_sql_server(file, origin, uploaded_by):
+def processed_upload(content_hash, origin):
+    """The ArchivedFile of an earlier upload of this content that was processed successfully, if any."""
+    return ArchivedFile.objects.filter(content_hash=content_hash, origin=origin, result__isnull=False).first()
+
+
+def record_upload_result(content_hash, origin, result):
+    """Remember the response of a successfully processed upload for processed_upload()."""
+    ArchivedFile.objects.filter(content_hash=content_hash, origin=origin).update(result=result)
+
+
+def save_file_to_sql_server(file, origin, uploaded_by, force=False, content_hash=None):
     """
     Save uploaded file information with size validation.
+    Files whose content (SHA-256) was already pushed for this origin are
+    skipped unless `force` is set. Returns True when the file was pushed.
+    The file is left rewound for the caller to parse.
     """
     try:
+        content_hash = content_hash or file_sha256(file)
+        if not force and ArchivedFile.objects.filter(content_hash=content_hash, origin=origin).exists():
+            return False
+
         # Read file content first to validate size
         file_content = file.read()
+        file.seek(0)
         file_size_gb = len(file_content) / (1024 * 1024 * 1024)  # Convert to GB
         
         if file_size_gb > 1.8:  # Setting limit below 2GB to allow overhead
@@ -43,6 +62,13 @@ def save_file_to_sql_server(file, origin, uploaded_by):
         conn.commit()
         cursor.close()
         conn.close()
+
+        ArchivedFile.objects.update_or_create(
+            content_hash=content_hash,
+            origin=origin,
+            defaults={'uploaded_by': uploaded_by, 'size': len(file_content)}
+        )
+        return True
         
     except Exception as e:
         raise Exception(f"Failed to save file to database: {str(e)}")
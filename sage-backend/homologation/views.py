@@ -19,8 +19,10 @@ from django.core.mail import EmailMessage
 from django.conf import settings
 from .models import Product, OfficialCatalog, Homologation, HomologationConfiguration
 from catalog.models import Catalog
-from .ml_model import ProductMatcher
-from .utils import save_file_to_sql_server
+from catalog.fingerprint import file_sha256
+from catalog.utils import parse_bool
+from .ml_model import get_matcher, update_matcher
+from .utils import processed_upload, record_upload_result, save_file_to_sql_server
 from .serializers import ProductMatchSerializer, HomologationSerializer, HomologationConfigurationSerializer, HomologationConfigurationBooleanFieldsSerializer
 
 class ProductListView(APIView):
@@ -96,20 +98,23 @@ class CreateHomologationView(APIView):
 class ProductMatchView(APIView):
     def get(self, request):
         try:
-            products = Product.objects.filter(is_homologated=False)
-            matcher = ProductMatcher()
+            products = list(Product.objects.filter(is_homologated=False))
+            # Trained by train_product_matcher / the retraining cron job, not per request
+            matcher = get_matcher()
             results = []
 
-            for product in products:
-                matches = matcher.find_matches(product)
-                
+            all_matches = matcher.find_matches_batch(products, top_n=1)
+            # Existing homologation per (product, official product); the newest wins, as
+            # Homologation.Meta.ordering (-created_at) made .first() return it
+            existing = {}
+            for homologation in Homologation.objects.filter(product__is_homologated=False).order_by('created_at', 'id'):
+                existing[(homologation.product_id, homologation.official_product_id)] = homologation
+
+            for product, matches in zip(products, all_matches):
                 if matches:
                     best_match = matches[0]
 
-                    existing_homologation = Homologation.objects.filter(
-                        product=product,
-                        official_product=best_match['official_product']
-                    ).first()
+                    existing_homologation = existing.get((product.id, best_match['official_product'].id))
 
                     homologation_id = None
 
@@ -253,8 +258,18 @@ class UploadCatalogData(APIView):
         if not file:
             return JsonResponse({"error": "No file provided"}, status=400)
 
+        force = parse_bool(request.data.get('force'))
+        content_hash = file_sha256(file)
+        # The same file was already processed: return that result instead of parsing it again
+        previous = processed_upload(content_hash, "official catalog")
+        if previous and not force:
+            return JsonResponse({**previous.result, "duplicate": True, "archived_at": previous.archived_at}, status=200)
+
         try:
-            save_file_to_sql_server(file, origin="official catalog", uploaded_by=request.user.username)
+            save_file_to_sql_server(
+                file, origin="official catalog", uploaded_by=request.user.username,
+                force=force, content_hash=content_hash
+            )
 
             df = pd.read_excel(file)
 
@@ -282,6 +297,9 @@ class UploadCatalogData(APIView):
                     self.send_email("Catalog Data Upload Failed", f"The file upload process failed with the following error:\n\n{error_message}")
                     return JsonResponse({"error": error_message}, status=400)
 
+            # Make the new SKUs matchable now; refits are left to the retraining cron job
+            update_matcher()
+
             # Fetch approved email addresses
             homologation_config = HomologationConfiguration.objects.first()
             if homologation_config and homologation_config.approved_emails:
@@ -297,7 +315,9 @@ class UploadCatalogData(APIView):
                     file
                 )
 
-            return JsonResponse({"message": "File uploaded, data saved, and email sent successfully"}, status=200)
+            result = {"message": "File uploaded, data saved, and email sent successfully"}
+            record_upload_result(content_hash, "official catalog", result)
+            return JsonResponse(result, status=200)
 
         except Exception as e:
             # If any error occurs during the process, send the failure email
@@ -355,8 +375,18 @@ class HomologationUploadView(APIView):
             error_message = "No file provided"
             return JsonResponse({"error": error_message}, status=400)
 
+        force = parse_bool(request.data.get('force'))
+        content_hash = file_sha256(file)
+        # The same file was already processed: return that result instead of parsing it again
+        previous = processed_upload(content_hash, "homologation")
+        if previous and not force:
+            return JsonResponse({**previous.result, "duplicate": True, "archived_at": previous.archived_at}, status=200)
+
         try:
-            save_file_to_sql_server(file, origin="homologation", uploaded_by=request.user.username)
+            save_file_to_sql_server(
+                file, origin="homologation", uploaded_by=request.user.username,
+                force=force, content_hash=content_hash
+            )
 
             df = pd.read_excel(file)
 
@@ -427,7 +457,9 @@ class HomologationUploadView(APIView):
                 file
             )
 
-            return JsonResponse({"message": "Homologations uploaded and email sent successfully"}, status=200)
+            result = {"message": "Homologations uploaded and email sent successfully"}
+            record_upload_result(content_hash, "homologation", result)
+            return JsonResponse(result, status=200)
 
         except Exception as e:
             error_message = str(e)